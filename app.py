@@ -1,18 +1,22 @@
 from fastapi import FastAPI, Request, Depends, UploadFile, File
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
-from fastapi.templating import Jinja2Templates
 from pathlib import Path
+from typing import Optional
 from core.db import engine, get_db
-from modeling import models
-from routers import users, blogs, finans
-from sqlalchemy.orm import Session
+from core import finans_db, metrics, tracing
+from routers import users, blogs, finans, health
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from modeling.models import Users
 from utils import blogs as post_utils
 from utils.dependencies import get_current_user_from_cookie
 from utils import users as user_utils
-
-models.Base.metadata.create_all(bind=engine)
+from utils.token_cache import token_cache
+from utils.passwords import password_hasher
+from utils import jobs as jobs_utils
+from setredis import async_client
+from starlette.concurrency import run_in_threadpool
 
 app = FastAPI()
 
@@ -22,11 +26,25 @@ app.mount(
     name="static",
 )
 
-templates = Jinja2Templates(directory="templates")
+templates = metrics.TimedTemplates(directory="templates")
+
+app.add_middleware(tracing.QueryBudgetMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+tracing.instrument_engine(engine)
+metrics.register_stats("token_cache", token_cache)
+metrics.register_stats("password_hasher", password_hasher)
 
 app.include_router(users.router, tags=['Users'])
 app.include_router(blogs.router, tags=['Blogs'])
 app.include_router(finans.router, tags=['Finans'])
+app.include_router(health.router, tags=['Health'])
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """ Метрики приложения в формате Prometheus """
+    return metrics.metrics_response()
 
 
 @app.get("/api/my_blog")
@@ -54,7 +72,7 @@ async def create_new_user(request: Request):
 
 
 @app.get("/users/", response_class=HTMLResponse)
-async def user_top_try(request: Request, db: Session = Depends(get_db)):
+async def user_top_try(request: Request, db: AsyncSession = Depends(get_db)):
     """ Страница пользователя для просмотра блогов и работы со своими блогами """
     try:
         token = request.cookies.get("bearer")
@@ -76,7 +94,7 @@ async def user_top_try(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/user-info/", response_class=HTMLResponse)
-async def user_info(request: Request, db: Session = Depends(get_db)):
+async def user_info(request: Request, db: AsyncSession = Depends(get_db)):
     """ Страница просмотра информации о текущем пользователе """
     try:
         token = request.cookies.get("bearer")
@@ -86,7 +104,8 @@ async def user_info(request: Request, db: Session = Depends(get_db)):
         try:
             user = await user_utils.get_user_by_token_(token, db)
             user_id = user.id
-            db_user = db.query(Users).filter(Users.id == user_id).first()
+            result = await db.execute(select(Users).filter(Users.id == user_id))
+            db_user = result.scalars().first()
         except Exception:
             user_id = None
             db_user = None
@@ -104,7 +123,7 @@ async def user_info(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/users-info/", response_class=HTMLResponse)
-async def user_info_all(request: Request, db: Session = Depends(get_db)):
+async def user_info_all(request: Request, db: AsyncSession = Depends(get_db)):
     """ Страница просмотра информации о всех пользователях """
     try:
         token = request.cookies.get("bearer")
@@ -114,7 +133,8 @@ async def user_info_all(request: Request, db: Session = Depends(get_db)):
         try:
             user = await user_utils.get_user_by_token_(token, db)
             user_id = user.id
-            db_users = db.query(Users).all()
+            result = await db.execute(select(Users))
+            db_users = result.scalars().all()
         except Exception:
             user_id = None
             db_users = None
@@ -132,8 +152,8 @@ async def user_info_all(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/blogs/", response_class=HTMLResponse)
-async def blog_info(request: Request, db: Session = Depends(get_db)):
-    """ Страница просмотра всех блогов с возможностью поставить лайки """
+async def blog_info(request: Request, cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """ Страница просмотра всех блогов с возможностью поставить лайки, по страницам """
     try:
         token = request.cookies.get("bearer")
     except Exception:
@@ -143,17 +163,19 @@ async def blog_info(request: Request, db: Session = Depends(get_db)):
             user = await user_utils.get_user_by_token_(token, db)
             user_id = user.id
             total_count = await post_utils.get_posts_count(db)
-            posts, likes = await post_utils.get_posts(db)
+            posts, likes, next_cursor = await post_utils.get_posts(db, cursor=cursor)
         except Exception:
             user_id = None
             total_count = None
             posts = None
             likes = None
+            next_cursor = None
     else:
         user_id = None
         total_count = None
         posts = None
         likes = None
+        next_cursor = None
 
     context = {
         "user_id": user_id,
@@ -161,6 +183,41 @@ async def blog_info(request: Request, db: Session = Depends(get_db)):
         "total_count": total_count,
         "posts": posts,
         "likes_all": likes,
+        "next_cursor": next_cursor,
+    }
+
+    return templates.TemplateResponse(
+        "blogs_info.html",
+        context
+    )
+
+
+@app.get("/blogs/search/", response_class=HTMLResponse)
+async def blog_search(request: Request, q: str = "", cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """ Страница поиска по блогам, по страницам """
+    try:
+        token = request.cookies.get("bearer")
+    except Exception:
+        token = None
+    user_id = None
+    posts = None
+    next_cursor = None
+    if token:
+        try:
+            user = await user_utils.get_user_by_token_(token, db)
+            user_id = user.id
+            posts, next_cursor = await post_utils.search_posts(db, q, cursor=cursor) if q.strip() else ([], None)
+        except Exception:
+            user_id = None
+            posts = None
+            next_cursor = None
+
+    context = {
+        "user_id": user_id,
+        "request": request,
+        "posts": posts,
+        "query": q,
+        "next_cursor": next_cursor,
     }
 
     return templates.TemplateResponse(
@@ -170,7 +227,7 @@ async def blog_info(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/myblog/", response_class=HTMLResponse)
-async def myblog_info(request: Request, db: Session = Depends(get_db)):
+async def myblog_info(request: Request, db: AsyncSession = Depends(get_db)):
     """ Страница просмотра своих блогов и выбора редактирования или удаления """
     try:
         token = request.cookies.get("bearer")
@@ -180,8 +237,7 @@ async def myblog_info(request: Request, db: Session = Depends(get_db)):
         try:
             user = await user_utils.get_user_by_token_(token, db)
             user_id = user.id
-            total_count = await post_utils.get_posts_count_my(user_id, db)
-            posts, likes = await post_utils.get_posts_my_front(user_id, db)
+            posts, total_count, likes = await post_utils.get_posts_my_page(user_id, db)
         except Exception:
             user_id = None
             total_count = None
@@ -206,7 +262,7 @@ async def myblog_info(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/myblog/new/", response_class=HTMLResponse)
-async def create_blog(request: Request, db: Session = Depends(get_db)):
+async def create_blog(request: Request, db: AsyncSession = Depends(get_db)):
     """ Страница создания блога """
     try:
         token = request.cookies.get("bearer")
@@ -216,8 +272,7 @@ async def create_blog(request: Request, db: Session = Depends(get_db)):
         try:
             user = await user_utils.get_user_by_token_(token, db)
             user_id = user.id
-            total_count = await post_utils.get_posts_count_my(user_id, db)
-            posts, likes = await post_utils.get_posts_my_front(user_id, db)
+            posts, total_count, likes = await post_utils.get_posts_my_page(user_id, db)
         except Exception:
             user_id = None
             total_count = None
@@ -242,7 +297,7 @@ async def create_blog(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/myblog/edit/{post_id}/", response_class=HTMLResponse)
-async def edit_blog(post_id: str, request: Request, db: Session = Depends(get_db)):
+async def edit_blog(post_id: str, request: Request, db: AsyncSession = Depends(get_db)):
     """ Страница редактирования блога """
     try:
         token = request.cookies.get("bearer")
@@ -252,10 +307,8 @@ async def edit_blog(post_id: str, request: Request, db: Session = Depends(get_db
         try:
             user = await user_utils.get_user_by_token_(token, db)
             user_id = user.id
-            total_count = await post_utils.get_posts_count_my(user_id, db)
-            posts, likes = await post_utils.get_posts_my(user_id, db)
-            post_text = await post_utils.get_post(post_id, db)
-            post_text = post_text.posts
+            posts, total_count, likes = await post_utils.get_posts_my_page(user_id, db)
+            post_text = next((post.posts for post in posts if str(post.id) == post_id), None)
         except Exception:
             user_id = None
             total_count = None
@@ -284,17 +337,29 @@ async def edit_blog(post_id: str, request: Request, db: Session = Depends(get_db
 
 
 @app.get("/auth/logout", response_class=HTMLResponse)
-def login_get():
-    """ Удаление токена из cookie при выходе - пока не используется """
+async def login_get(request: Request):
+    """
+    Удаление токена из cookie и из кэша токенов при выходе - пока не используется.
+    Кэш токенов не потокобезопасен, поэтому обработчик асинхронный и не уходит в пул потоков
+    """
+    token = request.cookies.get("bearer")
+    if token:
+        token_cache.invalidate(token)
     response = RedirectResponse(url="/")
     response.delete_cookie("bearer")
     return response
 
 
 @app.on_event("shutdown")
-async def shutdown(response: Response):
-    """ Удаление токена из cookie при завершении - пока не используется """
-    try:
-        response.delete_cookie("bearer")
-    except:
-        pass
+async def shutdown():
+    """
+    Остановка процесса: uvicorn уже дождался текущих запросов, закрываются пулы фоновых задач и хеширования,
+    соединения с БД финансов, redis и основной БД
+    """
+    health.state["ready"] = False
+    jobs_utils.shutdown()
+    password_hasher.shutdown()
+    await run_in_threadpool(finans_db.close_pool)
+    await async_client.close()
+    await engine.dispose()
+    metrics.shutdown()
@@ -0,0 +1,77 @@
+"""
+Замер времени свода utils.finans.rollup на синтетическом дереве.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_finans_rollup --codes 1000 10000 100000 --years 30
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.finans import rollup
+
+
+def make_version(codes: int, years: int, depth: int = 3, seed: int = 0) -> pd.DataFrame:
+    """
+    Синтетическая версия в формате utils.finans.read_version: дерево заданной глубины,
+    в котором около codes узлов, и значения по каждому узлу за years лет
+    :param codes: число узлов дерева
+    :param years: число лет
+    :param depth: глубина дерева
+    :param seed:
+    :return:
+    """
+    fanout = max(2, int(round(codes ** (1 / depth))))
+    ids, parents = [], []
+    level = [None]
+    while len(ids) < codes:
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                node = f"{parent}.{i}" if parent else str(i)
+                ids.append(node)
+                parents.append(parent)
+                next_level.append(node)
+                if len(ids) >= codes:
+                    break
+            if len(ids) >= codes:
+                break
+        level = next_level
+    rng = np.random.default_rng(seed)
+    year_list = np.arange(2000, 2000 + years)
+    return pd.DataFrame({
+        'year': np.tile(year_list, len(ids)),
+        'finans': rng.random(len(ids) * years),
+        'id': np.repeat(ids, years),
+        'name': np.repeat(ids, years),
+        'project': 'project',
+        'lavel': 'lavel_1',
+        'parent': np.repeat(np.array(parents, dtype=object), years),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'codes':>10} {'years':>6} {'rows':>10} {'best, s':>10} {'rows/s':>12}")
+    for codes in args.codes:
+        df = make_version(codes, args.years, args.depth)
+        best = min(_timed(rollup, df) for _ in range(args.repeat))
+        print(f"{codes:>10} {args.years:>6} {len(df):>10} {best:>10.3f} {len(df) / best:>12.0f}")
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
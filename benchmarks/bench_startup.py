@@ -0,0 +1,69 @@
+"""
+Замер холодного старта приложения: каждый прогон - новый процесс python, в котором
+импортируется app и выполняются события startup (как при запуске воркера uvicorn).
+Дополнительно проверяется, что тяжелые модули (pandas, numpy, pyarrow) не загружаются при старте.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_startup --repeat 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "openpyxl")
+
+# код, выполняемый в отдельном процессе: время импорта, время startup и загруженные тяжелые модули
+PROBE = f"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+asyncio.run(app.app.router.startup())
+ready = time.perf_counter()
+print(json.dumps({{
+    "import_s": imported - started,
+    "startup_s": ready - imported,
+    "total_s": ready - started,
+    "modules": len(sys.modules),
+    "heavy": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def probe() -> dict:
+    """
+    Один холодный старт в отдельном процессе
+    :return:
+    """
+    output = subprocess.run([sys.executable, "-c", PROBE], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='вывести результат в JSON')
+    args = parser.parse_args()
+
+    runs = [probe() for _ in range(args.repeat)]
+    result = {key: {"best": round(min(run[key] for run in runs), 3),
+                    "median": round(statistics.median(run[key] for run in runs), 3)}
+              for key in ("import_s", "startup_s", "total_s")}
+    result["modules"] = runs[-1]["modules"]
+    result["heavy"] = runs[-1]["heavy"]
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{'':>10} {'best, s':>10} {'median, s':>10}")
+        for key in ("import_s", "startup_s", "total_s"):
+            print(f"{key:>10} {result[key]['best']:>10.3f} {result[key]['median']:>10.3f}")
+        print(f"модулей загружено: {result['modules']}, тяжелые модули: {', '.join(result['heavy']) or 'нет'}")
+    if result["heavy"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""
+Нагрузочный тест API: заполнение локальной БД пользователями, постами, лайками и данными финансов,
+затем прогон сценариев с заданной параллельностью против запущенного приложения.
+Результат - пропускная способность и перцентили времени ответа по каждому сценарию в JSON,
+с --baseline рядом выводится отношение к прошлому прогону.
+
+Запуск из корня проекта (приложение уже запущено, например uvicorn app:app):
+    python -m benchmarks.loadtest --users 100 --posts 10000 --likes 20000 --finans-codes 10000
+    python -m benchmarks.loadtest --skip-seed --concurrency 32 --output after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import httpx
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from core import finans_db
+from core.db import SQLALCHEMY_DATABASE_URL
+from modeling.models import Likes, Users, UsersPosts
+from utils import finans as finans_utils
+from utils.passwords import pbkdf2
+
+SCENARIOS = ("posts", "like", "login", "upload", "file")
+# пароль всех тестовых пользователей и префикс их имен, по нему данные удаляются перед заполнением
+PASSWORD = "loadtest"
+USER_PREFIX = "loadtest_"
+# имя файла финансов: версия (имя без точек) должна помещаться в varchar(10)
+FINANS_FILE = "bench.csv"
+
+
+def seed_blog(users: int, posts: int, likes: int, seed: int) -> None:
+    """
+    Тестовые пользователи, посты и лайки в БД блога. Прошлые тестовые данные удаляются
+    :param users:
+    :param posts:
+    :param likes: число лайков, не больше users * posts
+    :param seed:
+    :return:
+    """
+    rng = random.Random(seed)
+    salt = "loadtestsalt"
+    password = f"{salt}${pbkdf2(PASSWORD, salt)}"
+    user_rows = [{"id": uuid4(), "username": f"{USER_PREFIX}{i}", "name": f"Load test {i}",
+                  "email": f"{USER_PREFIX}{i}@example.com", "password": password, "is_active": True}
+                 for i in range(users)]
+    start = datetime.utcnow() - timedelta(days=365)
+    post_rows = [{"id": uuid4(), "user_id": rng.choice(user_rows)["id"], "posts": f"load test post {i}",
+                  "dt_created": start + timedelta(seconds=i), "dt_updated": start + timedelta(seconds=i)}
+                 for i in range(posts)]
+    pairs = set()
+    likes = min(likes, users * posts)
+    while len(pairs) < likes:
+        pairs.add((rng.randrange(posts), rng.randrange(users)))
+    like_rows = [{"id": uuid4(), "post_id": post_rows[post]["id"], "user_id": user_rows[user]["id"],
+                  "likes_on": rng.random() < 0.8} for post, user in pairs]
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.begin() as conn:
+        old_users = "SELECT id FROM users WHERE username LIKE :prefix"
+        params = {"prefix": USER_PREFIX + "%"}
+        conn.execute(text(f"DELETE FROM likes WHERE user_id IN ({old_users}) OR post_id IN "
+                          f"(SELECT id FROM users_posts WHERE user_id IN ({old_users}))"), params)
+        conn.execute(text(f"DELETE FROM users_posts WHERE user_id IN ({old_users})"), params)
+        conn.execute(text(f"DELETE FROM tokens WHERE \"user\" IN ({old_users})"), params)
+        conn.execute(text("DELETE FROM users WHERE username LIKE :prefix"), params)
+        conn.execute(Users.__table__.insert(), user_rows)
+        if post_rows:
+            conn.execute(UsersPosts.__table__.insert(), post_rows)
+        if like_rows:
+            conn.execute(Likes.__table__.insert(), like_rows)
+        # счетчики лайков в постах ведет приложение, для вставленных напрямую лайков считаем их здесь
+        conn.execute(text(f"""
+            UPDATE users_posts p
+            SET like_count = c.like_count, dislike_count = c.dislike_count
+            FROM (SELECT post_id, count(*) FILTER (WHERE likes_on) AS like_count,
+                         count(*) FILTER (WHERE NOT likes_on) AS dislike_count
+                  FROM likes GROUP BY post_id) c
+            WHERE p.id = c.post_id AND p.user_id IN ({old_users})
+        """), params)
+        conn.execute(text("ANALYZE users; ANALYZE users_posts; ANALYZE likes"))
+    engine.dispose()
+
+
+def make_finans_file(codes: int, years: int, seed: int) -> str:
+    """
+    Файл финансов в формате /upload: дерево кодов глубиной 3 и значения по годам
+    :param codes: число строк (кодов)
+    :param years:
+    :param seed:
+    :return: путь к файлу
+    """
+    fanout = max(2, int(round(codes ** (1 / 3))))
+    cods = []
+    level = [""]
+    while len(cods) < codes:
+        level = [f"{parent}.{i}" if parent else str(i) for parent in level for i in range(1, fanout + 1)]
+        cods.extend(level[:codes - len(cods)])
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"cod": cods, "project": [f"Project_{cod}" for cod in cods]})
+    for year in range(2022, 2022 + years):
+        df[str(year)] = rng.random(len(cods))
+    path = os.path.join(tempfile.gettempdir(), FINANS_FILE)
+    df.to_csv(path, sep=";", index=False)
+    return path
+
+
+def seed_finans(path: str) -> dict:
+    """
+    Загрузка файла финансов напрямую в БД финансов, как это делает /upload. Режим delta,
+    чтобы версия от прошлого прогона с другим числом строк была приведена к новому файлу
+    :param path:
+    :return: результат utils.finans.load_version
+    """
+    with finans_db.connection() as connection:
+        finans_utils.create_tables(connection)
+        return finans_utils.load_version(connection, finans_utils.read_chunks(path), FINANS_FILE,
+                                         delta=True)
+
+
+async def login_all(client: httpx.AsyncClient, users: int) -> list:
+    """
+    Токены всех тестовых пользователей через /api/login/
+    :param client:
+    :param users:
+    :return:
+    """
+    tokens = []
+    for i in range(users):
+        response = await client.post("/api/login/", data={"username": f"{USER_PREFIX}{i}@example.com",
+                                                          "password": PASSWORD})
+        response.raise_for_status()
+        # в ответе токен в виде UUID с дефисами, в БД он хранится без них
+        tokens.append(response.json()["access_token"].replace("-", ""))
+    return tokens
+
+
+def post_ids(limit: int) -> list:
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT p.id FROM users_posts p JOIN users u ON u.id = p.user_id "
+                                 "WHERE u.username LIKE :prefix LIMIT :limit"),
+                            {"prefix": USER_PREFIX + "%", "limit": limit}).scalars().all()
+    engine.dispose()
+    return [str(post_id) for post_id in rows]
+
+
+def make_requests(name: str, args, tokens: list, posts: list, finans_path: str):
+    """
+    Функция, которая выполняет один запрос сценария
+    :param name: сценарий
+    :param args:
+    :param tokens: токены тестовых пользователей
+    :param posts: id тестовых постов
+    :param finans_path: файл финансов
+    :return: корутинная функция request(client, rng)
+    """
+    if name == "posts":
+        async def request(client, rng):
+            return await client.get("/api/posts", params={"limit": 20})
+    elif name == "like":
+        async def request(client, rng):
+            return await client.post(f"/api/like/{rng.choice(posts)}", json={"like": rng.random() < 0.8},
+                                     headers={"Authorization": f"Bearer {rng.choice(tokens)}"})
+    elif name == "login":
+        async def request(client, rng):
+            return await client.post("/api/login/", data={
+                "username": f"{USER_PREFIX}{rng.randrange(args.users)}@example.com", "password": PASSWORD})
+    elif name == "upload":
+        async def request(client, rng):
+            with open(finans_path, "rb") as file:
+                return await client.post("/upload", params={"mode": args.upload_mode},
+                                         files={"file": (FINANS_FILE, file, "text/csv")})
+    elif name == "file":
+        async def request(client, rng):
+            return await client.get(f"/file/{FINANS_FILE}", params={"format": args.file_format})
+    else:
+        raise ValueError(f"Unknown scenario {name}")
+    return request
+
+
+async def run_scenario(client: httpx.AsyncClient, request, total: int, concurrency: int, seed: int) -> dict:
+    """
+    total запросов сценария, одновременно не больше concurrency
+    :param client:
+    :param request:
+    :param total:
+    :param concurrency:
+    :param seed:
+    :return: статистика сценария
+    """
+    latencies = []
+    statuses = {}
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker(number: int):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + number)
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await request(client, rng)
+                status = str(response.status_code)
+                errors += response.status_code >= 400
+            except httpx.HTTPError as error:
+                status = type(error).__name__
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(min(concurrency, total))))
+    elapsed = time.perf_counter() - started
+    return {"requests": total, "concurrency": min(concurrency, total), "errors": errors, "statuses": statuses,
+            "seconds": round(elapsed, 3), "rps": round(total / elapsed, 2), **latency_stats(latencies)}
+
+
+def latency_stats(latencies: list) -> dict:
+    """
+    Перцентили времени ответа в миллисекундах
+    :param latencies: времена в секундах
+    :return:
+    """
+    if not latencies:
+        return {}
+    values = np.array(latencies) * 1000
+    stats = {f"p{q}_ms": round(float(np.percentile(values, q)), 2) for q in (50, 90, 95, 99)}
+    stats.update(mean_ms=round(float(values.mean()), 2), max_ms=round(float(values.max()), 2))
+    return stats
+
+
+def compare(result: dict, baseline: dict) -> dict:
+    """
+    Отношение показателей к прошлому прогону: rps > 1 и p* < 1 - стало лучше
+    :param result:
+    :param baseline:
+    :return:
+    """
+    diff = {}
+    for name, stats in result["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        diff[name] = {key: round(stats[key] / base[key], 3) for key in ("rps", "p50_ms", "p95_ms", "p99_ms")
+                      if stats.get(key) and base.get(key)}
+    return diff
+
+
+async def run(args) -> dict:
+    finans_path = os.path.join(tempfile.gettempdir(), FINANS_FILE)
+    result = {"config": vars(args).copy(), "started": datetime.utcnow().isoformat(), "seed": {}, "scenarios": {}}
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed_blog(args.users, args.posts, args.likes, args.seed)
+        result["seed"]["blog_seconds"] = round(time.perf_counter() - started, 3)
+        if args.finans_codes:
+            finans_path = make_finans_file(args.finans_codes, args.years, args.seed)
+            started = time.perf_counter()
+            loaded = seed_finans(finans_path)
+            result["seed"]["finans_seconds"] = round(time.perf_counter() - started, 3)
+            result["seed"]["finans_rows"] = loaded.get("finans_rows")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        tokens = await login_all(client, args.users) if "like" in args.scenarios else []
+        posts = post_ids(args.posts) if "like" in args.scenarios else []
+        for name in args.scenarios:
+            total = args.upload_requests if name == "upload" else args.requests
+            request = make_requests(name, args, tokens, posts, finans_path)
+            # один запрос до замера: прогрев кэшей и пулов соединений
+            await request(client, random.Random(args.seed))
+            result["scenarios"][name] = await run_scenario(client, request, total, args.concurrency, args.seed)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--likes', type=int, default=10000)
+    parser.add_argument('--finans-codes', type=int, default=10000, help='строк в файле финансов, 0 - без файла')
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=1000, help='запросов на сценарий')
+    parser.add_argument('--upload-requests', type=int, default=5)
+    parser.add_argument('--upload-mode', choices=('full', 'delta'), default='delta')
+    parser.add_argument('--file-format', choices=tuple(finans_utils.EXPORT_FORMATS), default='csv')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-seed', action='store_true', help='не заполнять БД, данные остались от прошлого прогона')
+    parser.add_argument('--output', help='файл для результата, по умолчанию stdout')
+    parser.add_argument('--baseline', help='результат прошлого прогона для сравнения')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline) as file:
+            result["baseline"] = {"file": args.baseline, "ratio": compare(result, json.load(file))}
+    report = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+    else:
+        sys.stdout.write(report + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
-from functools import lru_cache
-from typing import Generator
-from config import Settings
+from sqlalchemy.orm import sessionmaker
+from typing import AsyncGenerator
 import os
-import databases
-from alembic import command
-from alembic.config import Config
-from sqlalchemy_utils import create_database, database_exists
 from dotenv import load_dotenv
 
 local = os.environ.get("LOCAL")
@@ -26,36 +20,42 @@ database_user = os.environ.get('DB_USER')
 database_name = os.environ.get('DB_NAME')
 # database_test = os.environ.get('DB_TEST')
 
+# настройки пула соединений и таймаут запроса (в миллисекундах)
+database_pool_size = int(os.environ.get('DB_POOL_SIZE', 10))
+database_max_overflow = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+database_pool_timeout = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+database_statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+
+# синхронный URL используется для alembic
 SQLALCHEMY_DATABASE_URL = f'{database_type}://{database_user}:{database_pass}@{database_host}/{database_name}'
+# асинхронный URL через драйвер asyncpg для работы приложения
+SQLALCHEMY_ASYNC_DATABASE_URL = f'postgresql+asyncpg://{database_user}:{database_pass}@{database_host}/{database_name}'
 
 # if testing:
 #    SQLALCHEMY_DATABASE_URL = f'{database_type}://{database_user}:{database_pass}@{database_host}/{database_name}'
 # else:
 #    SQLALCHEMY_DATABASE_URL = f'{database_type}://{database_user}:{database_pass}@{database_host}/{database_test}'
 
-if not database_exists(SQLALCHEMY_DATABASE_URL):
-    create_database(SQLALCHEMY_DATABASE_URL)
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
+# движок не подключается к БД при создании: первое соединение открывается при первом запросе,
+# схема БД создается миграциями alembic (alembic upgrade head) до запуска приложения
+engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_size=database_pool_size,
+    max_overflow=database_max_overflow,
+    pool_timeout=database_pool_timeout,
+    connect_args={"server_settings": {"statement_timeout": str(database_statement_timeout)}},
+)
 
 Base = declarative_base()
 
-
-@lru_cache
-def create_session() -> scoped_session:
-    session = scoped_session(
-        sessionmaker(autocommit=False, autoflush=False, bind=engine),
-    )
-    return session
+async_session = sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 
-def get_db() -> Generator[scoped_session, None, None]:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
-    Создание соединения с БД
+    Создание асинхронной сессии с БД на время запроса
     :return:
     """
-    session = create_session()
-    try:
+    async with async_session() as session:
         yield session
-    finally:
-        session.remove()
@@ -0,0 +1,151 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from fastapi import HTTPException, status
+from psycopg2 import extensions, pool as pg_pool
+
+# параметры подключения к БД финансов
+finans_db_host = os.environ.get("FINANS_DB_HOST", "127.0.0.1")
+finans_db_port = os.environ.get("FINANS_DB_PORT", "5432")
+finans_db_user = os.environ.get("FINANS_DB_USER", "postgres")
+finans_db_pass = os.environ.get("FINANS_DB_PASS", "space")
+finans_db_name = os.environ.get("FINANS_DB_NAME", "finans_db")
+
+# размер пула соединений и время ожидания свободного соединения в секундах
+finans_pool_min = int(os.environ.get("FINANS_POOL_MIN", 1))
+finans_pool_max = int(os.environ.get("FINANS_POOL_MAX", 10))
+finans_pool_timeout = float(os.environ.get("FINANS_POOL_TIMEOUT", 30))
+
+# ошибки, при которых БД финансов считается недоступной
+UNAVAILABLE = (psycopg2.OperationalError, pg_pool.PoolError)
+
+
+class FinansPool:
+    """
+    Пул соединений с БД финансов. ThreadedConnectionPool не ждет свободного соединения,
+    поэтому число выданных соединений ограничивается семафором с таймаутом
+    """
+
+    def __init__(self, minconn: int = finans_pool_min, maxconn: int = finans_pool_max,
+                 timeout: float = finans_pool_timeout):
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, user=finans_db_user,
+                                                    password=finans_db_pass,
+                                                    host=finans_db_host,
+                                                    port=finans_db_port,
+                                                    database=finans_db_name)
+
+    def getconn(self):
+        """
+        Выдача соединения с проверкой: закрытое или оборванное соединение заменяется новым
+        :return:
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise pg_pool.PoolError("connection pool exhausted")
+        try:
+            conn = self._pool.getconn()
+            if not self._alive(conn):
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        """
+        Возврат соединения в пул: незавершенная транзакция откатывается, оборванное соединение закрывается
+        :param conn:
+        :return:
+        """
+        try:
+            close = bool(conn.closed)
+            if not close and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+    @staticmethod
+    def _alive(conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> FinansPool:
+    """
+    Пул создается при первом обращении, отдельно в каждом процессе (приложение и пул фоновых задач)
+    :return:
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = FinansPool()
+                _pool_pid = os.getpid()
+    return _pool
+
+
+@contextmanager
+def connection():
+    """
+    Соединение из пула на время блока with
+    :return:
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def get_connection():
+    """
+    Соединение из пула на время запроса, при недоступной БД или пустом пуле - 503
+    :return:
+    """
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+    except UNAVAILABLE as error:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Finance database unavailable") from error
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def close_pool():
+    """
+    Закрытие всех соединений пула текущего процесса
+    :return:
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _pool_pid = None
@@ -0,0 +1,187 @@
+import os
+import time
+from contextvars import ContextVar
+
+from fastapi.templating import Jinja2Templates
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from starlette.responses import Response
+from starlette.routing import Match
+
+# число запросов к БД за один HTTP запрос: длинный хвост выше 10 - признак N+1
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Время обработки запроса",
+                            ("method", "route", "status"))
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "Запросы в обработке", ("method", "route"),
+                             multiprocess_mode="livesum")
+REQUEST_DB_QUERIES = Histogram("http_request_db_queries", "Число запросов к БД за HTTP запрос",
+                               ("method", "route"), buckets=QUERY_COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Время запросов к БД за HTTP запрос",
+                               ("method", "route"))
+DB_QUERIES = Counter("db_queries_total", "Запросы к БД")
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Запросы к БД, завершившиеся ошибкой")
+TEMPLATE_RENDER = Histogram("template_render_seconds", "Время рендера шаблона", ("template",))
+
+
+class RequestStats:
+    """ Счетчики текущего HTTP запроса: запросы к БД и рендер шаблонов """
+
+    def __init__(self, route: str = ""):
+        self.route = route
+        self.queries = 0
+        # тексты запросов заполняет core.tracing
+        self.statements = []
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+# счетчики запроса, в контексте которого выполняется код
+request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+
+def route_name(app, scope) -> str:
+    """
+    Шаблон пути маршрута (/api/posts/{post_id}), а не сам путь - чтобы число меток не росло
+    :param app:
+    :param scope:
+    :return:
+    """
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ ASGI middleware: время обработки, запросы в обработке и запросы к БД по маршрутам """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = route_name(scope["app"], scope)
+        stats = RequestStats(route)
+        token = request_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_LATENCY.labels(method, route, str(status_code)).observe(time.perf_counter() - started)
+            REQUEST_DB_QUERIES.labels(method, route).observe(stats.queries)
+            REQUEST_DB_SECONDS.labels(method, route).observe(stats.db_seconds)
+            in_progress.dec()
+            request_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    DB_QUERIES.inc()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def _handle_error(exception_context):
+    DB_QUERY_ERRORS.inc()
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def instrument_engine(engine):
+    """
+    Подсчет запросов к БД через события движка SQLAlchemy, для асинхронного движка - его sync_engine
+    :param engine:
+    :return:
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class TimedTemplates(Jinja2Templates):
+    """ Jinja2Templates с замером времени рендера: шаблон рендерится при создании ответа """
+
+    def TemplateResponse(self, name: str, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().TemplateResponse(name, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            TEMPLATE_RENDER.labels(name).observe(elapsed)
+            stats = request_stats.get()
+            if stats is not None:
+                stats.render_seconds += elapsed
+
+
+class StatsCollector:
+    """ Значения из stats() объектов приложения (кэш токенов, пул хеширования) на момент сбора метрик """
+
+    def __init__(self, prefix: str, source):
+        self.prefix = prefix
+        self.source = source
+
+    def collect(self):
+        for name, value in self.source.stats().items():
+            yield GaugeMetricFamily(f"{self.prefix}_{name}", f"{self.prefix} {name}", value=value)
+
+
+_stats_collectors = []
+
+
+def register_stats(prefix: str, source):
+    """
+    Регистрация объекта с методом stats() в метриках
+    :param prefix: префикс имен метрик
+    :param source:
+    :return:
+    """
+    collector = StatsCollector(prefix, source)
+    _stats_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def metrics_response() -> Response:
+    """
+    Ответ /metrics в текстовом формате Prometheus. При нескольких процессах (PROMETHEUS_MULTIPROC_DIR)
+    метрики суммируются по всем процессам, а значения stats() - того процесса, который ответил
+    :return:
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in _stats_collectors:
+        registry.register(collector)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def shutdown():
+    """ Удаление файлов метрик завершившегося процесса, чтобы его gauge не учитывались в сумме """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
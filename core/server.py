@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+
+import uvicorn
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from uvicorn.supervisors import Multiprocess
+
+from core import db, finans_db
+from routers import health
+
+# адрес и число процессов приложения, по умолчанию - по числу доступных процессу ядер
+server_host = os.environ.get("SERVER_HOST", "0.0.0.0")
+server_port = int(os.environ.get("SERVER_PORT", 8000))
+server_workers = os.environ.get("WEB_WORKERS")
+# соединения Postgres, которые остаются свободными для миграций, администрирования и суперпользователя
+database_reserved_connections = int(os.environ.get("DB_RESERVED_CONNECTIONS", 10))
+# сколько секунд после сигнала остановки процесс еще принимает запросы, отвечая 503 на /health/ready
+shutdown_drain_seconds = float(os.environ.get("SHUTDOWN_DRAIN_SECONDS", 5))
+
+logger = logging.getLogger(__name__)
+
+
+def cpu_count() -> int:
+    """ Число ядер, доступных процессу (с учетом ограничения affinity в контейнере) """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    return int(server_workers) if server_workers else cpu_count()
+
+
+def max_connections() -> int:
+    """
+    max_connections сервера Postgres основной БД, None если БД недоступна
+    :return:
+    """
+    engine = create_engine(db.SQLALCHEMY_DATABASE_URL, pool_pre_ping=False, connect_args={"connect_timeout": 5})
+    try:
+        with engine.connect() as conn:
+            return int(conn.execute(text("SHOW max_connections")).scalar())
+    except Exception as error:
+        logger.warning("Не удалось получить max_connections: %s", error)
+        return None
+    finally:
+        engine.dispose()
+
+
+def finans_connections(jobs_workers: int) -> int:
+    """
+    Соединения одного процесса приложения с тем же сервером Postgres через БД финансов:
+    пул запросов и по одному соединению на процесс фоновых задач
+    :param jobs_workers:
+    :return:
+    """
+    url = make_url(db.SQLALCHEMY_DATABASE_URL)
+    if _server(url.host, url.port) != _server(finans_db.finans_db_host, finans_db.finans_db_port):
+        return 0
+    return finans_db.finans_pool_max + jobs_workers
+
+
+def _server(host, port) -> tuple:
+    host = host or "localhost"
+    return "localhost" if host in ("localhost", "127.0.0.1") else host, str(port or 5432)
+
+
+def pool_sizes(connections: int, workers: int, reserved: int, other: int) -> tuple:
+    """
+    Размер пула SQLAlchemy одного процесса так, чтобы все процессы вместе не превысили max_connections
+    :param connections: max_connections сервера
+    :param workers: число процессов приложения
+    :param reserved: свободные соединения для администрирования
+    :param other: прочие соединения одного процесса с тем же сервером (БД финансов)
+    :return: pool_size, max_overflow
+    """
+    budget = (connections - reserved) // workers - other
+    if budget < 2:
+        raise RuntimeError(f"max_connections={connections} is too low for {workers} workers: "
+                           f"reduce WEB_WORKERS or FINANS_POOL_MAX")
+    pool_size = max(1, budget // 2)
+    return pool_size, budget - pool_size
+
+
+def limit_pool(pool_size: int, max_overflow: int, budget: int) -> tuple:
+    """
+    Явно заданные размеры пула, уменьшенные так, чтобы пул процесса не превысил его долю соединений
+    :param pool_size:
+    :param max_overflow:
+    :param budget: соединений на процесс (pool_size + max_overflow из pool_sizes)
+    :return: pool_size, max_overflow
+    """
+    pool_size = max(1, min(pool_size, budget))
+    return pool_size, max(0, min(max_overflow, budget - pool_size))
+
+
+def configure(workers: int):
+    """
+    Настройки процессов приложения через окружение, которое они наследуют: размеры пулов соединений,
+    число процессов фоновых задач и каталог метрик. Размер пула по умолчанию считается от max_connections,
+    а заданный явно DB_POOL_SIZE/DB_MAX_OVERFLOW уменьшается до доли соединений одного процесса
+    :param workers:
+    :return:
+    """
+    jobs_workers = int(os.environ.setdefault("JOBS_WORKERS", str(max(1, cpu_count() // workers))))
+    connections = max_connections()
+    if connections is not None:
+        pool_size, max_overflow = pool_sizes(connections, workers, database_reserved_connections,
+                                             finans_connections(jobs_workers))
+        if "DB_POOL_SIZE" in os.environ or "DB_MAX_OVERFLOW" in os.environ:
+            requested = (int(os.environ.get("DB_POOL_SIZE", pool_size)),
+                         int(os.environ.get("DB_MAX_OVERFLOW", max_overflow)))
+            pool_size, max_overflow = limit_pool(*requested, pool_size + max_overflow)
+            if (pool_size, max_overflow) != requested:
+                logger.warning("DB_POOL_SIZE/DB_MAX_OVERFLOW %s + %s больше доли max_connections=%s "
+                               "на %s процессов, пул уменьшен", *requested, connections, workers)
+        os.environ["DB_POOL_SIZE"] = str(pool_size)
+        os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+        logger.info("max_connections=%s, процессов %s: пул %s + %s на процесс",
+                    connections, workers, pool_size, max_overflow)
+    if workers > 1 and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), "blog_metrics")
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        # метрики прошлого запуска не должны попасть в сумму по процессам
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    Сервер uvicorn, который по сигналу остановки сразу снимает готовность процесса, но еще
+    shutdown_drain_seconds принимает запросы, пока балансировщик не увидит 503 на /health/ready.
+    Повторный сигнал останавливает процесс без ожидания
+    """
+
+    def handle_exit(self, sig, frame):
+        if not health.state["ready"] or not shutdown_drain_seconds:
+            health.state["ready"] = False
+            super().handle_exit(sig, frame)
+            return
+        health.state["ready"] = False
+        logger.info("Сигнал %s: процесс не готов, остановка через %s с", sig, shutdown_drain_seconds)
+        asyncio.get_running_loop().call_later(shutdown_drain_seconds, super().handle_exit, sig, frame)
+
+
+class DrainingMultiprocess(Multiprocess):
+    """ Сигнал остановки всем процессам сразу, а не по одному, чтобы они снимали готовность одновременно """
+
+    def shutdown(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info("Процессы приложения остановлены")
+
+
+def run_production():
+    """
+    Запуск без перезагрузки: процесс на ядро, uvloop и httptools. При SIGTERM процесс снимает готовность,
+    после shutdown_drain_seconds перестает принимать соединения, дожидается текущих запросов
+    и закрывает свои пулы в событии shutdown
+    :return:
+    """
+    logging.basicConfig(level=logging.INFO)
+    workers = worker_count()
+    configure(workers)
+    config = uvicorn.Config(
+        "app:app",
+        host=server_host,
+        port=server_port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        proxy_headers=True,
+        server_header=False,
+    )
+    server = DrainingServer(config)
+    if workers > 1:
+        DrainingMultiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
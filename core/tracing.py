@@ -0,0 +1,149 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from core.metrics import request_stats
+
+# порог медленного запроса в миллисекундах, 0 - не логировать
+DB_SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", 200))
+# добавлять ли к медленному запросу его план EXPLAIN
+DB_SLOW_QUERY_EXPLAIN = os.environ.get("DB_SLOW_QUERY_EXPLAIN", "1") == "1"
+# превышение бюджета запросов маршрутом: 0 - предупреждение в лог, 1 - ошибка (для тестов)
+DB_QUERY_BUDGET_STRICT = os.environ.get("DB_QUERY_BUDGET_STRICT", "0") == "1"
+
+# запросы к БД, из которых складываются бюджеты маршрутов, при пустых кэшах (замер - tests/test_tracing.py):
+# пользователь по токену при промахе кэша токенов и страница своих постов при промахе кэша Redis
+TOKEN_USER_QUERIES = 1
+MY_POSTS_PAGE_QUERIES = 1
+
+# бюджет запросов к БД на один HTTP запрос по шаблону пути маршрута
+ROUTE_QUERY_BUDGETS = {
+    "/myblog/": TOKEN_USER_QUERIES + MY_POSTS_PAGE_QUERIES,
+    "/myblog/new/": TOKEN_USER_QUERIES + MY_POSTS_PAGE_QUERIES,
+    "/myblog/edit/{post_id}/": TOKEN_USER_QUERIES + MY_POSTS_PAGE_QUERIES,
+}
+
+# запросы, для которых можно получить план без выполнения
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """ Число запросов к БД превысило бюджет """
+
+
+class QueryCounter:
+    """ Запросы к БД внутри блока query_budget """
+
+    def __init__(self, limit: int, name: str):
+        self.limit = limit
+        self.name = name
+        self.statements = []
+
+    @property
+    def queries(self) -> int:
+        return len(self.statements)
+
+
+# открытые блоки query_budget
+_budgets = []
+
+
+@contextmanager
+def query_budget(limit: int, name: str = "block"):
+    """
+    Проверка, что код внутри блока выполнил не больше limit запросов к БД, иначе QueryBudgetExceeded.
+    Считаются все запросы процесса, поэтому блок предназначен для тестов и бенчмарков
+    :param limit: допустимое число запросов
+    :param name: имя блока для сообщения об ошибке
+    :return: QueryCounter с выполненными запросами
+    """
+    counter = QueryCounter(limit, name)
+    _budgets.append(counter)
+    try:
+        yield counter
+    finally:
+        _budgets.remove(counter)
+    if counter.queries > limit:
+        raise QueryBudgetExceeded(budget_message(name, counter.statements, limit))
+
+
+def budget_message(name: str, statements: list, limit: int) -> str:
+    lines = [f"{name}: {len(statements)} queries, budget {limit}"]
+    lines.extend(f"  {number}. {statement}" for number, statement in enumerate(statements, 1))
+    return "\n".join(lines)
+
+
+def explain(conn, statement: str, parameters) -> str:
+    """
+    План запроса через отдельный курсор того же соединения, чтобы не затереть результат исходного запроса
+    :param conn:
+    :param statement:
+    :param parameters:
+    :return:
+    """
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return ""
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN {statement}", parameters)
+        return "\n".join(row[0] for row in cursor.fetchall())
+    except Exception as error:
+        return f"EXPLAIN failed: {error!r}"
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._trace_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - context._trace_start) * 1000
+    stats = request_stats.get()
+    if stats is not None:
+        stats.statements.append(statement)
+    for counter in _budgets:
+        counter.statements.append(statement)
+    if DB_SLOW_QUERY_MS and elapsed_ms >= DB_SLOW_QUERY_MS:
+        route = stats.route if stats is not None else "-"
+        plan = explain(conn, statement, parameters) if DB_SLOW_QUERY_EXPLAIN and not executemany else ""
+        logger.warning("Медленный запрос %.1f мс, маршрут %s:\n%s\n%s", elapsed_ms, route, statement, plan)
+
+
+def instrument_engine(engine):
+    """
+    Трассировка запросов движка: медленные запросы и привязка запросов к маршруту
+    :param engine:
+    :return:
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryBudgetMiddleware:
+    """
+    ASGI middleware: проверка ROUTE_QUERY_BUDGETS после обработки запроса.
+    Должен стоять внутри MetricsMiddleware, который создает счетчики запроса
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+        stats = request_stats.get()
+        if stats is None or stats.route not in ROUTE_QUERY_BUDGETS:
+            return
+        limit = ROUTE_QUERY_BUDGETS[stats.route]
+        if len(stats.statements) > limit:
+            message = budget_message(f"{scope['method']} {stats.route}", stats.statements, limit)
+            if DB_QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -1,13 +1,19 @@
 import uvicorn
 import os
+import sys
 
-os.environ['LOCAL'] = 'True'
 
 if __name__ == '__main__':
-    uvicorn.run(
-        "app:app",
-        host='localhost',
-        # host='0.0.0.0',
-        port=8000,
-        reload=True,
-    )
+    # python main.py --prod - несколько процессов без перезагрузки, иначе локальный запуск для разработки
+    if "--prod" in sys.argv[1:] or os.environ.get("APP_MODE") == "production":
+        from core import server
+        server.run_production()
+    else:
+        os.environ['LOCAL'] = 'True'
+        uvicorn.run(
+            "app:app",
+            host='localhost',
+            # host='0.0.0.0',
+            port=8000,
+            reload=True,
+        )
@@ -1,9 +1,9 @@
-from sqlalchemy import Column, String, Integer, Text, ForeignKey, inspect, Boolean, DateTime, func, text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Integer, Text, ForeignKey, inspect, Boolean, DateTime, func, text, Index, Computed
+from sqlalchemy.orm import relationship, deferred
 from uuid import uuid4
 from datetime import datetime
 from core.db import Base
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
 
 
 class Users(Base):
@@ -25,9 +25,22 @@ class UsersPosts(Base):
     posts = Column(Text)
     dt_created = Column(DateTime, default=datetime.utcnow, server_default=func.now())
     dt_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    like_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    dislike_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    # поисковый вектор текста поста, пересчитывается самой БД при вставке и изменении
+    posts_tsv = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', coalesce(posts, ''))", persisted=True)))
 
     users = relationship("Users", cascade="all, delete", backref="users")
 
+    __table_args__ = (
+        # индекс под пагинацию ленты по курсору (dt_created, id)
+        Index("ix_users_posts_dt_created_id", "dt_created", "id"),
+        # индекс под посты пользователя (страница "мой блог", счетчики постов и лайков автора)
+        Index("ix_users_posts_user_id_dt_created", "user_id", "dt_created"),
+        # индекс полнотекстового поиска по постам
+        Index("ix_users_posts_posts_tsv", "posts_tsv", postgresql_using="gin"),
+    )
+
 
 class Likes(Base):
     __tablename__ = "likes"
@@ -40,6 +53,13 @@ class Likes(Base):
     users = relationship("Users", cascade="all, delete", backref="children")
     posts_id = relationship("UsersPosts", cascade="all, delete", backref="users_posts_like")
 
+    __table_args__ = (
+        # один лайк пользователя на пост, цель для INSERT ... ON CONFLICT
+        Index("ux_likes_post_id_user_id", "post_id", "user_id", unique=True),
+        # лайки пользователя, поиск по post_id покрывает ux_likes_post_id_user_id
+        Index("ix_likes_user_id", "user_id"),
+    )
+
 
 class TokensTable(Base):
     __tablename__ = "tokens"
@@ -50,3 +70,10 @@ class TokensTable(Base):
     user = Column(UUID(as_uuid=True), ForeignKey(Users.id))
 
     users_id = relationship("Users", cascade="all, delete", backref="users_token")
+
+    __table_args__ = (
+        # проверка токена при авторизации: token, срок действия и пользователь читаются из индекса
+        Index("ix_tokens_token_expires", "token", "expires", postgresql_include=["user"]),
+        # токен пользователя при входе
+        Index("ix_tokens_user", "user"),
+    )
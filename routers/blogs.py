@@ -3,29 +3,51 @@ from Schemas.users import User
 from utils import blogs as post_utils
 from utils import users as user_utils
 from utils.dependencies import get_current_user, get_current_user_
-from fastapi import APIRouter, Depends, HTTPException, status, Form, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Request, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.responses import RedirectResponse, HTMLResponse
 from core.db import get_db
+from typing import Optional
 
 router = APIRouter()
 
 
+async def get_posts_page(db: AsyncSession, limit: int, cursor: Optional[str]):
+    """
+    Получение страницы ленты постов с проверкой курсора
+    :param db: БД
+    :param limit: размер страницы
+    :param cursor: курсор следующей страницы
+    :return: информация о постах и курсор следующей страницы
+    """
+    total_count = await post_utils.get_posts_count(db)
+    try:
+        posts, likes, next_cursor = await post_utils.get_posts(db, limit, cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+    return {"total_count": total_count, "results": posts, "likes_all": likes, "next_cursor": next_cursor}
+
+
 @router.get("/api/{user_id}/posts")
-async def get_posts_users(user_id: str, db: Session = Depends(get_db)):
+async def get_posts_users(user_id: str, cursor: Optional[str] = None,
+                          limit: int = Query(post_utils.POSTS_PAGE_LIMIT, ge=1, le=post_utils.POSTS_PAGE_LIMIT_MAX),
+                          db: AsyncSession = Depends(get_db)):
     """
     API получения информации о всех постах, при указади id пользователя
     :param user_id: id пользователя
+    :param cursor: курсор следующей страницы
+    :param limit: размер страницы
     :param db: БД
     :return: информация о постах
     """
-    total_count = await post_utils.get_posts_count(db)
-    posts, likes = await post_utils.get_posts(db)
-    return {"total_count": total_count, "results": posts, "likes_all": likes}
+    return await get_posts_page(db, limit, cursor)
 
 
 @router.get("/api/{user_id}/my_posts")
-async def get_posts_user(user_id: str, db: Session = Depends(get_db)):
+async def get_posts_user(user_id: str, db: AsyncSession = Depends(get_db)):
     """
     API получения информации о постах пользователя, при указади id пользователя
     :param user_id: id пользователя
@@ -38,19 +60,44 @@ async def get_posts_user(user_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/api/posts")
-async def get_posts(db: Session = Depends(get_db)):
+async def get_posts(cursor: Optional[str] = None,
+                    limit: int = Query(post_utils.POSTS_PAGE_LIMIT, ge=1, le=post_utils.POSTS_PAGE_LIMIT_MAX),
+                    db: AsyncSession = Depends(get_db)):
     """
     API получения информации о всех постах, ,без id пользователя и аторизации
+    :param cursor: курсор следующей страницы
+    :param limit: размер страницы
     :param db: БД
     :return: информация о постах
     """
-    total_count = await post_utils.get_posts_count(db)
-    posts, likes = await post_utils.get_posts(db)
-    return {"total_count": total_count, "results": posts, "likes_all": likes}
+    return await get_posts_page(db, limit, cursor)
+
+
+@router.get("/api/posts/search")
+async def search_posts(q: str = Query(..., min_length=1, max_length=200),
+                       limit: int = Query(post_utils.POSTS_PAGE_LIMIT, ge=1, le=post_utils.POSTS_PAGE_LIMIT_MAX),
+                       cursor: Optional[str] = None,
+                       db: AsyncSession = Depends(get_db)):
+    """
+    API полнотекстового поиска по постам, от более релевантных к менее
+    :param q: поисковая строка
+    :param limit: размер страницы
+    :param cursor: курсор следующей страницы
+    :param db: БД
+    :return: найденные посты и курсор следующей страницы
+    """
+    try:
+        posts, next_cursor = await post_utils.search_posts(db, q, limit, cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+    return {"results": posts, "next_cursor": next_cursor}
 
 
 @router.get("/api/posts/post/{post_id}")
-async def get_post(post_id: str, db: Session = Depends(get_db)):
+async def get_post(post_id: str, db: AsyncSession = Depends(get_db)):
     """
     Получения информации о конкретном посте по его id
     :param post_id: id поста
@@ -61,7 +108,7 @@ async def get_post(post_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/api/my_posts")
-async def get_api_my_post(current_user: User = Depends(get_current_user_), db: Session = Depends(get_db)):
+async def get_api_my_post(current_user: User = Depends(get_current_user_), db: AsyncSession = Depends(get_db)):
     """
     API получения информации о постах автаризованного пользователя
     :param current_user: пользователь
@@ -73,8 +120,31 @@ async def get_api_my_post(current_user: User = Depends(get_current_user_), db: S
     return {"total_count": total_count, "results": posts, "likes_all": likes}
 
 
+async def check_post_owner(post_id: str, user_id, db: AsyncSession):
+    """
+    Причина, по которой пост не изменен: поста нет или он принадлежит другому пользователю
+    :param post_id: id поста
+    :param user_id: id пользователя
+    :param db: БД
+    :return:
+    """
+    post_try = await post_utils.get_post_front(post_id, db)
+    # проверка, что пост есть
+    if not post_try:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="This isn't post",
+        )
+    # проверка, что пользователь не редактировал чужие посты
+    if str(post_try.user_id) != str(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have access to modify this post",
+        )
+
+
 @router.post("/api/posts/user/{user_id}", response_model=PostDetailsModel, status_code=201)
-async def create_post_user(user_id: str, post: PostModel, db: Session = Depends(get_db)):
+async def create_post_user(user_id: str, post: PostModel, db: AsyncSession = Depends(get_db)):
     """
     Создания поста по id пользователя
     :param user_id: id пользователя
@@ -91,7 +161,7 @@ async def create_post_user(user_id: str, post: PostModel, db: Session = Depends(
 
 @router.post("/api/posts", response_model=PostDetailsModel, status_code=201)
 async def create_post(posts_text: PostModel, current_user: User = Depends(get_current_user_),
-                      db: Session = Depends(get_db)):
+                      db: AsyncSession = Depends(get_db)):
     """
     API создание поста текущим авторизованным пользователем
     :param posts_text: текст поста
@@ -106,7 +176,7 @@ async def create_post(posts_text: PostModel, current_user: User = Depends(get_cu
 
 
 @router.post("/myblog/new/", status_code=201)
-async def create_post_front(request: Request, post_text: str = Form(), db: Session = Depends(get_db)):
+async def create_post_front(request: Request, post_text: str = Form(), db: AsyncSession = Depends(get_db)):
     """
     создание поста текущим авторизованным пользователем для frontend
     :param request:
@@ -128,7 +198,7 @@ async def create_post_front(request: Request, post_text: str = Form(), db: Sessi
 
 
 @router.put("/api/edit-posts/{user_id}/{post_id}", response_model=PostDetailsModel)
-async def update_post_user(posts_text: PostModel, user_id: str, post_id: str, db: Session = Depends(get_db)):
+async def update_post_user(posts_text: PostModel, user_id: str, post_id: str, db: AsyncSession = Depends(get_db)):
     """
     Редактирование поста по id пользователя и id поста
     :param user_id: id пользователя
@@ -137,21 +207,9 @@ async def update_post_user(posts_text: PostModel, user_id: str, post_id: str, db
     :param db: БД
     :return: информация о отредактированном посте
     """
-    post_try = await post_utils.get_post_front(post_id, db)
-    # проверка, что пост есть
-    if not post_try:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This isn't post",
-        )
-    # проверка, что пользователь не редактировал чужие посты
-    if str(post_try.user_id) != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to modify this post",
-        )
-    await post_utils.update_post_front(post_id, posts_text.posts_text, db)
-    post = await post_utils.get_post(post_id, db)
+    post = await post_utils.update_post_front(post_id, posts_text.posts_text, db, user_id)
+    if post is None:
+        await check_post_owner(post_id, user_id, db)
     post_dict = {'id': post.id, 'dt_created': post.dt_created, 'posts': post.posts, 'user_id': post.user_id,
                  'dt_updated': post.dt_updated}
     return post_dict
@@ -159,7 +217,7 @@ async def update_post_user(posts_text: PostModel, user_id: str, post_id: str, db
 
 @router.put("/api/edit-post/{post_id}", response_model=PostDetailsModel)
 async def update_post_user_api(posts_text: PostModel, post_id: str, current_user: User = Depends(get_current_user_),
-                               db: Session = Depends(get_db)):
+                               db: AsyncSession = Depends(get_db)):
     """
     Редактирование поста по автаризованным пользователем и id поста
     :param current_user: авторизованный пользователь
@@ -168,21 +226,9 @@ async def update_post_user_api(posts_text: PostModel, post_id: str, current_user
     :param db: БД
     :return: информация о отредактированном посте
     """
-    post_try = await post_utils.get_post_front(post_id, db)
-    # проверка, что пост есть
-    if not post_try:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This isn't post",
-        )
-    # проверка, что пользователь не редактировал чужие посты
-    if post_try.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to modify this post",
-        )
-    await post_utils.update_post_front(post_id, posts_text.posts_text, db)
-    post = await post_utils.get_post(post_id, db)
+    post = await post_utils.update_post_front(post_id, posts_text.posts_text, db, current_user.id)
+    if post is None:
+        await check_post_owner(post_id, current_user.id, db)
     post_dict = {'id': post.id, 'dt_created': post.dt_created, 'posts': post.posts, 'user_id': post.user_id,
                  'dt_updated': post.dt_updated}
     return post_dict
@@ -190,7 +236,7 @@ async def update_post_user_api(posts_text: PostModel, post_id: str, current_user
 
 @router.post("/myblog/edit/{post_id}/", response_model=PostDetailsModel)
 async def update_post_user_front(request: Request, post_id: str, post_text: str = Form(),
-                                 db: Session = Depends(get_db)):
+                                 db: AsyncSession = Depends(get_db)):
     """
     редактирование поста для frontend
     :param request:
@@ -207,94 +253,73 @@ async def update_post_user_front(request: Request, post_id: str, post_text: str
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have access to create post",
         )
-    post_try = await post_utils.get_post_front(post_id, db)
-    # проверка, что пост есть
-    if not post_try:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This isn't post",
-        )
-    # проверка, что пользователь не редактировал чужие посты
     user = await user_utils.get_user_by_token_(token, db)
-    if post_try.user_id != user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to modify this post",
-        )
-
-    await post_utils.update_post_front(post_id, post_text, db)
+    post = await post_utils.update_post_front(post_id, post_text, db, user.id)
+    if post is None:
+        await check_post_owner(post_id, user.id, db)
     return RedirectResponse(f"/myblog/", status_code=status.HTTP_302_FOUND)
 
 
-@router.post('/api/like/{post_id}', status_code=201)
-async def create_post_like(post_id: str, like: PostLike, current_user: User = Depends(get_current_user_),
-                           db: Session = Depends(get_db)):
+def check_post_like(post_like, user_id):
     """
-    Простовление посту лайка авторизованым пользователем
-    :param post_id: id поста
-    :param like: лайк
-    :param current_user: текущий авторизованный пользователь
-    :param db: БД
-    :return: информация о проставленом лайке
+    Проверка результата простановки лайка
+    :param post_like: результат post_utils.create_post_like*
+    :param user_id: id пользователя, ставившего лайк
+    :return:
     """
-    post_try = await post_utils.get_post_front(post_id, db)
     # проверка, что пост есть
-    if not post_try:
+    if not post_like:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="This isn't post",
         )
     # проверка, что лайк ставится не своему посту
-    if post_try.user_id == current_user.id:
+    if str(post_like.user_id) == str(user_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't like self post",
         )
-    like_on = await post_utils.get_like(post_id, current_user.id, db)
     # проверка на повторный лайк
-    if like_on:
+    if post_like.likes_on is None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't like this post more one",
         )
-    return await post_utils.create_post_like_api(post_id, current_user.id, bool(like.like), db)
+
+
+@router.post('/api/like/{post_id}', status_code=201)
+async def create_post_like(post_id: str, like: PostLike, current_user: User = Depends(get_current_user_),
+                           db: AsyncSession = Depends(get_db)):
+    """
+    Простовление посту лайка авторизованым пользователем
+    :param post_id: id поста
+    :param like: лайк
+    :param current_user: текущий авторизованный пользователь
+    :param db: БД
+    :return: информация о проставленом лайке и новые счетчики поста
+    """
+    post_like = await post_utils.create_post_like_api(post_id, current_user.id, bool(like.like), db)
+    check_post_like(post_like, current_user.id)
+    return post_like
 
 
 @router.post("/api/like-create/{user_id}/{post_id}", status_code=201)
-async def create_post_like_user(user_id: str, post_id: str, like: PostLike, db: Session = Depends(get_db)):
+async def create_post_like_user(user_id: str, post_id: str, like: PostLike, db: AsyncSession = Depends(get_db)):
     """
     Простовление посту лайка по id пользователя
     :param post_id: id поста
     :param like: лайк
     :param user_id: id пользователя
     :param db: БД
-    :return: информация о проставленом лайке
+    :return: информация о проставленом лайке и новые счетчики поста
     """
-    post_try = await post_utils.get_post_front(post_id, db)
-    # проверка, что пост есть
-    if not post_try:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This isn't post",
-        )
-    # проверка, что лайк ставится не своему посту
-    if str(post_try.user_id) == user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't like self post",
-        )
-    like_on = await post_utils.get_like(post_id, user_id, db)
-    # проверка на повторный лайк
-    if like_on:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't like this post more one",
-        )
-    return await post_utils.create_post_like(post_id, user_id, bool(like.like), db)
+    post_like = await post_utils.create_post_like(post_id, user_id, bool(like.like), db)
+    check_post_like(post_like, user_id)
+    return post_like
 
 
 @router.get("/likes_true/{user_id}/{post_id}/")
-async def create_post_likes_user_front_true(user_id: str, post_id: str, db: Session = Depends(get_db)):
+async def create_post_likes_user_front_true(user_id: str, post_id: str, db: AsyncSession = Depends(get_db)):
     """
     Простовление посту лайка для frontend
     :param post_id: id поста
@@ -302,33 +327,13 @@ async def create_post_likes_user_front_true(user_id: str, post_id: str, db: Sess
     :param db: БД
     :return: информация о проставленом лайке
     """
-    post = await post_utils.get_post_front(post_id, db)
-    # проверка, что пост есть
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This isn't post",
-        )
-    # проверка, что лайк ставится не своему посту
-    if str(post.user_id) == user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't like self post",
-        )
-    like_on = await post_utils.get_like(post_id, user_id, db)
-    # проверка на повторный лайк
-    if like_on:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't like this post more one",
-        )
-    like = True
-    data = await post_utils.create_post_like_front(post_id, user_id, like, db)
+    post_like = await post_utils.create_post_like_front(post_id, user_id, True, db)
+    check_post_like(post_like, user_id)
     return RedirectResponse(f"/blogs/", status_code=status.HTTP_302_FOUND)
 
 
 @router.get("/likes_false/{user_id}/{post_id}/")
-async def create_post_likes_user_front(user_id: str, post_id: str, db: Session = Depends(get_db)):
+async def create_post_likes_user_front(user_id: str, post_id: str, db: AsyncSession = Depends(get_db)):
     """
     Простовление посту дислайка для frontend
     :param post_id: id поста
@@ -336,34 +341,14 @@ async def create_post_likes_user_front(user_id: str, post_id: str, db: Session =
     :param db: БД
     :return: информация о проставленом лайке
     """
-    post = await post_utils.get_post_front(post_id, db)
-    # проверка, что пост есть
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This isn't post",
-        )
-    # проверка, что лайк ставится не своему посту
-    if str(post.user_id) == user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't like self post",
-        )
-    like_on = await post_utils.get_like(post_id, user_id, db)
-    # проверка на повторный лайк
-    if like_on:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't like this post more one",
-        )
-    like = False
-    data = await post_utils.create_post_like_front(post_id, user_id, like, db)
+    post_like = await post_utils.create_post_like_front(post_id, user_id, False, db)
+    check_post_like(post_like, user_id)
     return RedirectResponse(f"/blogs/", status_code=status.HTTP_302_FOUND)
 
 
 @router.delete("/api/del-posts/{post_id}", status_code=status.HTTP_200_OK)
 async def delete_post(
-        post_id: str, current_user: User = Depends(get_current_user_), db: Session = Depends(get_db)
+        post_id: str, current_user: User = Depends(get_current_user_), db: AsyncSession = Depends(get_db)
 ):
     """
     Удаление своего поста авторизованым пользователем
@@ -390,7 +375,7 @@ async def delete_post(
 
 @router.delete("/api/delete-posts/{user_id}/{post_id}", status_code=status.HTTP_200_OK)
 async def delete_post_user(
-        post_id: str, user_id: str, db: Session = Depends(get_db)
+        post_id: str, user_id: str, db: AsyncSession = Depends(get_db)
 ):
     """
     Удаление своего поста по id пользователя
@@ -418,7 +403,7 @@ async def delete_post_user(
 
 @router.get("/myblog/delete/{user_id}/{post_id}", status_code=status.HTTP_200_OK)
 async def delete_post_user_front(
-        post_id: str, user_id: str, db: Session = Depends(get_db)
+        post_id: str, user_id: str, db: AsyncSession = Depends(get_db)
 ):
     """
     Удаление поста для frontend
@@ -445,7 +430,7 @@ async def delete_post_user_front(
 
 
 @router.post("/myblog/new/{user_id}/")
-async def create_post_user_front(user_id: str, post_text: str = Form(), db: Session = Depends(get_db)):
+async def create_post_user_front(user_id: str, post_text: str = Form(), db: AsyncSession = Depends(get_db)):
     """
     Создание нового поста для frontend
     :param user_id: id пользователя
@@ -1,124 +1,131 @@
 from fastapi.responses import JSONResponse
 from os import getcwd, remove
-import pandas as pd
-from io import BytesIO, StringIO
+from urllib.parse import quote
+import shutil
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
 
 from Schemas.blogs import PostDetailsModel, PostModel, PostLike, PostDetailsModelLike
 from Schemas.users import User
 from utils import blogs as post_utils
 from utils import users as user_utils
+from utils import finans_settings
+from utils.lazy import LazyModule
+from utils import jobs as jobs_utils
 from utils.dependencies import get_current_user, get_current_user_
-from fastapi import APIRouter, Depends, HTTPException, status, Form, Request, UploadFile, File
-from sqlalchemy.orm import Session
-from fastapi.responses import RedirectResponse, HTMLResponse, FileResponse
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Query, Request, Response, UploadFile, File
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import RedirectResponse, HTMLResponse, FileResponse, StreamingResponse
 from core.db import get_db
-import psycopg2
-from psycopg2 import Error
+from core import finans_db
 
 router = APIRouter()
 
-try:
-    # Подключиться к существующей базе данных
-    connection = psycopg2.connect(user="postgres",
-                                  password="space",
-                                  host="127.0.0.1",
-                                  port="5432",
-                                  database="finans_db")
-except (Exception, Error) as error:
-    print("Ошибка при работе с PostgreSQL", error)
+# utils.finans тянет pandas и numpy, поэтому загружается при первом запросе к финансам, а не при старте
+finans_utils = LazyModule("utils.finans")
+
+EXPORT_FORMAT_REGEX = "^(" + "|".join(finans_settings.EXPORT_FORMATS) + ")$"
+UPLOAD_MODE_REGEX = "^(full|delta)$"
+# размер куска при отдаче файла свода
+EXPORT_CHUNK_SIZE = 64 * 1024
 
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """
-    загрузка файла
-    """
-    # Создайтся курсор для выполнения операций с базой данных
-    cursor = connection.cursor()
-    # SQL-запрос для создания новой таблицы
-    create_table_tree = f'''DO $$
-                            BEGIN
-                            IF NOT EXISTS (SELECT 1 FROM pg_type WHERE TYPNAME = 'admin_level') THEN 
-                            CREATE TYPE  admin_level AS ENUM ('lavel_1', 'lavel_2', 'lavel_3');
-                            END IF;
-                            END;
-                            $$;
-                            CREATE TABLE IF NOT EXISTS tree_data (
-                            id TEXT  PRIMARY KEY,
-                            name TEXT,
-                            project TEXT,
-                            lavel admin_level,
-                            parent TEXT REFERENCES tree_data(id)
-                            version varchar(10),
-                            sum_years float8
-                            ); 
-                            CREATE TABLE IF NOT EXISTS finans_data
-                                  (ID SERIAL  PRIMARY KEY,
-                                  year_data INT,
-                                  fin_data float8,
-                                  version varchar(10),
-                                  id_tree TEXT,
-                                  FOREIGN KEY (id_tree) REFERENCES tree_data (id) ON UPDATE CASCADE ON DELETE CASCADE
-                                  ); '''
-    # Выполнение команды: это создает новуые таблицы
-    cursor.execute(create_table_tree)
-    connection.commit()
-
-    print("Таблица успешно создана в PostgreSQL")
-    version = ''.join(str(file.filename).split('.'))
-    postgreSQL_select_Query = f'''select *
-                                        from finans_data 
-                                        where version = '{version}'
-                                        ;
-                                      '''
-    cursor.execute(postgreSQL_select_Query)
-    mobile_records = cursor.fetchall()
-    if len(mobile_records) == 0:
-
-        contents = file.file.read()
-        data = BytesIO(contents)
-        df = pd.read_csv(data, encoding='ISO-8859-1', sep='[;]', engine='python')
-        for i in range(len(df)):
-            name = df.loc[i].cod
-            project = df.loc[i].project
-            on_id = ''.join(str(file.filename).split('.')) + ''.join(name.split('.'))
-            on_lavel = name.split('.')
-            if len(on_lavel) < 2:
-                lavel = 'lavel_1'
-                parent = 'NULL'
-            elif len(on_lavel) == 2:
-                lavel = 'lavel_2'
-                parent = on_id[:-1]
-            else:
-                lavel = 'lavel_3'
-                parent = on_id[:-1]
-            on_version = ''.join(str(file.filename).split('.'))
-            try:
-                if parent == 'NULL':
-                    add_data = f"INSERT INTO tree_data (id, name, project, lavel, parent) VALUES ('{on_id}', '{name}', '{project}', '{lavel}', {parent});"
-                else:
-                    add_data = f"INSERT INTO tree_data (id, name, project, lavel, parent) VALUES ('{on_id}', '{name}', '{project}', '{lavel}', '{parent}');"
-                cursor.execute(add_data)
-                connection.commit()
-            except Exception:
-                connection.rollback()
-
-            for col, data in df.items():
-                try:
-                    key_year = int(col)
-                except Exception:
-                    continue
-                if len(col) == 4:
-                    if str(df.loc[i][col]) == 'nan':
-                        add_data_fin = f"INSERT INTO finans_data (id_tree, year_data, fin_data, version) VALUES ('{on_id}', {int(col)}, 0, '{on_version}');"
-                    else:
-                        add_data_fin = f"INSERT INTO finans_data (id_tree, year_data, fin_data, version) VALUES ('{on_id}', {int(col)}, {df.loc[i][col]}, '{on_version}');"
-                    cursor.execute(add_data_fin)
-                    connection.commit()
-        # connection.close()
-        data.close()
+async def upload_file(file: UploadFile = File(...), mode: str = Query("full", regex=UPLOAD_MODE_REGEX),
+                      connection=Depends(finans_db.get_connection)):
+    """
+    загрузка файла: потоковый разбор кусками и загрузка в БД одной транзакцией в отдельном потоке,
+    в режиме delta к загруженной версии применяются только изменения
+    """
+    def upload():
+        finans_utils.create_tables(connection)
+        return finans_utils.load_version(connection, finans_utils.read_chunks(file.file), file.filename,
+                                         mode == "delta")
+
+    try:
+        result = await run_in_threadpool(upload)
+    finally:
+        file.file.close()
+    return JSONResponse(content=result, status_code=200)
+
+
+@router.post("/jobs/upload", status_code=202)
+async def upload_file_job(file: UploadFile = File(...), mode: str = Query("full", regex=UPLOAD_MODE_REGEX)):
+    """
+    загрузка файла фоновой задачей: файл сохраняется на диск, разбор и загрузка в БД идут в пуле процессов
+    :param file:
+    :param mode: full - новая версия целиком, delta - только изменения загруженной версии
+    :return: id задачи
+    """
+    path = jobs_utils.job_path(".csv")
+
+    def save():
+        with open(path, "wb") as out:
+            shutil.copyfileobj(file.file, out)
+
+    try:
+        await run_in_threadpool(save)
+    finally:
         file.file.close()
-    return JSONResponse(content={"filename": str(file.filename)}, status_code=200)
+    try:
+        job = await run_in_threadpool(jobs_utils.submit, "upload", finans_utils.ingest_file, path, file.filename,
+                                      mode == "delta")
+    except BaseException:
+        # задача не поставлена, и файл удалить некому
+        remove(path)
+        raise
+    return JSONResponse(content=job.info(), status_code=202)
+
+
+@router.post("/jobs/export/{name_file}", status_code=202)
+async def export_file_job(name_file: str, fmt: str = Query("csv", alias="format", regex=EXPORT_FORMAT_REGEX)):
+    """
+    выгрузка свода по версии фоновой задачей
+    :param name_file:
+    :param fmt: формат выгрузки: csv, parquet, arrow, xlsx
+    :return: id задачи
+    """
+    job = await run_in_threadpool(jobs_utils.submit, "export", finans_utils.export_file, name_file, fmt)
+    return JSONResponse(content=job.info(), status_code=202)
+
+
+def get_job_or_404(job_id: str):
+    job = jobs_utils.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    состояние фоновой задачи
+    :param job_id:
+    :return:
+    """
+    job = await run_in_threadpool(get_job_or_404, job_id)
+    return job.info()
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    результат фоновой задачи: статистика загрузки или файл свода
+    :param job_id:
+    :return:
+    """
+    job = await run_in_threadpool(get_job_or_404, job_id)
+    if job.status in ("queued", "running"):
+        return JSONResponse(content=job.info(), status_code=202)
+    if job.status == "failed":
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=job.error)
+    result = job.result
+    if job.kind == "export":
+        # свод отдается из кэша выгрузок этого процесса, как в /file: файл задачи могла удалить загрузка версии
+        # или его посчитал другой сервер, поэтому при промахе свод считается заново
+        file, size, etag = await run_in_threadpool(open_export, result["version"], result["format"])
+        return export_response(file, size, etag, result["version"], result["format"])
+    return result
 
 
 @router.get("/download/{name_file}")
@@ -131,70 +138,134 @@ def download_file(name_file: str):
     return FileResponse(path=getcwd() + "/" + name_file, media_type='application/octet-stream', filename=name_file)
 
 
+def read_file(file):
+    """
+    Чтение открытого файла кусками, файл закрывается после последнего куска
+    :param file:
+    :return:
+    """
+    with file:
+        while chunk := file.read(EXPORT_CHUNK_SIZE):
+            yield chunk
+
+
+def attachment(filename: str) -> str:
+    """
+    Заголовок Content-Disposition для скачивания, как у FileResponse
+    :param filename:
+    :return:
+    """
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def open_export(version: str, fmt: str) -> tuple:
+    """
+    Открытый файл свода версии из кэша выгрузок с ошибками HTTP
+    :param version:
+    :param fmt:
+    :return: файл, размер, ETag
+    """
+    try:
+        return finans_utils.open_export(version, fmt)
+    except finans_db.UNAVAILABLE as error:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Finance database unavailable") from error
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)) from error
+
+
+def export_response(file, size: int, etag: str, version: str, fmt: str) -> StreamingResponse:
+    """
+    Отдача открытого файла свода по частям: загрузка версии может удалить его из кэша выгрузок во время ответа
+    :param file:
+    :param size:
+    :param etag:
+    :param version:
+    :param fmt:
+    :return:
+    """
+    return StreamingResponse(read_file(file), media_type=finans_settings.EXPORT_FORMATS[fmt],
+                             headers={"ETag": etag, "Content-Length": str(size),
+                                      "Content-Disposition": attachment(f"{version}.{fmt}")})
+
+
 @router.get("/file/{name_file}")
-def get_file(name_file: str):
+def get_file(name_file: str, request: Request,
+             fmt: str = Query("csv", alias="format", regex=EXPORT_FORMAT_REGEX)):
+    """
+    получение свода по версии: считается один раз для каждого формата и дальше отдается из кэша выгрузок
+    по частям, при совпадении If-None-Match - 304
+    :param name_file:
+    :param request:
+    :param fmt: формат выгрузки: csv, parquet, arrow, xlsx
+    :return:
+    """
+    version = finans_utils.file_version(name_file)
+    file, size, etag = open_export(version, fmt)
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match == "*":
+        file.close()
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return export_response(file, size, etag, version, fmt)
+
+
+@router.get("/data/{name_file}")
+def get_data(name_file: str,
+             project: Optional[str] = None,
+             lavel: Optional[str] = Query(None, regex="^lavel_[123]$"),
+             cod: Optional[str] = None,
+             year_from: Optional[int] = None,
+             year_to: Optional[int] = None,
+             rollup: bool = False,
+             limit: int = Query(finans_settings.QUERY_PAGE_LIMIT, ge=1, le=finans_settings.QUERY_PAGE_LIMIT_MAX),
+             offset: int = Query(0, ge=0),
+             connection=Depends(finans_db.get_connection)):
+    """
+    значения версии с фильтрами по проекту, уровню, коду с потомками и диапазону лет, постранично
+    :param name_file:
+    :param project:
+    :param lavel:
+    :param cod:
+    :param year_from:
+    :param year_to:
+    :param rollup: суммы поддеревьев вместо значений файла
+    :param limit:
+    :param offset:
+    :param connection:
+    :return:
+    """
+    return finans_utils.query_data(connection, finans_utils.file_version(name_file), project, lavel, cod,
+                                   year_from, year_to, rollup, limit, offset)
+
+
+@router.get("/tree/{name_file}/{cod}")
+def get_subtree(name_file: str, cod: str, children: bool = False, connection=Depends(finans_db.get_connection)):
+    """
+    суммы поддерева кода по годам и за все годы из материализованного свода
+    :param name_file:
+    :param cod: код узла, например 1.2
+    :param children: добавить суммы непосредственных потомков
+    :param connection:
+    :return:
+    """
+    subtree = finans_utils.get_subtree(connection, finans_utils.file_version(name_file), cod, children)
+    if subtree is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Code not found")
+    return subtree
+
+
+@router.post("/rollup/{name_file}")
+def rebuild_rollup(name_file: str, connection=Depends(finans_db.get_connection)):
     """
-    получение файла с сервера
+    пересчет материализованного свода версии
     :param name_file:
+    :param connection:
     :return:
     """
-    version = ''.join(name_file.split('.'))
-    df_new = pd.read_sql(f'''select 
-                                        finans_data.year_data as year,
-                                        finans_data.fin_data as finans,
-                                        tree.id,
-                                        tree.name,
-                                        tree.project,
-                                        tree.lavel,
-                                        tree.parent
-                                        from finans_data 
-                                        left join  tree_data as tree
-                                        on finans_data.id_tree = tree.id 
-                                        where finans_data.version = '{version}'
-                                        ;
-                                      ''', connection)
-    year = list(df_new.year.unique())
-    ogl = ['cod', 'project'] + year
-    cod = list(df_new.name.unique())
-    project = []
-    cod_try = []
-    for i in range(len(cod)):
-        for j in range(len(df_new)):
-            if df_new.loc[j, 'name'] == cod[i] and (not cod[i] in cod_try):
-                project.append(df_new.loc[j].project)
-                cod_try.append(cod[i])
-
-    data_year = {}
-    for i in range(len(cod)):
-        for el in year:
-            if el in data_year:
-                data_year[el].append(0)
-            else:
-                data_year[el] = [0]
-
-        if len(cod[i]) == 1:
-            for j in range(len(df_new)):
-                if cod[i] == df_new.loc[j, 'name'][0]:
-                    data_year[df_new.loc[j, 'year']][i] += df_new.loc[j, 'finans']
-        elif len(cod[i]) == 3:
-            for j in range(len(df_new)):
-                if cod[i] == df_new.loc[j, 'name'][0:3]:
-                    data_year[df_new.loc[j, 'year']][i] += df_new.loc[j, 'finans']
-        else:
-            for j in range(len(df_new)):
-                if cod[i] == df_new.loc[j, 'name']:
-                    data_year[df_new.loc[j, 'year']][i] = df_new.loc[j, 'finans']
-
-    data = {}
-    for el in ogl:
-        if el == 'cod':
-            data[el] = cod
-        elif el == 'project':
-            data[el] = project
-    data_end = data | data_year
-    df_end = pd.DataFrame(data_end)
-    df_end.to_csv('file1.csv', index=False)
-    return FileResponse(path=getcwd() + "/file1.csv")
+    return finans_utils.rebuild_rollup(connection, finans_utils.file_version(name_file))
 
 
 @router.delete("/delete/file/{name_file}")
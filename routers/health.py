@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from core import finans_db
+from core.db import engine
+from setredis import async_client
+
+# время ожидания ответа каждой зависимости при проверке готовности, в секундах
+HEALTH_TIMEOUT = float(os.environ.get("HEALTH_TIMEOUT", 2))
+
+router = APIRouter()
+
+# сбрасывается при остановке процесса, чтобы балансировщик перестал направлять в него запросы
+state = {"ready": True}
+
+
+async def check_db():
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def check_redis():
+    await async_client.ping()
+
+
+def check_finans_db():
+    with finans_db.connection():
+        pass
+
+
+async def probe(check) -> str:
+    """
+    Проверка одной зависимости с таймаутом
+    :param check: корутинная функция проверки
+    :return: ok или текст ошибки
+    """
+    try:
+        await asyncio.wait_for(check(), HEALTH_TIMEOUT)
+        return "ok"
+    except asyncio.TimeoutError:
+        return "timeout"
+    except Exception as error:
+        return repr(error)
+
+
+@router.get("/health/live")
+async def live():
+    """ Процесс жив и обслуживает цикл событий, зависимости не проверяются """
+    return {"status": "ok"}
+
+
+@router.get("/health/ready")
+async def ready():
+    """
+    Готовность принимать запросы: основная БД обязательна, redis (кэш) и БД финансов только
+    отображаются - без них приложение работает с ограничениями
+    """
+    checks = dict(zip(("db", "redis", "finans_db"), await asyncio.gather(
+        probe(check_db), probe(check_redis), probe(lambda: run_in_threadpool(check_finans_db)))))
+    is_ready = state["ready"] and checks["db"] == "ok"
+    return JSONResponse(status_code=status.HTTP_200_OK if is_ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"status": "ok" if is_ready else "unavailable", "checks": checks})
@@ -3,7 +3,7 @@ from utils import users as users_utils
 from utils.dependencies import get_current_user, get_users, get_current_user_
 from fastapi import APIRouter, Depends, HTTPException, Form, Response
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.responses import RedirectResponse, JSONResponse
 import starlette.status as status
 from fastapi.security import OAuth2PasswordBearer
@@ -15,7 +15,7 @@ router = APIRouter()
 
 
 @router.post("/", response_class=RedirectResponse)
-async def auth(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def auth(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     Обработка логина для frontend
     """
@@ -24,7 +24,7 @@ async def auth(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = D
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email")
 
-    if not users_utils.validate_password(
+    if not await users_utils.validate_password_async(
             password=form_data.password, hashed_password=user.password
     ):
         raise HTTPException(status_code=400, detail="Incorrect password")
@@ -44,14 +44,14 @@ async def auth(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = D
 
 
 @router.post("/api/login/", response_model=users.TokenBase)
-async def auth_api(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def auth_api(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """ Авторизация для API """
     user = await users_utils.get_user_by_email(form_data.username, db)
 
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email")
 
-    if not users_utils.validate_password(
+    if not await users_utils.validate_password_async(
             password=form_data.password, hashed_password=user.password
     ):
         raise HTTPException(status_code=400, detail="Incorrect password")
@@ -61,7 +61,7 @@ async def auth_api(form_data: OAuth2PasswordRequestForm = Depends(), db: Session
 
 @router.post("/create-user/", response_model=users.UserCreate)
 async def create_user(username: str = Form(), email: str = Form(), name: str = Form(), password: str = Form(),
-                      db: Session = Depends(get_db)):
+                      db: AsyncSession = Depends(get_db)):
     """ Обработка создания пользователя для frontend """
     user = users.UserCreate(username=username, email=email, name=name, password=password)
     db_user = await users_utils.check_user_by_email(user.email, user.username, db)
@@ -74,7 +74,7 @@ async def create_user(username: str = Form(), email: str = Form(), name: str = F
 
 
 @router.post("/api/sign-up/", response_model=users.UserCreate)
-async def create_user(user: users.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: users.UserCreate, db: AsyncSession = Depends(get_db)):
     db_user = await users_utils.check_user_by_email(user.email, user.username, db)
     if db_user:
         raise HTTPException(status_code=400, detail="Email or username already registered")
@@ -82,24 +82,24 @@ async def create_user(user: users.UserCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/api/users/me/", response_model=users.UserBase)
-async def read_users_me(current_user: users.User = Depends(get_current_user_), db: Session = Depends(get_db)):
+async def read_users_me(current_user: users.User = Depends(get_current_user_), db: AsyncSession = Depends(get_db)):
     """ API получения информации о пользователе по авторизованому токену """
     return current_user
 
 
 @router.get("/api/users/all/", response_model=List[users.UserBase])
-async def read_users_me(current_user: users.User = Depends(get_current_user_), db: Session = Depends(get_db)):
+async def read_users_me(current_user: users.User = Depends(get_current_user_), db: AsyncSession = Depends(get_db)):
     """ API получения информации о всех пользователях по авторизованому токену """
     return await users_utils.get_users(db)
 
 
 @router.get("/api/users/me/{token}", response_model=users.UserBase)
-async def read_users_token(token: str, db: Session = Depends(get_db)):
+async def read_users_token(token: str, db: AsyncSession = Depends(get_db)):
     """ API получение информации о себе по токену в заголовке """
     return await get_current_user(token, db)
 
 
 @router.get("/api/users/{token}", response_model=List[users.UserBase])
-async def read_users_all_token(token: str, db: Session = Depends(get_db)):
+async def read_users_all_token(token: str, db: AsyncSession = Depends(get_db)):
     """ API получение информации по всем пользователям по токену в заголовке """
     return await get_users(token, db)
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio as aioredis
 import os
 
 local = os.environ.get("LOCAL")
@@ -8,3 +9,5 @@ else:
     redis_hosting = 'my_blog_redis'
 
 client = redis.Redis(host=redis_hosting)
+# асинхронный клиент для кэша приложения (aioredis вошел в redis-py как redis.asyncio)
+async_client = aioredis.Redis(host=redis_hosting)
@@ -0,0 +1,160 @@
+import os
+import uuid
+
+import pytest
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# тесты с БД блога работают с отдельной БД DB_TEST, чтобы не менять данные разработки.
+# Подменяется до импорта core.db, который читает DB_NAME при импорте
+load_dotenv(os.path.join(ROOT, '.env'))
+if os.environ.get("DB_TEST"):
+    os.environ["DB_NAME"] = os.environ["DB_TEST"]
+
+from core import finans_db  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def blog_database():
+    """
+    БД блога DB_TEST, созданная при необходимости и обновленная миграциями alembic.
+    Тест пропускается, если DB_TEST не задана или сервер БД недоступен
+    :return: синхронный URL БД
+    """
+    if not os.environ.get("DB_TEST"):
+        pytest.skip("DB_TEST is not configured")
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy_utils import create_database, database_exists
+
+    from core.db import SQLALCHEMY_DATABASE_URL
+
+    try:
+        if not database_exists(SQLALCHEMY_DATABASE_URL):
+            create_database(SQLALCHEMY_DATABASE_URL, encoding="utf8", template="template0")
+    except OperationalError as error:
+        pytest.skip(f"blog database unavailable: {error}")
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    command.upgrade(config, "head")
+    return SQLALCHEMY_DATABASE_URL
+
+
+@pytest.fixture(scope="session")
+def blog_engine(blog_database):
+    """
+    Синхронный движок БД блога
+    :param blog_database:
+    :return:
+    """
+    from sqlalchemy import create_engine
+
+    engine = create_engine(blog_database)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def finans_connection():
+    """
+    Соединение с БД финансов, тест пропускается, если БД недоступна
+    :return:
+    """
+    from utils import finans as finans_utils
+
+    try:
+        pool = finans_db.get_pool()
+        conn = pool.getconn()
+    except finans_db.UNAVAILABLE as error:
+        pytest.skip(f"finance database unavailable: {error}")
+    try:
+        finans_utils.create_tables(conn)
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+@pytest.fixture
+def finans_version(finans_connection):
+    """
+    Уникальная версия для теста, ее данные удаляются после теста
+    :param finans_connection:
+    :return:
+    """
+    from utils import finans as finans_utils
+
+    version = "t" + uuid.uuid4().hex[:9]
+    yield version
+    with finans_connection:
+        with finans_connection.cursor() as cursor:
+            cursor.execute("DELETE FROM tree_data WHERE version = %s", (version,))
+    finans_utils.invalidate_export(version)
+
+
+@pytest.fixture(scope="session")
+def client(blog_database):
+    """
+    Клиент приложения с БД DB_TEST, события startup/shutdown выполняются один раз на все тесты
+    :param blog_database:
+    :return:
+    """
+    from fastapi.testclient import TestClient
+
+    from app import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_user(client, blog_engine):
+    """
+    Создание пользователя: id, почта и токен в том виде, в котором он хранится в cookie bearer
+    :param client:
+    :param blog_engine:
+    :return: функция без аргументов
+    """
+    from sqlalchemy import text
+
+    def make():
+        name = "t" + uuid.uuid4().hex[:12]
+        response = client.post("/api/sign-up/", json={"username": name, "email": f"{name}@example.com",
+                                                      "name": name, "password": "password"})
+        assert response.status_code == 200, response.text
+        login = client.post("/api/login/", data={"username": f"{name}@example.com", "password": "password"})
+        assert login.status_code == 200, login.text
+        with blog_engine.connect() as connection:
+            user_id = connection.execute(text("SELECT id FROM users WHERE username = :name"),
+                                         {"name": name}).scalar()
+        return {"id": str(user_id), "email": f"{name}@example.com",
+                "token": login.json()["access_token"].replace("-", "")}
+
+    return make
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user()
+
+
+@pytest.fixture
+def make_post(client, blog_engine):
+    """
+    Создание поста пользователем через API
+    :param client:
+    :param blog_engine:
+    :return: функция (пользователь, текст) -> id поста
+    """
+    from sqlalchemy import text
+
+    def make(author: dict, posts_text: str = "post") -> str:
+        response = client.post("/api/posts", json={"posts_text": posts_text},
+                               headers={"Authorization": f"Bearer {author['token']}"})
+        assert response.status_code == 201, response.text
+        with blog_engine.connect() as connection:
+            return str(connection.execute(text("SELECT id FROM users_posts WHERE user_id = :user_id "
+                                               "ORDER BY dt_created DESC LIMIT 1"), {"user_id": author["id"]}).scalar())
+
+    return make
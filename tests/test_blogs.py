@@ -0,0 +1,217 @@
+import base64
+from datetime import datetime
+from uuid import UUID, uuid4
+
+import pytest
+from sqlalchemy import text
+
+from core import tracing
+from utils import blogs as post_utils
+
+
+def feed(client, limit: int, cursor: str = None) -> dict:
+    params = {"limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    response = client.get("/api/posts", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_cursor_round_trip():
+    dt_created, post_id = datetime(2023, 1, 2, 3, 4, 5, 678901), uuid4()
+    cursor = post_utils.encode_cursor(dt_created, post_id)
+    assert "=" not in cursor
+    assert post_utils.decode_cursor(cursor) == (dt_created, post_id)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b"2023-01-02T03:04:05").decode(),
+    base64.urlsafe_b64encode(b"yesterday|" + str(uuid4()).encode()).decode(),
+    base64.urlsafe_b64encode(b"2023-01-02T03:04:05|not-a-uuid").decode(),
+])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        post_utils.decode_cursor(cursor)
+
+
+def test_invalid_cursor_returns_400(client):
+    response = client.get("/api/posts", params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_keyset_pages(client, user, make_post):
+    created = [make_post(user, f"page {number}") for number in range(5)]
+    first = feed(client, 2)
+    assert [post["id"] for post in first["results"]] == created[:-3:-1]
+    # новый пост между страницами не сдвигает следующую страницу, в отличие от OFFSET
+    make_post(user, "between pages")
+    second = feed(client, 2, first["next_cursor"])
+    assert [post["id"] for post in second["results"]] == created[-3:-5:-1]
+
+
+def test_keyset_walks_whole_feed(client, user, make_post):
+    for number in range(3):
+        make_post(user, f"walk {number}")
+    seen, cursor = [], None
+    while True:
+        page = feed(client, 7, cursor)
+        seen.extend((datetime.fromisoformat(post["dt_created"]), post["id"]) for post in page["results"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == page["total_count"]
+    assert seen == sorted(seen, reverse=True)
+
+
+def like(client, author: dict, post_id: str, value: bool = True):
+    return client.post(f"/api/like/{post_id}", json={"like": value},
+                       headers={"Authorization": f"Bearer {author['token']}"})
+
+
+def like_rows(blog_engine, post_id: str) -> list:
+    with blog_engine.connect() as connection:
+        return connection.execute(text("SELECT user_id, likes_on FROM likes WHERE post_id = :post_id"),
+                                  {"post_id": post_id}).all()
+
+
+def test_like_single_statement(client, user, make_user, make_post, blog_engine):
+    post_id, reader = make_post(user), make_user()
+    # токен читателя уже в кэше токенов, считается только простановка лайка
+    client.get("/api/users/me/", headers={"Authorization": f"Bearer {reader['token']}"})
+    with tracing.query_budget(1, "like") as counter:
+        response = like(client, reader, post_id)
+    assert response.status_code == 201, response.text
+    assert counter.queries == 1
+    assert response.json()["like_count"] == 1 and response.json()["dislike_count"] == 0
+    assert like_rows(blog_engine, post_id) == [(UUID(reader["id"]), True)]
+
+
+def test_dislike_counter(client, user, make_user, make_post):
+    post_id = make_post(user)
+    response = like(client, make_user(), post_id, False)
+    assert response.status_code == 201
+    assert response.json()["like_count"] == 0 and response.json()["dislike_count"] == 1
+
+
+def test_duplicate_like(client, user, make_user, make_post, blog_engine):
+    post_id, reader = make_post(user), make_user()
+    assert like(client, reader, post_id).status_code == 201
+    response = like(client, reader, post_id, False)
+    assert response.status_code == 403
+    assert response.json() == {"detail": "You don't like this post more one"}
+    assert like_rows(blog_engine, post_id) == [(UUID(reader["id"]), True)]
+    with blog_engine.connect() as connection:
+        counters = connection.execute(text("SELECT like_count, dislike_count FROM users_posts WHERE id = :post_id"),
+                                      {"post_id": post_id}).one()
+    assert tuple(counters) == (1, 0)
+
+
+def test_self_like(client, user, make_post, blog_engine):
+    post_id = make_post(user)
+    response = like(client, user, post_id)
+    assert response.status_code == 403
+    assert response.json() == {"detail": "You don't like self post"}
+    assert like_rows(blog_engine, post_id) == []
+
+
+def test_like_missing_post(client, user, blog_engine):
+    post_id = str(uuid4())
+    response = like(client, user, post_id)
+    assert response.status_code == 403
+    assert response.json() == {"detail": "This isn't post"}
+    assert like_rows(blog_engine, post_id) == []
+
+
+def search(client, q: str, limit: int = 100, cursor: str = None) -> dict:
+    params = {"q": q, "limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    response = client.get("/api/posts/search", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def word() -> str:
+    """ Слово, которого нет в постах других тестов """
+    return "w" + uuid4().hex[:12]
+
+
+def test_search_cursor_round_trip():
+    rank, dt_created, post_id = 0.1, datetime(2023, 1, 2, 3, 4, 5, 678901), uuid4()
+    cursor = post_utils.encode_search_cursor(rank, dt_created, post_id)
+    assert post_utils.decode_search_cursor(cursor) == (rank, dt_created, post_id)
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        post_utils.decode_search_cursor(post_utils.encode_cursor(dt_created, post_id))
+
+
+def test_search_rank_order(client, user, make_post):
+    term = word()
+    once = make_post(user, f"{term} and other words in a rather long post")
+    twice = make_post(user, f"{term} {term} here")
+    thrice = make_post(user, f"{term} {term} {term}")
+    results = search(client, term)["results"]
+    assert [post["id"] for post in results] == [thrice, twice, once]
+    assert results[0]["rank"] > results[1]["rank"] > results[2]["rank"]
+
+
+def test_search_phrase_and_negation(client, user, make_post):
+    first, second = word(), word()
+    phrase = make_post(user, f"{first} {second}")
+    reversed_phrase = make_post(user, f"{second} {first}")
+    alone = make_post(user, f"{first} only")
+    assert {post["id"] for post in search(client, f"{first} {second}")["results"]} == {phrase, reversed_phrase}
+    assert [post["id"] for post in search(client, f'"{first} {second}"')["results"]] == [phrase]
+    assert [post["id"] for post in search(client, f"{first} -{second}")["results"]] == [alone]
+    assert {post["id"] for post in search(client, f"{second} or missing{first}")["results"]} == {
+        phrase, reversed_phrase}
+
+
+@pytest.mark.parametrize("q", [" ", "-", "!!!", '""'])
+def test_search_without_lexemes(client, q):
+    assert search(client, q) == {"results": [], "next_cursor": None}
+
+
+def test_search_empty_query_rejected(client):
+    assert client.get("/api/posts/search", params={"q": ""}).status_code == 422
+
+
+def test_search_invalid_cursor_returns_400(client):
+    response = client.get("/api/posts/search", params={"q": "post", "cursor": "not a cursor"})
+    assert response.status_code == 400
+
+
+def test_search_keyset_pages(client, user, make_post):
+    term = word()
+    ids = [make_post(user, f"{term} {'x ' * (number % 3)}") for number in range(7)]
+    everything = search(client, term)["results"]
+    assert sorted(post["id"] for post in everything) == sorted(ids)
+    pages, cursor = [], None
+    while True:
+        page = search(client, term, limit=3, cursor=cursor)
+        pages.append([post["id"] for post in page["results"]])
+        if page["next_cursor"] is None:
+            break
+        cursor = page["next_cursor"]
+        if len(pages) == 1:
+            # новый пост с тем же рангом выше по дате и не сдвигает следующие страницы
+            make_post(user, term)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [post_id for page in pages for post_id in page] == [post["id"] for post in everything]
+
+
+def test_search_page(client, user, make_post):
+    term = word()
+    for _ in range(21):
+        make_post(user, term)
+    headers = {"Cookie": f"bearer={user['token']}"}
+    response = client.get("/blogs/search/", params={"q": term}, headers=headers)
+    assert response.status_code == 200
+    assert response.text.count(f"Блог - {term}") == post_utils.POSTS_PAGE_LIMIT
+    cursor = search(client, term, limit=post_utils.POSTS_PAGE_LIMIT)["next_cursor"]
+    assert f"/blogs/search/?q={term}&cursor={cursor}" in response.text
+    response = client.get("/blogs/search/", params={"q": term, "cursor": cursor}, headers=headers)
+    assert response.text.count(f"Блог - {term}") == 1
+    assert "cursor=" not in response.text
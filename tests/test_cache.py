@@ -0,0 +1,143 @@
+import asyncio
+import uuid
+
+import pytest
+import redis
+import redis.asyncio as aioredis
+
+import setredis
+from utils import blogs, cache
+
+
+@pytest.fixture
+def redis_cache(monkeypatch):
+    """
+    Кэш на своем клиенте redis и со своим префиксом ключей, тест пропускается, если redis недоступен
+    :param monkeypatch:
+    :return: синхронный клиент для проверки ключей
+    """
+    client = redis.Redis(host=setredis.redis_hosting, socket_connect_timeout=1)
+    try:
+        client.ping()
+    except redis.RedisError as error:
+        pytest.skip(f"redis unavailable: {error}")
+    prefix = f"test:{uuid.uuid4().hex}:"
+    monkeypatch.setattr(cache, "CACHE_PREFIX", prefix)
+    yield client
+    keys = list(client.scan_iter(f"{prefix}*"))
+    if keys:
+        client.delete(*keys)
+    client.close()
+
+
+def run(coroutine_function):
+    """ Выполнение корутины с новым клиентом redis, привязанным к своему циклу событий """
+    async def call():
+        client = aioredis.Redis(host=setredis.redis_hosting)
+        cache.async_client = client
+        try:
+            return await coroutine_function()
+        finally:
+            await client.close()
+
+    original = cache.async_client
+    try:
+        return asyncio.run(call())
+    finally:
+        cache.async_client = original
+
+
+def test_counter_loaded_once_and_incremented(redis_cache):
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return 10
+
+    async def scenario():
+        first = await cache.counter("posts:count", loader)
+        await cache.incr("posts:count", 2)
+        await cache.incr("posts:count", -1)
+        return first, await cache.counter("posts:count", loader)
+
+    assert run(scenario) == (10, 11)
+    assert len(loads) == 1
+
+
+def test_incr_without_counter(redis_cache):
+    async def scenario():
+        await cache.incr("posts:likes", 1)
+
+    run(scenario)
+    assert redis_cache.get(f"{cache.CACHE_PREFIX}posts:likes") is None
+
+
+@pytest.fixture
+def cache_calls(monkeypatch):
+    """
+    Вызовы invalidate и incr модуля cache из utils.blogs
+    :param monkeypatch:
+    :return: список (функция, аргументы)
+    """
+    calls = []
+    invalidate, incr = cache.invalidate, cache.incr
+
+    async def record_invalidate(*tags):
+        calls.append(("invalidate", tags))
+        await invalidate(*tags)
+
+    async def record_incr(key, amount):
+        calls.append(("incr", (key, amount)))
+        await incr(key, amount)
+
+    monkeypatch.setattr(blogs.cache, "invalidate", record_invalidate)
+    monkeypatch.setattr(blogs.cache, "incr", record_incr)
+    return calls
+
+
+def test_like_keeps_global_counters(client, make_user, make_post, cache_calls):
+    author, reader = make_user(), make_user()
+    post_id = make_post(author)
+    cache_calls.clear()
+    response = client.post(f"/api/like/{post_id}", json={"like": True},
+                           headers={"Authorization": f"Bearer {reader['token']}"})
+    assert response.status_code == 201, response.text
+    assert cache_calls == [("invalidate", (f"post:{post_id}", f"user:{author['id']}")),
+                           ("incr", ("posts:likes", 1))]
+
+
+def test_post_create_and_delete_update_counters(client, user, make_user, make_post, cache_calls):
+    post_id = make_post(user)
+    assert cache_calls == [("invalidate", (f"user:{user['id']}",)), ("incr", ("posts:count", 1))]
+    reader = make_user()
+    client.post(f"/api/like/{post_id}", json={"like": True}, headers={"Authorization": f"Bearer {reader['token']}"})
+    cache_calls.clear()
+    response = client.delete(f"/api/del-posts/{post_id}", headers={"Authorization": f"Bearer {user['token']}"})
+    assert response.status_code == 200, response.text
+    assert cache_calls == [("invalidate", (f"post:{post_id}", f"user:{user['id']}")),
+                           ("incr", ("posts:count", -1)), ("incr", ("posts:likes", -1))]
+
+
+def test_tags_use_canonical_uuid():
+    user_id = uuid.uuid4()
+    for spelling in (user_id, str(user_id), str(user_id).upper(), user_id.hex, f"{{{user_id}}}"):
+        assert blogs.user_tag(spelling) == f"user:{user_id}"
+        assert blogs.post_tag(spelling) == f"post:{user_id}"
+    assert blogs.user_tag("not-a-uuid") == "user:not-a-uuid"
+
+
+def test_noncanonical_ids_invalidate_canonical_tags(client, user, blog_engine, cache_calls):
+    from sqlalchemy import text
+
+    # Postgres принимает id в верхнем регистре и без дефисов, теги кэша должны быть теми же
+    response = client.post(f"/api/posts/user/{user['id'].upper()}", json={"posts_text": "post"})
+    assert response.status_code == 201, response.text
+    assert cache_calls[0] == ("invalidate", (f"user:{user['id']}",))
+    with blog_engine.connect() as connection:
+        post_id = str(connection.execute(text("SELECT id FROM users_posts WHERE user_id = :user_id"),
+                                         {"user_id": user["id"]}).scalar())
+    cache_calls.clear()
+    response = client.put(f"/api/edit-posts/{uuid.UUID(user['id']).hex}/{post_id.upper()}",
+                          json={"posts_text": "edited"})
+    assert response.status_code == 200, response.text
+    assert cache_calls == [("invalidate", (f"post:{post_id}", f"user:{user['id']}"))]
@@ -0,0 +1,336 @@
+import os
+from io import StringIO
+
+import pandas as pd
+import pytest
+
+from utils import finans as finans_utils
+
+# файл, в котором все коды похожи на числа: без dtype pandas читает их как float
+NUMERIC_CODES = "cod;project;2022;2023\n1;NA;1;2\n1.1;P11;3;\n1.10;P110;4;5\n2;P2;1;1\n"
+
+
+def read_file(text: str, chunk_rows: int = 2) -> list:
+    return list(finans_utils.read_chunks(StringIO(text), chunk_rows))
+
+
+def test_read_chunks_keeps_numeric_codes():
+    df = pd.concat(read_file(NUMERIC_CODES), ignore_index=True)
+    assert df['cod'].tolist() == ['1', '1.1', '1.10', '2']
+    assert df['project'].tolist() == ['NA', 'P11', 'P110', 'P2']
+
+
+def test_build_tree_numeric_codes():
+    chunks = read_file(NUMERIC_CODES)
+    tree = pd.concat([finans_utils.build_tree(chunk, 'v') for chunk in chunks], ignore_index=True)
+    assert tree['id'].tolist() == ['v1', 'v11', 'v110', 'v2']
+    assert tree['parent'].tolist() == [None, 'v1', 'v1', None]
+    assert tree['lavel'].tolist() == ['lavel_1', 'lavel_2', 'lavel_2', 'lavel_1']
+
+
+def test_build_finans_empty_values():
+    chunk = read_file(NUMERIC_CODES, chunk_rows=4)[0]
+    finans = finans_utils.build_finans(chunk, finans_utils.build_tree(chunk, 'v'), 'v')
+    assert finans['fin_data'].tolist() == [1, 2, 3, 0, 4, 5, 1, 1]
+
+
+def test_load_version_numeric_codes(finans_connection, finans_version):
+    result = finans_utils.load_version(finans_connection, read_file(NUMERIC_CODES), finans_version)
+    assert result["loaded"] and result["tree_rows"] == 4 and result["finans_rows"] == 8
+    with finans_connection.cursor() as cursor:
+        cursor.execute("SELECT name, parent FROM tree_data WHERE version = %s ORDER BY name", (finans_version,))
+        rows = cursor.fetchall()
+    finans_connection.rollback()
+    assert rows == [('1', None), ('1.1', finans_version + '1'), ('1.10', finans_version + '1'), ('2', None)]
+
+
+def test_open_export_survives_invalidation(finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(NUMERIC_CODES), finans_version)
+    file, size, etag = finans_utils.open_export(finans_version)
+    # загрузка версии удаляет свод из кэша выгрузок, пока файл отдается клиенту
+    finans_utils.invalidate_export(finans_version)
+    with file:
+        content = file.read()
+    assert len(content) == size
+    assert content == b"cod,project,2022,2023\n1,NA,8.0,7.0\n1.1,P11,3.0,0.0\n1.10,P110,4.0,5.0\n2,P2,1.0,1.0\n"
+    assert finans_version not in finans_utils._export_locks
+    file, _, _ = finans_utils.open_export(finans_version)
+    file.close()
+
+
+@pytest.fixture
+def finans_client():
+    """
+    Клиент приложения только с роутером финансов
+    :return:
+    """
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from routers import finans
+
+    app = FastAPI()
+    app.include_router(finans.router)
+    return TestClient(app)
+
+
+def test_get_file_etag(finans_client, finans_connection, finans_version):
+    client = finans_client
+    finans_utils.load_version(finans_connection, read_file(NUMERIC_CODES), finans_version)
+    response = client.get(f"/file/{finans_version}")
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == f'attachment; filename="{finans_version}.csv"'
+    assert int(response.headers["content-length"]) == len(response.content)
+    cached = client.get(f"/file/{finans_version}", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+
+def expected_rollup(connection, version: str) -> pd.DataFrame:
+    """ Свод версии из tree_rollup с именами колонок-лет строками, как в файлах выгрузки """
+    df = finans_utils.read_rollup(connection, version)
+    connection.rollback()
+    return df.set_axis([str(col) for col in df.columns], axis=1)
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_get_file_arrow_formats(finans_client, finans_connection, finans_version, fmt):
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    finans_utils.load_version(finans_connection, read_file(NUMERIC_CODES), finans_version)
+    response = finans_client.get(f"/file/{finans_version}", params={"format": fmt})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == finans_utils.EXPORT_FORMATS[fmt]
+    assert response.headers["content-disposition"] == f'attachment; filename="{finans_version}.{fmt}"'
+    source = pa.BufferReader(response.content)
+    table = pq.read_table(source) if fmt == "parquet" else feather.read_table(source)
+    pd.testing.assert_frame_equal(table.to_pandas(), expected_rollup(finans_connection, finans_version))
+
+
+def test_get_file_xlsx(finans_client, finans_connection, finans_version):
+    from io import BytesIO
+
+    finans_utils.load_version(finans_connection, read_file(NUMERIC_CODES), finans_version)
+    response = finans_client.get(f"/file/{finans_version}", params={"format": "xlsx"})
+    assert response.status_code == 200
+    df = pd.read_excel(BytesIO(response.content), header=None, dtype=str, engine="openpyxl")
+    assert df.iloc[0].tolist() == ["cod", "project", "2022", "2023"]
+    assert df[0].tolist()[1:] == ["1", "1.1", "1.10", "2"]
+
+
+def test_get_file_xlsx_too_many_rows(finans_client, finans_connection, finans_version, monkeypatch):
+    finans_utils.load_version(finans_connection, read_file(NUMERIC_CODES), finans_version)
+    monkeypatch.setattr(finans_utils, "XLSX_MAX_ROWS", 3)
+    response = finans_client.get(f"/file/{finans_version}", params={"format": "xlsx"})
+    assert response.status_code == 400
+    assert "Too many rows" in response.json()["detail"]
+    assert not os.path.exists(finans_utils.export_path(finans_version, "xlsx"))
+    assert not [name for name in os.listdir(finans_utils.FINANS_EXPORT_DIR) if finans_version in name]
+
+
+def test_get_file_unknown_format(finans_client):
+    assert finans_client.get("/file/v", params={"format": "txt"}).status_code == 422
+
+
+# изменения к NUMERIC_CODES: переименован проект 1.1 и изменено его значение за 2023,
+# удален узел 1.10, добавлен узел 3
+DELTA = "cod;project;2022;2023\n1;NA;1;2\n1.1;P11 new;3;7\n2;P2;1;1\n3;P3;5;6\n"
+
+
+def test_delta_applies_only_changes(finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(NUMERIC_CODES), finans_version)
+    result = finans_utils.load_version(finans_connection, read_file(DELTA), finans_version, delta=True)
+    assert result["mode"] == "delta"
+    assert {key: result[key] for key in ("tree_changed", "tree_removed", "cells_added", "cells_changed",
+                                         "cells_removed")} == {"tree_changed": 2, "tree_removed": 1,
+                                                               "cells_added": 2, "cells_changed": 1,
+                                                               "cells_removed": 2}
+    rollup = finans_utils.read_rollup(finans_connection, finans_version)
+    finans_connection.rollback()
+    assert rollup.values.tolist() == [['1', 'NA', 4.0, 9.0], ['1.1', 'P11 new', 3.0, 7.0], ['2', 'P2', 1.0, 1.0],
+                                      ['3', 'P3', 5.0, 6.0]]
+
+
+def test_delta_without_changes(finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(NUMERIC_CODES), finans_version)
+    with finans_connection.cursor() as cursor:
+        cursor.execute("SELECT id, fin_data FROM finans_data WHERE version = %s ORDER BY id", (finans_version,))
+        before = cursor.fetchall()
+    finans_connection.rollback()
+    result = finans_utils.load_version(finans_connection, read_file(NUMERIC_CODES), finans_version, delta=True)
+    assert not any(result[key] for key in ("tree_changed", "tree_removed", "cells_added", "cells_changed",
+                                           "cells_removed"))
+    assert "rollup_rows" not in result
+    with finans_connection.cursor() as cursor:
+        cursor.execute("SELECT id, fin_data FROM finans_data WHERE version = %s ORDER BY id", (finans_version,))
+        assert cursor.fetchall() == before
+    finans_connection.rollback()
+
+
+def frame(rows: list) -> pd.DataFrame:
+    """ DataFrame как у read_version из строк (id, parent, год, значение) """
+    df = pd.DataFrame(rows, columns=['id', 'parent', 'year', 'finans'])
+    df['name'] = df['id']
+    df['project'] = 'P'
+    return df
+
+
+def test_subtree_sums_three_levels():
+    df = frame([
+        ('a', None, 2022, 1.0), ('a', None, 2023, 2.0),
+        ('b', 'a', 2022, 10.0), ('b', 'a', 2023, 20.0),
+        ('c', 'b', 2022, 100.0), ('c', 'b', 2023, None),
+        ('d', 'a', 2022, 1000.0),
+        ('e', None, 2023, 5.0),
+    ])
+    sums = finans_utils.subtree_sums(df)
+    assert sums.loc['a'].tolist() == [1111.0, 22.0]
+    assert sums.loc['b'].tolist() == [110.0, 20.0]
+    assert sums.loc['c'].tolist() == [100.0, 0.0]
+    assert sums.loc['d'].tolist() == [1000.0, 0.0]
+    assert sums.loc['e'].tolist() == [0.0, 5.0]
+
+
+def test_subtree_sums_parent_outside_version():
+    df = frame([('b', 'missing', 2022, 1.0), ('c', 'b', 2022, 2.0)])
+    assert finans_utils.subtree_sums(df)[2022].to_dict() == {'b': 3.0, 'c': 2.0}
+
+
+def test_subtree_sums_cycle_terminates():
+    df = frame([('a', 'b', 2022, 1.0), ('b', 'a', 2022, 2.0)])
+    sums = finans_utils.subtree_sums(df)
+    assert sums.shape == (2, 1)
+
+
+def test_rollup_keeps_file_order():
+    df = frame([('b', 'a', 2023, 2.0), ('a', None, 2023, 1.0), ('a', None, 2022, 4.0)])
+    result = finans_utils.rollup(df)
+    assert result.columns.tolist() == ['cod', 'project', 2023, 2022]
+    assert result.values.tolist() == [['b', 'P', 2.0, 0.0], ['a', 'P', 3.0, 4.0]]
+
+
+# дерево из трех уровней: 1 -> 1.1 -> 1.1.1, 1.1.2; 1 -> 1.2; 2
+TREE = "cod;project;2022;2023\n1;A;1;2\n1.1;B;3;4\n1.1.1;C;5;\n1.1.2;D;7;8\n1.2;E;;1\n2;F;9;9\n"
+
+
+def test_materialized_rollup_matches_pandas(finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(TREE), finans_version)
+    materialized = finans_utils.read_rollup(finans_connection, finans_version)
+    computed = finans_utils.rollup(finans_utils.read_version(finans_connection, finans_version))
+    finans_connection.rollback()
+    assert materialized.values.tolist() == computed.values.tolist()
+    assert materialized.values.tolist()[0] == ['1', 'A', 16.0, 15.0]
+
+
+def test_get_subtree_unknown_cod(finans_client, finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(TREE), finans_version)
+    assert finans_utils.get_subtree(finans_connection, finans_version, "3") is None
+    response = finans_client.get(f"/tree/{finans_version}/1.3")
+    assert response.status_code == 404
+
+
+def test_get_subtree_matches_subtree_sums(finans_client, finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(TREE), finans_version)
+    sums = finans_utils.subtree_sums(finans_utils.read_version(finans_connection, finans_version))
+    finans_connection.rollback()
+    for cod in ("1", "1.1", "1.1.1", "1.2", "2"):
+        expected = sums.loc[finans_version + cod.replace(".", "")]
+        response = finans_client.get(f"/tree/{finans_version}/{cod}")
+        assert response.status_code == 200
+        subtree = response.json()
+        assert subtree["cod"] == cod
+        assert subtree["years"] == {str(year): total for year, total in expected.items()}
+        assert subtree["total"] == expected.sum()
+        assert "children" not in subtree
+
+
+def test_get_subtree_children(finans_client, finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(TREE), finans_version)
+    subtree = finans_client.get(f"/tree/{finans_version}/1", params={"children": True}).json()
+    assert subtree["total"] == 31.0
+    assert subtree["children"] == [
+        {"cod": "1.1", "project": "B", "lavel": "lavel_2", "total": 27.0},
+        {"cod": "1.2", "project": "E", "lavel": "lavel_2", "total": 1.0},
+    ]
+    leaf = finans_client.get(f"/tree/{finans_version}/1.1.2", params={"children": True}).json()
+    assert leaf["children"] == []
+
+
+# коды с _ и x на месте друг друга: фильтр по коду 1_1 не должен совпасть с 1x1 через LIKE
+QUERY = ("cod;project;2021;2022;2023\n1;A;1;2;3\n1.1;B;10;20;30\n1.1.1;C;100;200;300\n"
+         "1_1;D;4;5;6\n1_1.1;E;7;8;9\n1x1;F;1;1;1\n1x1.1;D;2;2;2\n")
+
+
+def query_cods(connection, version: str, **filters) -> list:
+    page = finans_utils.query_data(connection, version, limit=1000, **filters)
+    return sorted({item["cod"] for item in page["items"]})
+
+
+def test_query_data_filters(finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(QUERY), finans_version)
+    assert query_cods(finans_connection, finans_version, project="D") == ["1_1", "1x1.1"]
+    assert query_cods(finans_connection, finans_version, lavel="lavel_2") == ["1.1", "1_1.1", "1x1.1"]
+    assert query_cods(finans_connection, finans_version, lavel="lavel_3") == ["1.1.1"]
+    assert query_cods(finans_connection, finans_version, project="D", lavel="lavel_1") == ["1_1"]
+    assert query_cods(finans_connection, finans_version, project="missing") == []
+
+
+def test_query_data_cod_prefix(finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(QUERY), finans_version)
+    assert query_cods(finans_connection, finans_version, cod="1") == ["1", "1.1", "1.1.1"]
+    assert query_cods(finans_connection, finans_version, cod="1.1") == ["1.1", "1.1.1"]
+    # _ и % в коде - обычные символы, а не шаблоны LIKE
+    assert query_cods(finans_connection, finans_version, cod="1_1") == ["1_1", "1_1.1"]
+    assert query_cods(finans_connection, finans_version, cod="1%") == []
+    assert query_cods(finans_connection, finans_version, cod="1\\") == []
+
+
+def test_query_data_years(finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(QUERY), finans_version)
+    page = finans_utils.query_data(finans_connection, finans_version, cod="1.1.1", year_from=2022)
+    assert [(item["year"], item["value"]) for item in page["items"]] == [(2022, 200.0), (2023, 300.0)]
+    page = finans_utils.query_data(finans_connection, finans_version, cod="1.1.1", year_to=2021)
+    assert [(item["year"], item["value"]) for item in page["items"]] == [(2021, 100.0)]
+    page = finans_utils.query_data(finans_connection, finans_version, year_from=2022, year_to=2022)
+    assert {item["year"] for item in page["items"]} == {2022} and len(page["items"]) == 7
+
+
+def test_query_data_rollup(finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(QUERY), finans_version)
+    page = finans_utils.query_data(finans_connection, finans_version, cod="1", rollup=True)
+    assert [(item["cod"], item["year"], item["value"]) for item in page["items"]] == [
+        ("1", 2021, 111.0), ("1", 2022, 222.0), ("1", 2023, 333.0),
+        ("1.1", 2021, 110.0), ("1.1", 2022, 220.0), ("1.1", 2023, 330.0),
+        ("1.1.1", 2021, 100.0), ("1.1.1", 2022, 200.0), ("1.1.1", 2023, 300.0),
+    ]
+    page = finans_utils.query_data(finans_connection, finans_version, cod="1_1", year_from=2023, rollup=True)
+    assert [(item["cod"], item["value"]) for item in page["items"]] == [("1_1", 15.0), ("1_1.1", 9.0)]
+
+
+def test_query_data_paging(finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(QUERY), finans_version)
+    everything = finans_utils.query_data(finans_connection, finans_version, limit=1000)
+    assert len(everything["items"]) == 21 and everything["next_offset"] is None
+    items, offset = [], 0
+    while offset is not None:
+        page = finans_utils.query_data(finans_connection, finans_version, limit=5, offset=offset)
+        assert len(page["items"]) <= 5
+        items.extend(page["items"])
+        offset = page["next_offset"]
+    assert items == everything["items"]
+    last = finans_utils.query_data(finans_connection, finans_version, limit=7, offset=14)
+    assert len(last["items"]) == 7 and last["next_offset"] is None
+
+
+def test_get_data_route(finans_client, finans_connection, finans_version):
+    finans_utils.load_version(finans_connection, read_file(QUERY), finans_version)
+    response = finans_client.get(f"/data/{finans_version}", params={"cod": "1_1", "lavel": "lavel_2",
+                                                                    "year_from": 2022, "limit": 1})
+    assert response.status_code == 200
+    page = response.json()
+    assert page["items"] == [{"cod": "1_1.1", "project": "E", "lavel": "lavel_2", "year": 2022, "value": 8.0}]
+    assert page["next_offset"] == 1
+    assert finans_client.get(f"/data/{finans_version}", params={"lavel": "lavel_4"}).status_code == 422
+    assert finans_client.get(f"/data/{finans_version}", params={"limit": 100000}).status_code == 422
+    assert finans_client.get(f"/data/{finans_version}", params={"offset": -1}).status_code == 422
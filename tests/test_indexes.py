@@ -0,0 +1,94 @@
+"""
+Планы горячих запросов utils.blogs и utils.users: каждый запрос должен читать
+users_posts, likes и tokens по индексу, а не полным просмотром таблицы.
+
+Запросы разбираются через EXPLAIN с enable_seqscan = off, поэтому проверка работает и на
+пустой БД: если подходящего индекса нет, в плане все равно останется Seq Scan.
+"""
+import json
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import func, select, text
+
+from modeling.models import Likes, TokensTable, Users, UsersPosts
+
+# таблицы, которые горячие запросы не должны просматривать целиком
+INDEXED_TABLES = ("users_posts", "likes", "tokens")
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Heap Scan")
+# индексы, по которым запрос может читать эти таблицы (с колонкой фильтра первой): Postgres может пройти
+# и по чужому индексу целиком (например, по второй колонке составного), это такой же полный просмотр
+EXPECTED_INDEXES = {
+    "get_posts_my": {"ix_users_posts_user_id_dt_created"},
+    "get_posts_my_front": {"ix_users_posts_user_id_dt_created"},
+    "get_posts_count_my": {"ix_users_posts_user_id_dt_created"},
+    "get_likes_count_my": {"ix_users_posts_user_id_dt_created"},
+    "user_posts_latest": {"ix_users_posts_user_id_dt_created"},
+    "likes_by_post": {"ux_likes_post_id_user_id"},
+    "likes_by_user": {"ix_likes_user_id"},
+    "get_user_by_token": {"ix_tokens_token_expires", "ix_tokens_token"},
+    "create_user_token": {"ix_tokens_user"},
+}
+
+
+def hot_queries() -> dict:
+    """
+    Запросы в том виде, в котором их строят utils.blogs и utils.users
+    :return: название запроса -> select
+    """
+    user_id = str(uuid4())
+    post_id = str(uuid4())
+    return {
+        "get_posts_my": select(Users.username, UsersPosts.posts, UsersPosts.dt_created, UsersPosts.dt_updated,
+                               UsersPosts.like_count, UsersPosts.dislike_count).filter(
+            UsersPosts.user_id == Users.id, UsersPosts.user_id == user_id),
+        "get_posts_my_front": select(UsersPosts).filter(UsersPosts.user_id == user_id),
+        "get_posts_count_my": select(func.count(UsersPosts.id)).filter(UsersPosts.user_id == user_id),
+        "get_likes_count_my": select(func.coalesce(func.sum(UsersPosts.like_count), 0)).filter(
+            UsersPosts.user_id == user_id),
+        "user_posts_latest": select(UsersPosts.id).filter(UsersPosts.user_id == user_id).order_by(
+            UsersPosts.dt_created.desc()).limit(20),
+        "likes_by_post": select(Likes.id).filter(Likes.post_id == post_id),
+        "likes_by_user": select(Likes.id).filter(Likes.user_id == user_id),
+        "get_user_by_token": select(Users.id, Users.username, Users.name, Users.email, Users.is_active,
+                                    TokensTable.expires).filter(
+            TokensTable.token == uuid4().hex, TokensTable.expires > datetime.now()).filter(
+            TokensTable.user == Users.id),
+        "create_user_token": select(TokensTable).filter(TokensTable.user == user_id),
+    }
+
+
+def plan_scans(plan: dict):
+    """
+    Все узлы чтения таблиц из плана EXPLAIN (FORMAT JSON)
+    :param plan:
+    :return: пары (тип узла, таблица, индекс)
+    """
+    if "Relation Name" in plan:
+        index = plan.get("Index Name")
+        if index is None:
+            # Bitmap Heap Scan читает индекс в дочернем узле Bitmap Index Scan
+            index = next((sub_plan["Index Name"] for sub_plan in plan.get("Plans", ()) if "Index Name" in sub_plan),
+                         None)
+        yield plan["Node Type"], plan["Relation Name"], index
+    for sub_plan in plan.get("Plans", ()):
+        yield from plan_scans(sub_plan)
+
+
+def explain(connection, query) -> dict:
+    compiled = query.compile(dialect=connection.dialect)
+    row = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    if isinstance(row, str):
+        row = json.loads(row)
+    return row[0]["Plan"]
+
+
+@pytest.mark.parametrize("name", hot_queries())
+def test_hot_query_uses_indexes(blog_engine, name):
+    with blog_engine.connect() as connection:
+        connection.execute(text("SET enable_seqscan = off"))
+        scans = [scan for scan in plan_scans(explain(connection, hot_queries()[name])) if scan[1] in INDEXED_TABLES]
+    assert scans
+    assert [scan for scan in scans if scan[0] not in INDEX_SCANS] == []
+    assert {index for _, _, index in scans} <= EXPECTED_INDEXES[name]
@@ -0,0 +1,155 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from utils import jobs as jobs_utils
+
+
+def wait(job_id: str, timeout: float = 60) -> jobs_utils.Job:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs_utils.get_job(job_id)
+        if job.status in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} not finished")
+
+
+@pytest.fixture
+def job_ids(finans_connection):
+    """
+    Id задач теста, задачи удаляются из реестра после теста
+    :param finans_connection:
+    :return:
+    """
+    ids = []
+    yield ids
+    jobs_utils.shutdown()
+    with finans_connection:
+        with finans_connection.cursor() as cursor:
+            cursor.execute("DELETE FROM jobs WHERE id = ANY(%s)", (ids,))
+
+
+def test_job_result_in_registry(job_ids):
+    job = jobs_utils.submit("test", os.path.basename, "/tmp/result.csv")
+    job_ids.append(job.id)
+    assert job.status == "queued"
+    job = wait(job.id)
+    assert job.status == "done" and job.result == "result.csv" and job.finished >= job.created
+
+
+def test_job_error_in_registry(job_ids):
+    job = jobs_utils.submit("test", int, "not a number")
+    job_ids.append(job.id)
+    job = wait(job.id)
+    assert job.status == "failed" and "ValueError" in job.error
+
+
+def test_job_visible_from_other_process(job_ids):
+    job = jobs_utils.submit("test", os.path.basename, "/tmp/other.csv")
+    job_ids.append(job.id)
+    wait(job.id)
+    # другой процесс приложения видит задачу через общий реестр
+    code = f"from utils import jobs; job = jobs.get_job({job.id!r}); print(job.status, job.result)"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(__file__))).stdout
+    assert output.split() == ["done", "other.csv"]
+
+
+def test_unknown_job(finans_connection):
+    assert jobs_utils.get_job("missing") is None
+
+
+@pytest.fixture
+def jobs_client():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from routers import finans
+
+    app = FastAPI()
+    app.include_router(finans.router)
+    return TestClient(app)
+
+
+def wait_api(client, job_id: str, timeout: float = 60) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(f"/jobs/{job_id}")
+        assert response.status_code == 200, response.text
+        if response.json()["status"] in ("done", "failed"):
+            return response.json()
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} not finished")
+
+
+# свод файла test_finans.NUMERIC_CODES в csv
+NUMERIC_CODES = "cod;project;2022;2023\n1;NA;1;2\n1.1;P11;3;\n1.10;P110;4;5\n2;P2;1;1\n"
+NUMERIC_CODES_CSV = b"cod,project,2022,2023\n1,NA,8.0,7.0\n1.1,P11,3.0,0.0\n1.10,P110,4.0,5.0\n2,P2,1.0,1.0\n"
+
+
+def test_upload_and_export_jobs_api(jobs_client, job_ids, finans_version):
+    from utils import finans as finans_utils
+
+    response = jobs_client.post("/jobs/upload", files={"file": (finans_version, NUMERIC_CODES.encode())})
+    assert response.status_code == 202, response.text
+    job_ids.append(response.json()["id"])
+    assert response.json()["kind"] == "upload"
+    assert wait_api(jobs_client, job_ids[-1])["status"] == "done"
+    result = jobs_client.get(f"/jobs/{job_ids[-1]}/result")
+    assert result.status_code == 200
+    assert result.json()["loaded"] and result.json()["version"] == finans_version
+    assert result.json()["tree_rows"] == 4
+
+    response = jobs_client.post(f"/jobs/export/{finans_version}")
+    assert response.status_code == 202, response.text
+    job_ids.append(response.json()["id"])
+    assert wait_api(jobs_client, job_ids[-1])["status"] == "done"
+    result = jobs_client.get(f"/jobs/{job_ids[-1]}/result")
+    assert result.status_code == 200
+    assert result.content == NUMERIC_CODES_CSV
+    assert int(result.headers["content-length"]) == len(NUMERIC_CODES_CSV)
+    assert result.headers["content-disposition"] == f'attachment; filename="{finans_version}.csv"'
+    assert result.headers["etag"]
+
+    # загрузка версии удаляет свод из кэша выгрузок, результат задачи считается заново
+    finans_utils.invalidate_export(finans_version)
+    assert not os.path.exists(finans_utils.export_path(finans_version))
+    again = jobs_client.get(f"/jobs/{job_ids[-1]}/result")
+    assert again.status_code == 200
+    assert again.content == NUMERIC_CODES_CSV
+
+
+def test_upload_job_removes_file_when_not_queued(jobs_client, monkeypatch, tmp_path):
+    from fastapi import HTTPException
+
+    def unavailable(*args):
+        raise HTTPException(status_code=503, detail="Finance database unavailable")
+
+    monkeypatch.setattr(jobs_utils, "JOBS_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs_utils, "submit", unavailable)
+    response = jobs_client.post("/jobs/upload", files={"file": ("v", NUMERIC_CODES.encode())})
+    assert response.status_code == 503
+    assert os.listdir(tmp_path) == []
+
+
+def test_export_job_unknown_format(jobs_client):
+    response = jobs_client.post("/jobs/export/missing", params={"format": "txt"})
+    assert response.status_code == 422
+
+
+def test_failed_job_result(jobs_client, job_ids):
+    job = jobs_utils.submit("test", int, "not a number")
+    job_ids.append(job.id)
+    wait(job.id)
+    response = jobs_client.get(f"/jobs/{job.id}/result")
+    assert response.status_code == 500
+    assert "ValueError" in response.json()["detail"]
+
+
+def test_unknown_job_api(jobs_client, finans_connection):
+    assert jobs_client.get("/jobs/missing").status_code == 404
+    assert jobs_client.get("/jobs/missing/result").status_code == 404
@@ -0,0 +1,33 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from utils import users as users_utils
+from utils.passwords import PasswordHasher, pbkdf2
+
+
+def test_validate_password_async():
+    async def scenario():
+        salt = users_utils.get_random_string()
+        hashed_password = f"{salt}${await users_utils.hash_password_async('secret', salt)}"
+        return (await users_utils.validate_password_async("secret", hashed_password),
+                await users_utils.validate_password_async("wrong", hashed_password), hashed_password)
+
+    valid, invalid, hashed_password = asyncio.run(scenario())
+    assert valid and not invalid
+    salt, hashed = hashed_password.split("$")
+    assert hashed == pbkdf2("secret", salt)
+
+
+def test_hasher_queue_full():
+    hasher = PasswordHasher(workers=1, concurrency=1, queue_max=1)
+
+    async def scenario():
+        tasks = [asyncio.create_task(hasher.hash("secret", "salt")) for _ in range(3)]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    hasher.shutdown()
+    rejected = [result for result in results if isinstance(result, HTTPException)]
+    assert len(rejected) == 1 and rejected[0].status_code == 503
+    assert hasher.stats()["rejected"] == 1 and hasher.stats()["completed"] == 2
@@ -0,0 +1,58 @@
+import pytest
+
+from core import server
+
+
+def test_pool_sizes_fit_max_connections():
+    pool_size, max_overflow = server.pool_sizes(100, 4, 10, 12)
+    assert (pool_size, max_overflow) == (5, 5)
+    assert 4 * (pool_size + max_overflow + 12) <= 100 - 10
+
+
+def test_pool_sizes_too_few_connections():
+    with pytest.raises(RuntimeError):
+        server.pool_sizes(20, 4, 10, 2)
+
+
+@pytest.mark.parametrize("requested, budget, expected", [
+    ((10, 20), 10, (10, 0)),
+    ((4, 20), 10, (4, 6)),
+    ((3, 2), 10, (3, 2)),
+    ((50, 0), 8, (8, 0)),
+])
+def test_limit_pool(requested, budget, expected):
+    assert server.limit_pool(*requested, budget) == expected
+
+
+def test_configure_caps_explicit_pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "max_connections", lambda: 100)
+    monkeypatch.setattr(server, "finans_connections", lambda jobs_workers: 12)
+    monkeypatch.setenv("DB_POOL_SIZE", "10")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "20")
+    monkeypatch.setenv("JOBS_WORKERS", "1")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "metrics"))
+    server.configure(4)
+    assert (server.os.environ["DB_POOL_SIZE"], server.os.environ["DB_MAX_OVERFLOW"]) == ("10", "0")
+
+
+def test_draining_server_not_ready_before_exit(monkeypatch):
+    monkeypatch.setattr(server, "shutdown_drain_seconds", 0.05)
+    monkeypatch.setitem(server.health.state, "ready", True)
+    draining = server.DrainingServer(server.uvicorn.Config("app:app"))
+
+    async def signal_and_wait():
+        draining.handle_exit(15, None)
+        stopped_at_signal = draining.should_exit
+        await server.asyncio.sleep(0.1)
+        return stopped_at_signal
+
+    assert server.asyncio.run(signal_and_wait()) is False
+    assert server.health.state["ready"] is False and draining.should_exit
+
+
+def test_draining_server_second_signal(monkeypatch):
+    monkeypatch.setattr(server, "shutdown_drain_seconds", 30)
+    monkeypatch.setitem(server.health.state, "ready", False)
+    draining = server.DrainingServer(server.uvicorn.Config("app:app"))
+    draining.handle_exit(15, None)
+    assert draining.should_exit
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from utils.token_cache import TokenCache
+
+START = datetime(2026, 1, 1, 12, 0)
+
+
+class Clock:
+    """ Часы теста: монотонное время и текущая дата сдвигаются вместе """
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def monotonic(self) -> float:
+        return self.seconds
+
+    def now(self) -> datetime:
+        return START + timedelta(seconds=self.seconds)
+
+    def advance(self, seconds: float):
+        self.seconds += seconds
+
+
+def make_cache(clock: Clock, maxsize: int = 10, ttl: float = 60) -> TokenCache:
+    return TokenCache(maxsize, ttl, clock=clock.monotonic, now=clock.now)
+
+
+def user(user_id: int):
+    return SimpleNamespace(id=user_id)
+
+
+def test_entry_expires_at_ttl():
+    clock = Clock()
+    cache = make_cache(clock, ttl=60)
+    alice = user(1)
+    cache.set("a", alice)
+    clock.advance(60)
+    assert cache.get("a") is alice
+    clock.advance(0.001)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_entry_capped_at_token_expires():
+    clock = Clock()
+    cache = make_cache(clock, ttl=60)
+    cache.set("a", user(1), expires=START + timedelta(seconds=10))
+    clock.advance(9)
+    assert cache.get("a") is not None
+    clock.advance(1)
+    assert cache.get("a") is None
+    cache.set("b", user(2), expires=START)
+    assert cache.get("b") is None
+
+
+def test_lru_eviction():
+    clock = Clock()
+    cache = make_cache(clock, maxsize=2)
+    cache.set("a", user(1))
+    cache.set("b", user(2))
+    # a использован последним, вытесняется b
+    assert cache.get("a") is not None
+    cache.set("c", user(3))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["size"] == 2
+    assert set(cache._by_user) == {1, 3}
+
+
+def test_set_replaces_token():
+    clock = Clock()
+    cache = make_cache(clock)
+    cache.set("a", user(1))
+    cache.set("a", user(2))
+    assert cache.get("a").id == 2
+    assert set(cache._by_user) == {2}
+
+
+def test_invalidate():
+    clock = Clock()
+    cache = make_cache(clock)
+    cache.set("a", user(1))
+    cache.set("b", user(1))
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache._by_user == {1: {"b"}}
+
+
+def test_invalidate_user():
+    clock = Clock()
+    cache = make_cache(clock)
+    cache.set("a", user(1))
+    cache.set("b", user(1))
+    cache.set("c", user(2))
+    # выход или смена пароля: все токены пользователя
+    cache.invalidate_user(1)
+    cache.invalidate_user(3)
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["size"] == 1
+    assert set(cache._by_user) == {2}
+
+
+def test_stats():
+    clock = Clock()
+    cache = make_cache(clock, ttl=1)
+    assert cache.stats() == {"hits": 0, "misses": 0, "size": 0}
+    cache.get("a")
+    cache.set("a", user(1))
+    cache.get("a")
+    cache.get("a")
+    clock.advance(2)
+    cache.get("a")
+    assert cache.stats() == {"hits": 2, "misses": 2, "size": 0}
+    cache.set("b", user(2))
+    cache.clear()
+    assert cache.stats() == {"hits": 2, "misses": 2, "size": 0}
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from core import tracing
+from core.metrics import RequestStats, request_stats
+
+
+def run_route(route: str, queries: int):
+    """
+    Запрос маршрута через QueryBudgetMiddleware, приложение выполняет queries запросов к БД
+    :param route: шаблон пути маршрута
+    :param queries:
+    :return:
+    """
+    async def app(scope, receive, send):
+        request_stats.get().statements.extend(["SELECT 1"] * queries)
+
+    async def call():
+        token = request_stats.set(RequestStats(route))
+        try:
+            await tracing.QueryBudgetMiddleware(app)({"type": "http", "method": "GET"}, None, None)
+        finally:
+            request_stats.reset(token)
+
+    asyncio.run(call())
+
+
+@pytest.fixture
+def strict(monkeypatch):
+    monkeypatch.setattr(tracing, "DB_QUERY_BUDGET_STRICT", True)
+
+
+def test_route_within_budget(strict):
+    run_route("/myblog/", tracing.ROUTE_QUERY_BUDGETS["/myblog/"])
+
+
+def test_route_over_budget_strict(strict):
+    with pytest.raises(tracing.QueryBudgetExceeded, match=r"GET /myblog/: 3 queries, budget 2"):
+        run_route("/myblog/", 3)
+
+
+def test_route_over_budget_logged(monkeypatch, caplog):
+    monkeypatch.setattr(tracing, "DB_QUERY_BUDGET_STRICT", False)
+    with caplog.at_level(logging.WARNING, logger=tracing.logger.name):
+        run_route("/myblog/", 3)
+    assert "GET /myblog/: 3 queries, budget 2" in caplog.text
+
+
+def test_route_without_budget(strict):
+    run_route("/api/posts", 100)
+
+
+def test_query_budget_block():
+    engine = create_engine("sqlite://")
+    tracing.instrument_engine(engine)
+    with engine.connect() as connection:
+        with tracing.query_budget(2) as counter:
+            connection.execute(text("SELECT 1"))
+        assert counter.queries == 1
+        with pytest.raises(tracing.QueryBudgetExceeded, match="count: 2 queries, budget 1"):
+            with tracing.query_budget(1, "count"):
+                connection.execute(text("SELECT 1"))
+                connection.execute(text("SELECT 2"))
+    engine.dispose()
+
+
+@pytest.fixture
+def post_id(user, make_post):
+    return make_post(user, "budget")
+
+
+@pytest.mark.parametrize("route", tracing.ROUTE_QUERY_BUDGETS)
+def test_route_budget_measured(client, user, post_id, strict, route):
+    """ Бюджет равен числу запросов при пустых кэшах: если маршрут стал дешевле, бюджет надо уменьшить """
+    from utils.token_cache import token_cache
+
+    token_cache.clear()
+    with tracing.query_budget(tracing.ROUTE_QUERY_BUDGETS[route], route) as counter:
+        response = client.get(route.format(post_id=post_id), headers={"Cookie": f"bearer={user['token']}"})
+    assert response.status_code == 200
+    assert counter.queries == tracing.ROUTE_QUERY_BUDGETS[route]
@@ -0,0 +1,10 @@
+from utils.token_cache import token_cache
+
+
+def test_logout_drops_cached_token(client, user):
+    response = client.get("/myblog/", headers={"Cookie": f"bearer={user['token']}"})
+    assert response.status_code == 200
+    assert token_cache.get(user["token"]) is not None
+    response = client.get("/auth/logout", headers={"Cookie": f"bearer={user['token']}"}, follow_redirects=False)
+    assert response.status_code == 307
+    assert token_cache.get(user["token"]) is None
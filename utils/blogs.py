@@ -1,11 +1,120 @@
+import base64
 from datetime import datetime
+from uuid import UUID, uuid4
 from modeling.models import Users, Likes, UsersPosts
 from Schemas import blogs as post_schema
 from Schemas import users as users_schema
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, update, func, tuple_, case, literal, literal_column
+from sqlalchemy.dialects.postgresql import REAL, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils import cache
 
+# размер страницы ленты постов по умолчанию и максимальный
+POSTS_PAGE_LIMIT = 20
+POSTS_PAGE_LIMIT_MAX = 100
 
-async def create_post_user(post: post_schema.PostModel, user_id: str, db: Session):
+
+def encode_cursor(dt_created: datetime, post_id: UUID) -> str:
+    """
+    Кодирование позиции в ленте (dt_created, id) в строку курсора
+    :param dt_created:
+    :param post_id:
+    :return:
+    """
+    raw = f"{dt_created.isoformat()}|{post_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Разбор строки курсора обратно в (dt_created, id), ValueError при неверном курсоре
+    :param cursor:
+    :return:
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        dt_created, post_id = raw.split("|")
+        return datetime.fromisoformat(dt_created), UUID(post_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def encode_search_cursor(rank: float, dt_created: datetime, post_id: UUID) -> str:
+    """
+    Кодирование позиции в результатах поиска (rank, dt_created, id) в строку курсора
+    :param rank: ранг ts_rank_cd (real)
+    :param dt_created:
+    :param post_id:
+    :return:
+    """
+    raw = f"{dt_created.isoformat()}|{post_id}|{rank!r}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str):
+    """
+    Разбор курсора поиска обратно в (rank, dt_created, id), ValueError при неверном курсоре
+    :param cursor:
+    :return:
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        dt_created, post_id, rank = raw.split("|")
+        return float(rank), datetime.fromisoformat(dt_created), UUID(post_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _canonical_id(value) -> str:
+    """
+    id в каноническом виде UUID: Postgres принимает и 'ABC...' и без дефисов, а ключи и теги кэша должны совпадать
+    :param value: UUID или строка
+    :return:
+    """
+    try:
+        return str(UUID(str(value)))
+    except ValueError:
+        return str(value)
+
+
+def user_tag(user_id) -> str:
+    """
+    Тег кэша данных пользователя, он же префикс их ключей
+    :param user_id:
+    :return:
+    """
+    return f"user:{_canonical_id(user_id)}"
+
+
+def post_tag(post_id) -> str:
+    """
+    Тег и ключ кэша поста
+    :param post_id:
+    :return:
+    """
+    return f"post:{_canonical_id(post_id)}"
+
+
+async def _insert_post(user_id, text: str, db: AsyncSession):
+    """
+    Вставка поста одним запросом INSERT ... RETURNING, возвращает строку созданного поста
+    :param user_id:
+    :param text:
+    :param db:
+    :return:
+    """
+    now = datetime.now()
+    result = await db.execute(insert(UsersPosts).values(user_id=user_id, posts=text, dt_created=now, dt_updated=now)
+                              .returning(UsersPosts.id, UsersPosts.user_id, UsersPosts.posts,
+                                         UsersPosts.dt_created, UsersPosts.dt_updated))
+    new_post = result.first()
+    await db.commit()
+    await cache.invalidate(user_tag(new_post.user_id))
+    await cache.incr("posts:count", 1)
+    return new_post
+
+
+async def create_post_user(post: post_schema.PostModel, user_id: str, db: AsyncSession):
     """
     Создание поста по user_id - str для api
     :param post:
@@ -13,14 +122,10 @@ async def create_post_user(post: post_schema.PostModel, user_id: str, db: Sessio
     :param db:
     :return:
     """
-    new_post = UsersPosts(user_id=user_id, posts=post.posts_text, dt_created=datetime.now(), dt_updated=datetime.now())
-    db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
-    return new_post
+    return await _insert_post(user_id, post.posts_text, db)
 
 
-async def create_post(post: post_schema.PostModel, user_id: users_schema.IdUser, db: Session):
+async def create_post(post: post_schema.PostModel, user_id: users_schema.IdUser, db: AsyncSession):
     """
     создание поста для API для авторизованого пользователя
     :param post:
@@ -28,15 +133,10 @@ async def create_post(post: post_schema.PostModel, user_id: users_schema.IdUser,
     :param db:
     :return:
     """
-    new_post = UsersPosts(user_id=user_id, posts=post.posts_text, dt_created=datetime.now(), dt_updated=datetime.now())
-    db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
-    new_post = db.query(UsersPosts).filter(UsersPosts.posts == post.posts_text).first()
-    return new_post
+    return await _insert_post(user_id, post.posts_text, db)
 
 
-async def create_post_front(post: str, user_id: str, db: Session):
+async def create_post_front(post: str, user_id: str, db: AsyncSession):
     """
     Создание поста по user_id - str для frontend тут пост уже str
     :param post:
@@ -44,226 +144,344 @@ async def create_post_front(post: str, user_id: str, db: Session):
     :param db:
     :return:
     """
-    new_post = UsersPosts(user_id=user_id, posts=post, dt_created=datetime.now(), dt_updated=datetime.now())
-    db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
-
-    return new_post
+    return await _insert_post(user_id, post, db)
 
 
-async def get_post(post_id: str, db: Session):
+async def get_post(post_id: str, db: AsyncSession):
     """
     получение поста по id, с добавлением полей из таблицы Users
     :param post_id:
     :param db:
     :return:
     """
-    posts = db.query(UsersPosts, Users).with_entities(UsersPosts.id, UsersPosts.user_id, Users.username,
-                                                      UsersPosts.posts, UsersPosts.dt_created,
-                                                      UsersPosts.dt_updated).filter(
-        UsersPosts.user_id == Users.id, UsersPosts.id == post_id).first()
+    async def load():
+        result = await db.execute(select(UsersPosts.id, UsersPosts.user_id, Users.username, UsersPosts.posts,
+                                         UsersPosts.dt_created, UsersPosts.dt_updated).filter(
+            UsersPosts.user_id == Users.id, UsersPosts.id == post_id))
+        return result.first()
+
+    posts = await cache.cached(post_tag(post_id), load, tags=(post_tag(post_id),))
     return posts
 
 
-async def get_post_front(post_id: str, db: Session):
+async def get_post_front(post_id: str, db: AsyncSession):
     """
     получение поста по id
     :param post_id:
     :param db:
     :return:
     """
-    posts = db.query(UsersPosts).filter(UsersPosts.id == post_id).first()
+    result = await db.execute(select(UsersPosts).filter(UsersPosts.id == post_id))
+    posts = result.scalars().first()
     return posts
 
 
-async def get_posts(db: Session):
+async def get_posts(db: AsyncSession, limit: int = POSTS_PAGE_LIMIT, cursor: str = None):
     """
-    Получение всех постов и сколько есть лайков
+    Получение страницы постов (от новых к старым) и сколько есть лайков.
+    Пагинация по курсору (dt_created, id), next_cursor равен None на последней странице
     :param db:
+    :param limit: размер страницы
+    :param cursor: курсор из предыдущей страницы
     :return:
     """
-    posts = db.query(UsersPosts, Users).with_entities(UsersPosts.id, Users.username, UsersPosts.posts,
-                                                      UsersPosts.dt_created,
-                                                      UsersPosts.dt_updated).filter(
-        UsersPosts.user_id == Users.id).all()
-    likes = db.query(UsersPosts, Likes).filter(UsersPosts.id == Likes.post_id, Likes.likes_on).count()
-    return posts, likes
-
-
-async def get_posts_count(db: Session):
+    query = select(UsersPosts.id, Users.username, UsersPosts.posts, UsersPosts.dt_created,
+                   UsersPosts.dt_updated, UsersPosts.like_count, UsersPosts.dislike_count).filter(
+        UsersPosts.user_id == Users.id)
+    if cursor:
+        query = query.filter(tuple_(UsersPosts.dt_created, UsersPosts.id) < tuple_(*decode_cursor(cursor)))
+    query = query.order_by(UsersPosts.dt_created.desc(), UsersPosts.id.desc()).limit(limit + 1)
+    result = await db.execute(query)
+    posts = result.all()
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1].dt_created, posts[-1].id)
+    likes = await get_likes_count(db)
+    return posts, likes, next_cursor
+
+
+async def search_posts(db: AsyncSession, q: str, limit: int = POSTS_PAGE_LIMIT, cursor: str = None):
+    """
+    Полнотекстовый поиск по постам через GIN индекс, от более релевантных к менее.
+    Запрос в формате поисковой строки: слова, "фраза", -исключение, or.
+    Ранжируются все найденные посты, страницы идут по курсору (rank, dt_created, id), поэтому новые посты
+    не сдвигают следующие страницы. next_cursor равен None на последней странице
+    :param db:
+    :param q: поисковая строка
+    :param limit: размер страницы
+    :param cursor: курсор из предыдущей страницы
+    :return: посты и курсор следующей страницы
+    """
+    query = func.websearch_to_tsquery(literal_column("'simple'"), q)
+    matches = select(UsersPosts.id, UsersPosts.user_id, UsersPosts.posts, UsersPosts.dt_created,
+                     UsersPosts.dt_updated, UsersPosts.like_count, UsersPosts.dislike_count,
+                     func.ts_rank_cd(UsersPosts.posts_tsv, query).label("rank")).filter(
+        UsersPosts.posts_tsv.bool_op("@@")(query)).subquery()
+    search = select(matches.c.id, Users.username, matches.c.posts, matches.c.dt_created, matches.c.dt_updated,
+                    matches.c.like_count, matches.c.dislike_count, matches.c.rank).filter(
+        matches.c.user_id == Users.id)
+    if cursor:
+        rank, dt_created, post_id = decode_search_cursor(cursor)
+        search = search.filter(tuple_(matches.c.rank, matches.c.dt_created, matches.c.id)
+                               < tuple_(literal(rank, REAL), dt_created, post_id))
+    result = await db.execute(
+        search.order_by(matches.c.rank.desc(), matches.c.dt_created.desc(), matches.c.id.desc()).limit(limit + 1))
+    posts = result.all()
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = encode_search_cursor(posts[-1].rank, posts[-1].dt_created, posts[-1].id)
+    return posts, next_cursor
+
+
+async def get_posts_count(db: AsyncSession):
     """
     получения количества постов
     :param db:
     :return:
     """
-    posts_count = db.query(UsersPosts).count()
+    posts_count = await cache.counter("posts:count", lambda: db.scalar(select(func.count(UsersPosts.id))))
     return posts_count
 
 
-async def get_posts_my(user_id: str, db: Session):
+async def get_likes_count(db: AsyncSession):
+    """
+    получение количества лайков по всем постам
+    :param db:
+    :return:
+    """
+    likes = await cache.counter("posts:likes", lambda: db.scalar(
+        select(func.coalesce(func.sum(UsersPosts.like_count), 0))))
+    return likes
+
+
+async def get_likes_count_my(user_id: str, db: AsyncSession):
+    """
+    получение количества лайков по постам определенного пользователя
+    :param user_id:
+    :param db:
+    :return:
+    """
+    likes = await cache.cached(f"{user_tag(user_id)}:likes", lambda: db.scalar(
+        select(func.coalesce(func.sum(UsersPosts.like_count), 0)).filter(UsersPosts.user_id == user_id)),
+        tags=(user_tag(user_id),))
+    return likes
+
+
+async def get_posts_my(user_id: str, db: AsyncSession):
     """
     получения постов определенного пользователя и лайков по его постам
     :param user_id:
     :param db:
     :return:
     """
-    posts = db.query(UsersPosts, Users).with_entities(Users.username, UsersPosts.posts, UsersPosts.dt_created,
-                                                      UsersPosts.dt_updated).filter(UsersPosts.user_id == Users.id,
-                                                                                    UsersPosts.user_id == user_id).all()
-    likes = db.query(UsersPosts, Likes).filter(UsersPosts.id == Likes.post_id, Likes.likes_on,
-                                               UsersPosts.user_id == user_id).count()
+    async def load():
+        result = await db.execute(select(Users.username, UsersPosts.posts, UsersPosts.dt_created,
+                                         UsersPosts.dt_updated, UsersPosts.like_count,
+                                         UsersPosts.dislike_count).filter(UsersPosts.user_id == Users.id,
+                                                                          UsersPosts.user_id == user_id))
+        return result.all()
+
+    posts = await cache.cached(f"{user_tag(user_id)}:posts", load, tags=(user_tag(user_id),))
+    likes = await get_likes_count_my(user_id, db)
     return posts, likes
 
 
-async def get_posts_my_front(user_id: str, db: Session):
+async def get_posts_my_front(user_id: str, db: AsyncSession):
     """
     получения постов определенного пользователя и лайков по его постам для frontend другой набор полей
     :param user_id:
     :param db:
     :return:
     """
-    posts = db.query(UsersPosts).filter(UsersPosts.user_id == user_id).all()
-    likes = db.query(UsersPosts, Likes).filter(UsersPosts.id == Likes.post_id, Likes.likes_on,
-                                               UsersPosts.user_id == user_id).count()
+    result = await db.execute(select(UsersPosts).filter(UsersPosts.user_id == user_id))
+    posts = result.scalars().all()
+    likes = await get_likes_count_my(user_id, db)
     return posts, likes
 
 
-async def get_posts_count_my(user_id: str, db: Session):
+async def get_posts_my_page(user_id: str, db: AsyncSession):
+    """
+    посты пользователя для страниц "мой блог" одним запросом, количество постов и лайков считаются по ним же
+    :param user_id:
+    :param db:
+    :return: посты, количество постов, количество лайков
+    """
+    async def load():
+        result = await db.execute(select(UsersPosts.id, UsersPosts.posts, UsersPosts.dt_created,
+                                         UsersPosts.dt_updated, UsersPosts.like_count,
+                                         UsersPosts.dislike_count).filter(UsersPosts.user_id == user_id).order_by(
+            UsersPosts.dt_created))
+        return result.all()
+
+    posts = await cache.cached(f"{user_tag(user_id)}:page", load, tags=(user_tag(user_id),))
+    return posts, len(posts), sum(post.like_count for post in posts)
+
+
+async def get_posts_count_my(user_id: str, db: AsyncSession):
     """
     получение количества постов определенного пользователя
     :param user_id:
     :param db:
     :return:
     """
-    posts_count = db.query(UsersPosts).filter(UsersPosts.user_id == user_id).count()
+    posts_count = await cache.cached(f"{user_tag(user_id)}:count", lambda: db.scalar(
+        select(func.count(UsersPosts.id)).filter(UsersPosts.user_id == user_id)), tags=(user_tag(user_id),))
     return posts_count
 
 
-async def update_post_front(post_id: str, post: str, db: Session):
+async def _update_post(post_id: str, text: str, db: AsyncSession, user_id=None):
+    """
+    Изменение поста одним запросом UPDATE ... RETURNING. Если указан user_id, изменяется только пост этого автора.
+    Возвращает строку измененного поста или None, если пост не найден или он чужой
+    :param post_id:
+    :param text:
+    :param db:
+    :param user_id: автор поста
+    :return:
+    """
+    query = update(UsersPosts).filter(UsersPosts.id == post_id)
+    if user_id is not None:
+        query = query.filter(UsersPosts.user_id == user_id)
+    result = await db.execute(query.values(posts=text, dt_updated=datetime.now()).returning(
+        UsersPosts.id, UsersPosts.user_id, UsersPosts.posts, UsersPosts.dt_created, UsersPosts.dt_updated))
+    posts = result.first()
+    await db.commit()
+    if posts is not None:
+        await cache.invalidate(post_tag(post_id), user_tag(posts.user_id))
+    return posts
+
+
+async def update_post_front(post_id: str, post: str, db: AsyncSession, user_id=None):
     """
     изменения поста для frontend и одного из api
     :param post_id:
     :param post:
     :param db:
+    :param user_id: автор поста
     :return:
     """
-    posts = db.query(UsersPosts).filter(UsersPosts.id == post_id).first()
-    posts.posts = post
-    posts.dt_updated = datetime.now()
-    db.commit()
-    db.refresh(posts)
-    return posts
+    return await _update_post(post_id, post, db, user_id)
 
 
-async def update_post(post_id: str, post: post_schema.PostModel, db: Session):
+async def update_post(post_id: str, post: post_schema.PostModel, db: AsyncSession, user_id=None):
     """
     изменение поста для одного из api
     :param post_id:
     :param post:
     :param db:
+    :param user_id: автор поста
     :return:
     """
-    posts = db.query(UsersPosts).filter(UsersPosts.id == post_id).first()
-    posts.posts = post.posts_text
-    posts.dt_updated = datetime.now()
-    db.commit()
-    db.refresh(posts)
-    return posts
+    return await _update_post(post_id, post.posts_text, db, user_id)
 
 
-async def create_post_like(post_id: str, user_id: str, like: post_schema.PostLike, db: Session):
+async def _create_like(post_id: str, user_id: str, like: bool, db: AsyncSession):
     """
-    создание лайка для поста
+    Простановка лайка одним запросом: проверка поста, вставка лайка (не своему посту и не повторно -
+    уникальный индекс likes(post_id, user_id)) и увеличение счетчика поста.
+    Возвращает None если поста нет, иначе строку с автором поста, likes_on (None если лайк не поставлен)
+    и текущими счетчиками
     :param post_id:
     :param user_id:
     :param like:
     :param db:
     :return:
     """
-    new_like = Likes(user_id=user_id, post_id=post_id, likes_on=like)
-    db.add(new_like)
-    db.commit()
-    db.refresh(new_like)
-    post_like = db.query(UsersPosts, Likes).with_entities(UsersPosts.user_id, UsersPosts.posts, UsersPosts.dt_created,
-                                                          UsersPosts.dt_updated, Likes.likes_on).filter(
-        UsersPosts.id == Likes.post_id, UsersPosts.id == post_id).first()
+    like = bool(like)
+    post = select(UsersPosts.id, UsersPosts.user_id, UsersPosts.like_count, UsersPosts.dislike_count).filter(
+        UsersPosts.id == post_id).cte("post")
+    user_id_param = literal(user_id, Likes.user_id.type)
+    new_like = insert(Likes).from_select(
+        [Likes.id, Likes.post_id, Likes.user_id, Likes.likes_on],
+        select(literal(uuid4(), Likes.id.type), post.c.id, user_id_param, literal(like)).filter(
+            post.c.user_id != user_id_param)
+    ).on_conflict_do_nothing(index_elements=[Likes.post_id, Likes.user_id]).returning(
+        Likes.post_id, Likes.likes_on).cte("new_like")
+    counter = update(UsersPosts).filter(UsersPosts.id == new_like.c.post_id).values(
+        like_count=UsersPosts.like_count + case((new_like.c.likes_on, 1), else_=0),
+        dislike_count=UsersPosts.dislike_count + case((new_like.c.likes_on, 0), else_=1),
+        dt_updated=UsersPosts.dt_updated,
+    ).returning(UsersPosts.id, UsersPosts.like_count, UsersPosts.dislike_count).cte("counter")
+    result = await db.execute(
+        select(post.c.id.label("post_id"), post.c.user_id, new_like.c.likes_on,
+               func.coalesce(counter.c.like_count, post.c.like_count).label("like_count"),
+               func.coalesce(counter.c.dislike_count, post.c.dislike_count).label("dislike_count")).select_from(
+            post.outerjoin(new_like, new_like.c.post_id == post.c.id).outerjoin(counter, counter.c.id == post.c.id))
+    )
+    post_like = result.first()
+    await db.commit()
+    if post_like and post_like.likes_on is not None:
+        # страницы поста и его автора устаревают, общие счетчики меняются без инвалидации
+        await cache.invalidate(post_tag(post_id), user_tag(post_like.user_id))
+        if post_like.likes_on:
+            await cache.incr("posts:likes", 1)
     return post_like
 
 
-async def create_post_like_api(post_id: str, user_id: users_schema.IdUser, like: post_schema.PostLike, db: Session):
+async def create_post_like(post_id: str, user_id: str, like: post_schema.PostLike, db: AsyncSession):
     """
-    создание лайка для поста для API
+    создание лайка для поста
     :param post_id:
     :param user_id:
     :param like:
     :param db:
     :return:
     """
-    new_like = Likes(user_id=user_id, post_id=post_id, likes_on=like)
-    db.add(new_like)
-    db.commit()
-    db.refresh(new_like)
-    post_like = db.query(UsersPosts, Likes).with_entities(UsersPosts.user_id, UsersPosts.posts, UsersPosts.dt_created,
-                                                          UsersPosts.dt_updated, Likes.likes_on).filter(
-        UsersPosts.id == Likes.post_id, UsersPosts.id == post_id).first()
-    return post_like
+    return await _create_like(post_id, user_id, like, db)
 
 
-async def create_post_like_front(post_id: str, user_id: str, like: bool, db: Session):
+async def create_post_like_api(post_id: str, user_id: users_schema.IdUser, like: post_schema.PostLike,
+                               db: AsyncSession):
     """
-    создание лайка для поста для frontend
+    создание лайка для поста для API
     :param post_id:
     :param user_id:
     :param like:
     :param db:
     :return:
     """
-    new_like = Likes(user_id=user_id, post_id=post_id, likes_on=like)
-    db.add(new_like)
-    db.commit()
-    db.refresh(new_like)
-    post_like = db.query(UsersPosts, Likes).with_entities(UsersPosts.user_id, UsersPosts.posts, UsersPosts.dt_created,
-                                                          UsersPosts.dt_updated, Likes.likes_on).filter(
-        UsersPosts.id == Likes.post_id, UsersPosts.id == post_id).first()
-    return post_like
+    return await _create_like(post_id, user_id, like, db)
 
 
-async def get_user_id(username: str, db: Session):
+async def create_post_like_front(post_id: str, user_id: str, like: bool, db: AsyncSession):
     """
-    получение id пользователя по username
-    :param username:
+    создание лайка для поста для frontend
+    :param post_id:
+    :param user_id:
+    :param like:
     :param db:
     :return:
     """
-    user = db.query(Users).filter(UsersPosts.username == username).first()
-    return user.id
+    return await _create_like(post_id, user_id, like, db)
 
 
-async def get_like(post_id: str, user_id: str, db: Session):
+async def get_user_id(username: str, db: AsyncSession):
     """
-    для проверки на повторный лайк пользователем
-    :param post_id:
-    :param user_id:
+    получение id пользователя по username
+    :param username:
     :param db:
     :return:
     """
-    like_try = db.query(Likes).filter(Likes.user_id == user_id, Likes.post_id == post_id).first()
-    if not like_try:
-        like_try = False
-    return like_try
+    result = await db.execute(select(Users).filter(Users.username == username))
+    user = result.scalars().first()
+    return user.id
 
 
-async def delete_post(post_id: str, db: Session):
+async def delete_post(post_id: str, db: AsyncSession):
     """
     удаление поста
     :param post_id:
     :param db:
     :return:
     """
-    likes = db.query(Likes).filter(Likes.post_id == post_id)
-    likes.delete(synchronize_session=False)
-    posts = db.query(UsersPosts).filter(UsersPosts.id == post_id)
-    posts.delete(synchronize_session=False)
-    db.commit()
+    await db.execute(delete(Likes).filter(Likes.post_id == post_id).execution_options(synchronize_session=False))
+    result = await db.execute(delete(UsersPosts).filter(UsersPosts.id == post_id).returning(
+        UsersPosts.user_id, UsersPosts.like_count).execution_options(synchronize_session=False))
+    deleted = result.all()
+    await db.commit()
+    await cache.invalidate(post_tag(post_id), *(user_tag(row.user_id) for row in deleted))
+    await cache.incr("posts:count", -len(deleted))
+    await cache.incr("posts:likes", -sum(row.like_count for row in deleted))
     return {"status_code": True, "message": "The post has been deleted"}
@@ -0,0 +1,128 @@
+import logging
+import os
+import pickle
+from redis.exceptions import RedisError
+from setredis import async_client
+
+# время жизни записи в кэше в секундах
+CACHE_TTL = int(os.environ.get("CACHE_TTL", 300))
+CACHE_PREFIX = "blog:"
+
+# увеличение счетчика, только если он уже есть в кэше: иначе counter() загрузит его из БД
+INCR_IF_EXISTS = "if redis.call('exists', KEYS[1]) == 1 then return redis.call('incrby', KEYS[1], ARGV[1]) end"
+
+logger = logging.getLogger(__name__)
+
+
+class CachedRow(dict):
+    """ Строка результата запроса, пригодная для кэша: доступ к полям как по ключу, так и через атрибут """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def to_cached(value):
+    """ Переводит строки SQLAlchemy (и списки/кортежи из них) в CachedRow для хранения в redis """
+    if isinstance(value, list):
+        return [to_cached(el) for el in value]
+    if isinstance(value, tuple) and not hasattr(value, "_asdict"):
+        return tuple(to_cached(el) for el in value)
+    if hasattr(value, "_asdict"):
+        return CachedRow(value._asdict())
+    return value
+
+
+def _tag_key(tag: str) -> str:
+    return f"{CACHE_PREFIX}tag:{tag}"
+
+
+async def cached(key: str, loader, tags=(), ttl: int = CACHE_TTL):
+    """
+    Чтение через кэш: значение берется из redis, а при промахе загружается loader() и сохраняется
+    с привязкой к тегам для последующей инвалидации. При недоступности redis работает напрямую с БД
+    :param key: ключ записи
+    :param loader: корутинная функция загрузки значения из БД
+    :param tags: теги записи
+    :param ttl: время жизни записи
+    :return:
+    """
+    key = CACHE_PREFIX + key
+    try:
+        raw = await async_client.get(key)
+    except RedisError as error:
+        logger.warning("Redis недоступен, чтение из БД: %s", error)
+        return to_cached(await loader())
+    if raw is not None:
+        return pickle.loads(raw)
+    value = to_cached(await loader())
+    try:
+        async with async_client.pipeline(transaction=True) as pipe:
+            pipe.set(key, pickle.dumps(value), ex=ttl)
+            for tag in tags:
+                pipe.sadd(_tag_key(tag), key)
+                pipe.expire(_tag_key(tag), ttl)
+            await pipe.execute()
+    except RedisError as error:
+        logger.warning("Не удалось сохранить %s в кэш: %s", key, error)
+    return value
+
+
+async def invalidate(*tags):
+    """
+    Удаление всех записей, привязанных к тегам, одинаково для всех экземпляров приложения
+    :param tags: теги
+    :return:
+    """
+    tag_keys = [_tag_key(tag) for tag in tags]
+    try:
+        async with async_client.pipeline(transaction=False) as pipe:
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            members = await pipe.execute()
+        keys = set().union(*members) if members else set()
+        await async_client.delete(*keys, *tag_keys)
+    except RedisError as error:
+        logger.warning("Не удалось инвалидировать теги %s: %s", tags, error)
+
+
+async def counter(key: str, loader, ttl: int = CACHE_TTL) -> int:
+    """
+    Целочисленный счетчик через кэш: при промахе загружается loader() из БД, дальше меняется через incr,
+    а не инвалидацией. Изменение между загрузкой из БД и записью в кэш может потеряться, но не дольше ttl
+    :param key: ключ счетчика
+    :param loader: корутинная функция загрузки значения из БД
+    :param ttl: время жизни счетчика
+    :return:
+    """
+    key = CACHE_PREFIX + key
+    try:
+        raw = await async_client.get(key)
+    except RedisError as error:
+        logger.warning("Redis недоступен, чтение из БД: %s", error)
+        return await loader()
+    if raw is not None:
+        return int(raw)
+    value = await loader()
+    try:
+        await async_client.set(key, int(value), ex=ttl, nx=True)
+    except RedisError as error:
+        logger.warning("Не удалось сохранить %s в кэш: %s", key, error)
+    return value
+
+
+async def incr(key: str, amount: int):
+    """
+    Изменение счетчика counter на amount, если он есть в кэше
+    :param key: ключ счетчика
+    :param amount:
+    :return:
+    """
+    if not amount:
+        return
+    try:
+        await async_client.eval(INCR_IF_EXISTS, 1, CACHE_PREFIX + key, amount)
+    except RedisError as error:
+        logger.warning("Не удалось изменить счетчик %s: %s", key, error)
@@ -1,15 +1,14 @@
 from utils import users as users_utils
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from modeling.models import Users
+from sqlalchemy.ext.asyncio import AsyncSession
 from core.db import get_db
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login/")
 
 
-async def get_current_user_(access_token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user_(access_token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     """ Получение данных о пользователе по авторизационному токену"""
     user = await users_utils.get_user_by_token_(access_token, db)
     if not user:
@@ -25,7 +24,7 @@ async def get_current_user_(access_token: str = Depends(oauth2_scheme), db: Sess
     return user
 
 
-async def get_current_user(token, db: Session):
+async def get_current_user(token, db: AsyncSession):
     """ Получение информации о пользователе по токену в адресе """
     user = await users_utils.get_user_by_token(token, db)
     if not user:
@@ -37,7 +36,7 @@ async def get_current_user(token, db: Session):
     return user
 
 
-async def get_users(token, db: Session):
+async def get_users(token, db: AsyncSession):
     """ Получение информации о всех пользователях по токену в адресе """
     user = await users_utils.get_user_by_token(token, db)
     if not user:
@@ -50,11 +49,11 @@ async def get_users(token, db: Session):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
         )
-    db_users = db.query(Users).with_entities(Users.username, Users.name, Users.email, Users.is_active).all()
+    db_users = await users_utils.get_users(db)
     return db_users
 
 
-async def get_current_user_from_cookie(request: Request, db: Session = Depends(get_db)):
+async def get_current_user_from_cookie(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Получение пользователя по токену из cookie
     """
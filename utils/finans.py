@@ -0,0 +1,747 @@
+import os
+import threading
+import time
+from contextlib import closing, contextmanager
+from io import StringIO
+from queue import Queue, Full
+from threading import Event, Thread
+
+import numpy as np
+import pandas as pd
+
+from core import finans_db
+from utils.finans_settings import (EXPORT_FORMATS, FINANS_CHUNK_ROWS, FINANS_DELTA_WORK_MEM, FINANS_EXPORT_DIR,
+                                   QUERY_PAGE_LIMIT, XLSX_MAX_ROWS)
+
+
+def read_version(connection, version: str) -> pd.DataFrame:
+    """
+    Чтение данных версии: значения по годам вместе с узлами дерева
+    :param connection: соединение с БД финансов
+    :param version: версия (имя файла без точек)
+    :return: DataFrame с колонками year, finans, id, name, project, lavel, parent
+    """
+    return pd.read_sql('''select
+                            finans_data.year_data as year,
+                            finans_data.fin_data as finans,
+                            tree.id,
+                            tree.name,
+                            tree.project,
+                            tree.lavel,
+                            tree.parent
+                            from finans_data
+                            left join  tree_data as tree
+                            on finans_data.id_tree = tree.id
+                            where finans_data.version = %s
+                            order by finans_data.id
+                            ;
+                          ''', connection, params=(version,))
+
+
+def subtree_sums(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Суммы по поддереву каждого узла (сам узел и все его потомки) по годам.
+    Значения поднимаются по ссылкам parent уровень за уровнем, поэтому работа занимает
+    O(строк x глубина дерева) векторных операций при любой глубине дерева
+    :param df: DataFrame с колонками id, parent, year, finans
+    :return: DataFrame: индекс - id узла, колонки - годы
+    """
+    node_codes, node_ids = pd.factorize(df['id'])
+    year_codes, years = pd.factorize(df['year'])
+    # номер родителя для каждого узла, -1 у корней и у узлов с родителем вне версии
+    nodes = df.drop_duplicates('id')
+    parent_codes = node_ids.get_indexer(nodes['parent'])
+    parent_of = np.full(len(node_ids), -1)
+    parent_of[node_ids.get_indexer(nodes['id'])] = parent_codes
+
+    sums = np.zeros((len(node_ids), len(years)))
+    values = df['finans'].fillna(0).to_numpy()
+    level = node_codes
+    # защита от циклов в ссылках parent: глубина не больше числа узлов
+    for _ in range(len(node_ids) + 1):
+        if not len(level):
+            break
+        sums += np.bincount(level * len(years) + year_codes, weights=values,
+                            minlength=sums.size).reshape(sums.shape)
+        level = parent_of[level]
+        keep = level >= 0
+        level, year_codes, values = level[keep], year_codes[keep], values[keep]
+    return pd.DataFrame(sums, index=node_ids, columns=years)
+
+
+def rollup(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Свод по версии: для каждого кода сумма по его поддереву за каждый год
+    :param df: результат read_version
+    :return: DataFrame с колонками cod, project и годами в порядке появления в данных
+    """
+    nodes = df.drop_duplicates('id')
+    years = list(df['year'].unique())
+    wide = subtree_sums(df).reindex(index=nodes['id'], columns=years).fillna(0)
+    df_end = pd.DataFrame({'cod': nodes['name'].to_numpy(), 'project': nodes['project'].to_numpy()})
+    for year in years:
+        df_end[year] = wide[year].to_numpy()
+    return df_end
+
+
+CREATE_TABLES = '''DO $$
+                   BEGIN
+                   IF NOT EXISTS (SELECT 1 FROM pg_type WHERE TYPNAME = 'admin_level') THEN
+                   CREATE TYPE  admin_level AS ENUM ('lavel_1', 'lavel_2', 'lavel_3');
+                   END IF;
+                   END;
+                   $$;
+                   CREATE TABLE IF NOT EXISTS tree_data (
+                   id TEXT  PRIMARY KEY,
+                   name TEXT,
+                   project TEXT,
+                   lavel admin_level,
+                   parent TEXT REFERENCES tree_data(id),
+                   version varchar(10),
+                   sum_years float8
+                   );
+                   CREATE TABLE IF NOT EXISTS finans_data
+                         (ID SERIAL  PRIMARY KEY,
+                         year_data INT,
+                         fin_data float8,
+                         version varchar(10),
+                         id_tree TEXT,
+                         FOREIGN KEY (id_tree) REFERENCES tree_data (id) ON UPDATE CASCADE ON DELETE CASCADE
+                         );
+                   CREATE INDEX IF NOT EXISTS ix_tree_data_parent ON tree_data (parent);
+                   CREATE INDEX IF NOT EXISTS ix_finans_data_id_tree ON finans_data (id_tree);
+                   CREATE TABLE IF NOT EXISTS tree_rollup (
+                   id_tree TEXT REFERENCES tree_data (id) ON UPDATE CASCADE ON DELETE CASCADE,
+                   year_data INT,
+                   version varchar(10),
+                   total float8,
+                   pos INT,
+                   PRIMARY KEY (id_tree, year_data)
+                   );
+                   CREATE INDEX IF NOT EXISTS ix_tree_rollup_version ON tree_rollup (version, pos);
+                   CREATE INDEX IF NOT EXISTS ix_finans_data_version_year ON finans_data (version, year_data, id);
+                   CREATE INDEX IF NOT EXISTS ix_tree_data_project ON tree_data (project);
+                   CREATE INDEX IF NOT EXISTS ix_tree_data_name_pattern ON tree_data (name text_pattern_ops); '''
+
+
+def create_tables(connection):
+    """
+    Создание таблиц дерева и данных, если их еще нет
+    :param connection: соединение с БД финансов
+    :return:
+    """
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_TABLES)
+
+
+def file_version(filename: str) -> str:
+    """
+    Версия данных - имя файла без точек
+    :param filename:
+    :return:
+    """
+    return ''.join(str(filename).split('.'))
+
+
+def year_columns(df: pd.DataFrame) -> list:
+    """
+    Колонки файла с данными по годам (четыре цифры)
+    :param df:
+    :return:
+    """
+    return [col for col in df.columns if len(str(col)) == 4 and str(col).isdigit()]
+
+
+def build_tree(df: pd.DataFrame, version: str) -> pd.DataFrame:
+    """
+    Строки tree_data по файлу: id узла - версия и код без точек, родитель - код без последней части
+    :param df: DataFrame файла с колонками cod, project и годами
+    :param version:
+    :return: DataFrame с колонками id, name, project, lavel, parent, version
+    """
+    cod = df['cod'].astype(str)
+    parts = cod.str.count(r'\.') + 1
+    parent_cod = cod.str.rsplit('.', n=1).str[0]
+    tree = pd.DataFrame({
+        'id': version + cod.str.replace('.', '', regex=False),
+        'name': cod,
+        'project': df['project'],
+        'lavel': np.select([parts < 2, parts == 2], ['lavel_1', 'lavel_2'], 'lavel_3'),
+        'parent': (version + parent_cod.str.replace('.', '', regex=False)).where(parts > 1, None),
+        'version': version,
+    })
+    return tree
+
+
+def build_finans(df: pd.DataFrame, tree: pd.DataFrame, version: str) -> pd.DataFrame:
+    """
+    Строки finans_data по файлу: одна строка на узел и год, пропуски заменяются на 0
+    :param df: DataFrame файла с колонками cod, project и годами
+    :param tree: результат build_tree для того же df
+    :param version:
+    :return: DataFrame с колонками id_tree, year_data, fin_data, version
+    """
+    years = year_columns(df)
+    values = df[years].apply(pd.to_numeric, errors='coerce').fillna(0)
+    finans = pd.DataFrame({
+        'id_tree': np.repeat(tree['id'].to_numpy(), len(years)),
+        'year_data': np.tile(np.array(years, dtype=int), len(df)),
+        'fin_data': values.to_numpy().ravel(),
+        'version': version,
+    })
+    return finans
+
+
+def copy_frame(cursor, table: str, frame: pd.DataFrame):
+    """
+    Загрузка DataFrame в таблицу одной командой COPY
+    :param cursor:
+    :param table:
+    :param frame:
+    :return:
+    """
+    buffer = StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ', '.join(frame.columns)
+    cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def insert_tree(cursor, tree: pd.DataFrame):
+    """
+    Вставка узлов дерева пачкой через COPY во временную таблицу, уже существующие узлы пропускаются
+    :param cursor:
+    :param tree:
+    :return:
+    """
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS tree_stage (LIKE tree_data) ON COMMIT DELETE ROWS")
+    cursor.execute("TRUNCATE tree_stage")
+    copy_frame(cursor, 'tree_stage', tree[['id', 'name', 'project', 'lavel', 'parent', 'version']])
+    cursor.execute('''INSERT INTO tree_data (id, name, project, lavel, parent, version)
+                      SELECT id, name, project, lavel, parent, version FROM tree_stage
+                      ON CONFLICT (id) DO NOTHING''')
+
+
+def lock_version(cursor, version: str) -> bool:
+    """
+    Блокировка версии до конца транзакции, чтобы одновременные загрузки одного файла не пересекались.
+    Возвращает True, если данные этой версии уже есть
+    :param cursor:
+    :param version:
+    :return:
+    """
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (version,))
+    cursor.execute("SELECT 1 FROM finans_data WHERE version = %s LIMIT 1", (version,))
+    return cursor.fetchone() is not None
+
+
+def read_chunks(file, chunk_rows: int = FINANS_CHUNK_ROWS):
+    """
+    Потоковый разбор файла C-парсером pandas кусками по chunk_rows строк.
+    Код и проект читаются строками: иначе кусок из одних числовых кодов станет float ("1.10" -> 1.1),
+    а код "NA" - пропуском. Пустые значения годов превращаются в 0 в build_finans
+    :param file: файл или путь к файлу
+    :param chunk_rows:
+    :return: итератор DataFrame
+    """
+    return pd.read_csv(file, encoding='ISO-8859-1', sep=';', engine='c', chunksize=chunk_rows,
+                       dtype={'cod': str, 'project': str}, keep_default_na=False)
+
+
+def prefetch(chunks, depth: int = 1):
+    """
+    Чтение следующих кусков в отдельном потоке, пока текущий загружается в БД.
+    Очередь ограничена depth кусками, поэтому память не растет с размером файла
+    :param chunks: итератор кусков
+    :param depth: сколько кусков читать наперед
+    :return: итератор тех же кусков
+    """
+    done = object()
+    queue = Queue(maxsize=depth)
+    stop = Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(done)
+        except BaseException as error:
+            put(error)
+
+    thread = Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = queue.get()
+            if chunk is done:
+                return
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
+
+def stream_chunks(chunks, version: str, write) -> tuple:
+    """
+    Разбор кусков файла в строки дерева и значений, следующий кусок в это время читается из файла
+    :param chunks: итератор кусков файла
+    :param version:
+    :param write: функция write(tree, finans), куда передаются строки каждого куска
+    :return: число строк дерева, значений и кусков
+    """
+    tree_rows = finans_rows = chunk_count = 0
+    with closing(prefetch(iter(chunks))) as prefetched:
+        for df in prefetched:
+            tree = build_tree(df, version)
+            finans = build_finans(df, tree, version)
+            write(tree, finans)
+            tree_rows += len(tree)
+            finans_rows += len(finans)
+            chunk_count += 1
+    return tree_rows, finans_rows, chunk_count
+
+
+def apply_delta(cursor, version: str) -> dict:
+    """
+    Применение файла из временных таблиц tree_delta и finans_delta к загруженной версии:
+    меняются только узлы и значения, которые отличаются, удаляется то, чего нет в файле.
+    Коды без точек могут совпадать (1.11 и 11.1), поэтому значения сопоставляются по узлу, году
+    и порядковому номеру строки с таким узлом и годом, как они идут в файле и в БД
+    :param cursor:
+    :param version:
+    :return: число добавленных, измененных и удаленных строк
+    """
+    cursor.execute("SET LOCAL work_mem = %s", (FINANS_DELTA_WORK_MEM,))
+    cursor.execute("ANALYZE tree_delta")
+    cursor.execute("ANALYZE finans_delta")
+    cursor.execute('''INSERT INTO tree_data (id, name, project, lavel, parent, version)
+                      SELECT DISTINCT ON (id) id, name, project, lavel, parent, version FROM tree_delta ORDER BY id, n
+                      ON CONFLICT (id) DO UPDATE
+                      SET name = EXCLUDED.name, project = EXCLUDED.project, lavel = EXCLUDED.lavel,
+                          parent = EXCLUDED.parent, version = EXCLUDED.version
+                      WHERE (tree_data.name, tree_data.project, tree_data.lavel, tree_data.parent, tree_data.version)
+                            IS DISTINCT FROM
+                            (EXCLUDED.name, EXCLUDED.project, EXCLUDED.lavel, EXCLUDED.parent, EXCLUDED.version)''')
+    tree_changed = cursor.rowcount
+    cursor.execute('''CREATE TEMP TABLE finans_diff ON COMMIT DROP AS
+                      WITH old AS (
+                          SELECT id, id_tree, year_data, fin_data,
+                                 row_number() OVER (PARTITION BY id_tree, year_data ORDER BY id) AS rn
+                          FROM finans_data WHERE version = %s
+                      ), new AS (
+                          SELECT id_tree, year_data, fin_data, version,
+                                 row_number() OVER (PARTITION BY id_tree, year_data ORDER BY n) AS rn
+                          FROM finans_delta
+                      )
+                      SELECT old.id, new.id_tree, new.year_data, new.fin_data, new.version, rn
+                      FROM old FULL JOIN new USING (id_tree, year_data, rn)
+                      WHERE old.id IS NULL OR new.version IS NULL OR old.fin_data IS DISTINCT FROM new.fin_data''',
+                   (version,))
+    cursor.execute('''UPDATE finans_data f SET fin_data = d.fin_data FROM finans_diff d
+                      WHERE f.id = d.id AND d.version IS NOT NULL''')
+    cells_changed = cursor.rowcount
+    cursor.execute('''INSERT INTO finans_data (id_tree, year_data, fin_data, version)
+                      SELECT id_tree, year_data, fin_data, version FROM finans_diff
+                      WHERE id IS NULL ORDER BY id_tree, year_data, rn''')
+    cells_added = cursor.rowcount
+    cursor.execute("DELETE FROM finans_data f USING finans_diff d WHERE f.id = d.id AND d.version IS NULL")
+    cells_removed = cursor.rowcount
+    cursor.execute('''DELETE FROM tree_data t
+                      WHERE t.version = %s
+                      AND NOT EXISTS (SELECT 1 FROM tree_delta d WHERE d.id = t.id)''', (version,))
+    tree_removed = cursor.rowcount
+    return {"tree_changed": tree_changed, "tree_removed": tree_removed, "cells_added": cells_added,
+            "cells_changed": cells_changed, "cells_removed": cells_removed}
+
+
+def query_data(connection, version: str, project: str = None, lavel: str = None, cod: str = None,
+               year_from: int = None, year_to: int = None, rollup: bool = False,
+               limit: int = QUERY_PAGE_LIMIT, offset: int = 0) -> dict:
+    """
+    Значения версии с фильтрами на стороне БД: проект, уровень, код с потомками и диапазон лет.
+    Значения берутся из finans_data как в файле или, при rollup, суммы поддеревьев из tree_rollup
+    :param connection: соединение с БД финансов
+    :param version:
+    :param project: проект
+    :param lavel: уровень (lavel_1, lavel_2, lavel_3)
+    :param cod: код узла, выбираются он и его потомки
+    :param year_from: первый год
+    :param year_to: последний год
+    :param rollup: суммы поддеревьев вместо значений файла
+    :param limit:
+    :param offset:
+    :return: страница строк и смещение следующей страницы
+    """
+    if rollup:
+        source, order = "tree_rollup AS data", "data.pos, data.year_data"
+        value = "data.total"
+    else:
+        source, order = "finans_data AS data", "data.year_data, data.id"
+        value = "data.fin_data"
+    conditions = ["data.version = %(version)s"]
+    params = {"version": version, "limit": limit + 1, "offset": offset}
+    if project is not None:
+        conditions.append("tree.project = %(project)s")
+        params["project"] = project
+    if lavel is not None:
+        conditions.append("tree.lavel = %(lavel)s")
+        params["lavel"] = lavel
+    if cod is not None:
+        conditions.append("(tree.name = %(cod)s OR tree.name LIKE %(cod_children)s)")
+        params["cod"] = cod
+        params["cod_children"] = cod.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + ".%"
+    if year_from is not None:
+        conditions.append("data.year_data >= %(year_from)s")
+        params["year_from"] = year_from
+    if year_to is not None:
+        conditions.append("data.year_data <= %(year_to)s")
+        params["year_to"] = year_to
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(f'''SELECT tree.name, tree.project, tree.lavel, data.year_data, {value}
+                               FROM {source}
+                               JOIN tree_data AS tree ON tree.id = data.id_tree
+                               WHERE {" AND ".join(conditions)}
+                               ORDER BY {order}
+                               LIMIT %(limit)s OFFSET %(offset)s''', params)
+            rows = cursor.fetchall()
+    items = [{"cod": row[0], "project": row[1], "lavel": row[2], "year": row[3], "value": row[4]}
+             for row in rows[:limit]]
+    return {"version": version, "items": items, "limit": limit, "offset": offset,
+            "next_offset": offset + limit if len(rows) > limit else None}
+
+
+def materialize_rollup(connection, cursor, version: str) -> int:
+    """
+    Пересчет свода версии в tree_rollup (сумма поддерева узла по каждому году) и tree_data.sum_years
+    (сумма поддерева за все годы) в текущей транзакции. Записываются только изменившиеся строки,
+    поэтому после небольшой правки меняются только предки измененных узлов
+    :param connection: соединение с БД финансов
+    :param cursor: курсор той же транзакции
+    :param version:
+    :return: число строк свода
+    """
+    df = read_version(connection, version)
+    nodes = df.drop_duplicates('id')
+    sums = subtree_sums(df).reindex(nodes['id'])
+    frame = pd.DataFrame({
+        'id_tree': np.repeat(sums.index.to_numpy(), len(sums.columns)),
+        'year_data': np.tile(sums.columns.to_numpy(dtype=int), len(sums)),
+        'version': version,
+        'total': sums.to_numpy().ravel(),
+        'pos': np.repeat(np.arange(len(sums)), len(sums.columns)),
+    })
+    cursor.execute('''CREATE TEMP TABLE IF NOT EXISTS rollup_stage
+                      (id_tree TEXT, year_data INT, version varchar(10), total float8, pos INT)
+                      ON COMMIT DROP''')
+    copy_frame(cursor, 'rollup_stage', frame)
+    cursor.execute('''INSERT INTO tree_rollup (id_tree, year_data, version, total, pos)
+                      SELECT id_tree, year_data, version, total, pos FROM rollup_stage
+                      ON CONFLICT (id_tree, year_data) DO UPDATE
+                      SET version = EXCLUDED.version, total = EXCLUDED.total, pos = EXCLUDED.pos
+                      WHERE (tree_rollup.version, tree_rollup.total, tree_rollup.pos)
+                            IS DISTINCT FROM (EXCLUDED.version, EXCLUDED.total, EXCLUDED.pos)''')
+    cursor.execute('''DELETE FROM tree_rollup r
+                      WHERE r.version = %s
+                      AND NOT EXISTS (SELECT 1 FROM rollup_stage s WHERE s.id_tree = r.id_tree AND s.year_data = r.year_data)''',
+                   (version,))
+    cursor.execute('''UPDATE tree_data t SET sum_years = s.total
+                      FROM (SELECT id_tree, sum(total) AS total FROM rollup_stage GROUP BY id_tree) s
+                      WHERE t.id = s.id_tree AND t.sum_years IS DISTINCT FROM s.total''')
+    return len(frame)
+
+
+def read_rollup(connection, version: str) -> pd.DataFrame:
+    """
+    Свод по версии из tree_rollup одним запросом по индексу версии, без пересчета
+    :param connection: соединение с БД финансов
+    :param version:
+    :return: DataFrame с колонками cod, project и годами, как у rollup
+    """
+    df = pd.read_sql('''select
+                            rollup.pos,
+                            tree.name as cod,
+                            tree.project,
+                            rollup.year_data as year,
+                            rollup.total
+                            from tree_rollup as rollup
+                            join tree_data as tree
+                            on rollup.id_tree = tree.id
+                            where rollup.version = %s
+                            order by rollup.pos, rollup.year_data
+                            ;
+                         ''', connection, params=(version,))
+    wide = df.pivot(index='pos', columns='year', values='total')
+    nodes = df.drop_duplicates('pos').set_index('pos')
+    df_end = pd.DataFrame({'cod': nodes['cod'].to_numpy(), 'project': nodes['project'].to_numpy()})
+    for year in wide.columns:
+        df_end[year] = wide[year].to_numpy()
+    return df_end
+
+
+def rebuild_rollup(connection, version: str) -> dict:
+    """
+    Пересчет свода версии под блокировкой версии, например для версий, загруженных до появления tree_rollup
+    :param connection: соединение с БД финансов
+    :param version:
+    :return:
+    """
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (version,))
+            rows = materialize_rollup(connection, cursor, version)
+            invalidate_export(version)
+    return {"version": version, "rollup_rows": rows}
+
+
+def get_subtree(connection, version: str, cod: str, children: bool = False):
+    """
+    Суммы поддерева кода по годам и за все годы из материализованного свода
+    :param connection: соединение с БД финансов
+    :param version:
+    :param cod: код узла с точками
+    :param children: добавить суммы непосредственных потомков
+    :return: словарь или None, если узла нет
+    """
+    node_id = version + str(cod).replace('.', '')
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name, project, lavel, sum_years FROM tree_data WHERE id = %s", (node_id,))
+            node = cursor.fetchone()
+            if node is None:
+                return None
+            cursor.execute("SELECT year_data, total FROM tree_rollup WHERE id_tree = %s ORDER BY year_data",
+                           (node_id,))
+            subtree = {"cod": node[0], "project": node[1], "lavel": node[2], "total": node[3],
+                       "years": {year: total for year, total in cursor.fetchall()}}
+            if children:
+                cursor.execute('''SELECT name, project, lavel, sum_years FROM tree_data
+                                  WHERE parent = %s ORDER BY name''', (node_id,))
+                subtree["children"] = [{"cod": name, "project": project, "lavel": lavel, "total": total}
+                                       for name, project, lavel, total in cursor.fetchall()]
+    return subtree
+
+
+def load_version(connection, chunks, filename: str, delta: bool = False) -> dict:
+    """
+    Загрузка файла в одной транзакции: для каждого куска узлы дерева и значения по годам через COPY, следующий кусок в это время читается из файла.
+    Версия, которая уже загружена, пропускается, а в режиме delta сравнивается с файлом и меняется только в отличающихся ячейках.
+    Родительские коды должны идти в файле раньше дочерних
+    :param connection: соединение с БД финансов
+    :param chunks: итератор кусков файла (read_chunks) или список DataFrame
+    :param filename: имя файла, из него берется версия
+    :param delta: применить к загруженной версии только изменения
+    :return: статистика загрузки
+    """
+    start = time.perf_counter()
+    version = file_version(filename)
+    result = {"filename": str(filename), "version": version}
+    with connection:
+        with connection.cursor() as cursor:
+            loaded = lock_version(cursor, version)
+            if loaded and not delta:
+                return {**result, "loaded": False}
+            if loaded:
+                cursor.execute("CREATE TEMP TABLE tree_delta (LIKE tree_data, n SERIAL) ON COMMIT DROP")
+                cursor.execute('''CREATE TEMP TABLE finans_delta
+                                  (id_tree TEXT, year_data INT, fin_data float8, version varchar(10), n SERIAL)
+                                  ON COMMIT DROP''')
+
+                def write(tree, finans):
+                    copy_frame(cursor, 'tree_delta', tree[['id', 'name', 'project', 'lavel', 'parent', 'version']])
+                    copy_frame(cursor, 'finans_delta', finans)
+
+                tree_rows, finans_rows, chunk_count = stream_chunks(chunks, version, write)
+                changes = apply_delta(cursor, version)
+                result.update(mode="delta", **changes)
+                changed = any(changes.values())
+            else:
+                def write(tree, finans):
+                    insert_tree(cursor, tree)
+                    copy_frame(cursor, 'finans_data', finans)
+
+                tree_rows, finans_rows, chunk_count = stream_chunks(chunks, version, write)
+                # статистика для планировщика, чтобы следующие запросы по версии не строились по пустым таблицам
+                cursor.execute("ANALYZE tree_data")
+                cursor.execute("ANALYZE finans_data")
+                result.update(mode="full")
+                changed = True
+            if changed:
+                result.update(rollup_rows=materialize_rollup(connection, cursor, version))
+                invalidate_export(version)
+    seconds = time.perf_counter() - start
+    rows = tree_rows + finans_rows
+    return {**result, "loaded": True, "tree_rows": tree_rows, "finans_rows": finans_rows, "chunks": chunk_count,
+            "seconds": round(seconds, 3), "rows_per_sec": round(rows / seconds) if seconds else rows}
+
+
+_export_locks = {}
+_export_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _export_lock(version: str):
+    """
+    Блокировка расчета свода версии внутри процесса. Запись удаляется, когда блокировку никто не ждет,
+    поэтому словарь не растет с числом выгруженных версий
+    :param version:
+    :return:
+    """
+    with _export_locks_guard:
+        lock, waiters = _export_locks.get(version, (None, 0))
+        lock = lock or threading.Lock()
+        _export_locks[version] = (lock, waiters + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _export_locks_guard:
+            lock, waiters = _export_locks[version]
+            if waiters == 1:
+                del _export_locks[version]
+            else:
+                _export_locks[version] = (lock, waiters - 1)
+
+
+def export_path(version: str, fmt: str = "csv") -> str:
+    """
+    Путь к файлу свода версии в кэше выгрузок
+    :param version:
+    :param fmt: формат из EXPORT_FORMATS
+    :return:
+    """
+    return os.path.join(FINANS_EXPORT_DIR, f"{version}.{fmt}")
+
+
+def write_export(df: pd.DataFrame, path: str, fmt: str):
+    """
+    Запись свода в файл выбранного формата. Arrow IPC пишется без сжатия, чтобы файл можно было отображать в память
+    :param df: результат rollup
+    :param path:
+    :param fmt: формат из EXPORT_FORMATS
+    :return:
+    """
+    df = df.set_axis([str(col) for col in df.columns], axis=1)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    elif fmt == "parquet":
+        df.to_parquet(path, index=False)
+    elif fmt == "arrow":
+        df.to_feather(path, compression="uncompressed")
+    elif fmt == "xlsx":
+        if len(df) > XLSX_MAX_ROWS:
+            raise ValueError(f"Too many rows for xlsx: {len(df)}")
+        df.to_excel(path, index=False, engine="openpyxl")
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+
+def export_version(version: str, fmt: str = "csv") -> str:
+    """
+    Свод по версии из кэша выгрузок, при промахе считается и сохраняется один раз.
+    Расчет идет под разделяемой блокировкой версии, поэтому он не пересекается с загрузкой той же версии,
+    а файл записывается атомарно через переименование
+    :param version:
+    :param fmt: формат из EXPORT_FORMATS
+    :return: путь к файлу свода
+    """
+    path = export_path(version, fmt)
+    if os.path.exists(path):
+        return path
+    with _export_lock(version):
+        if os.path.exists(path):
+            return path
+        with finans_db.connection() as connection:
+            with connection:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_xact_lock_shared(hashtext(%s))", (version,))
+                df_end = read_rollup(connection, version)
+                if df_end.empty:
+                    # версия загружена до появления tree_rollup
+                    df_end = rollup(read_version(connection, version))
+                os.makedirs(FINANS_EXPORT_DIR, exist_ok=True)
+                tmp_path = os.path.join(FINANS_EXPORT_DIR, f".{version}.{os.getpid()}.{threading.get_ident()}.{fmt}")
+                try:
+                    write_export(df_end, tmp_path, fmt)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+    return path
+
+
+def invalidate_export(version: str):
+    """
+    Удаление свода версии из кэша выгрузок
+    :param version:
+    :return:
+    """
+    for fmt in EXPORT_FORMATS:
+        try:
+            os.remove(export_path(version, fmt))
+        except FileNotFoundError:
+            pass
+
+
+def open_export(version: str, fmt: str = "csv", attempts: int = 3) -> tuple:
+    """
+    Открытый файл свода версии, его размер и ETag по времени изменения и размеру. Открытый файл читается,
+    даже если загрузка версии удалит его из кэша выгрузок, а если файл удален между расчетом и открытием,
+    свод считается заново
+    :param version:
+    :param fmt: формат из EXPORT_FORMATS
+    :param attempts: сколько раз пересчитывать свод, удаленный до открытия
+    :return: файл, размер, ETag
+    """
+    for _ in range(attempts):
+        try:
+            file = open(export_version(version, fmt), "rb")
+        except FileNotFoundError:
+            continue
+        stat = os.fstat(file.fileno())
+        return file, stat.st_size, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    raise RuntimeError(f"Export of {version} was removed {attempts} times while opening")
+
+
+def ingest_file(path: str, filename: str, delta: bool = False) -> dict:
+    """
+    Задача загрузки для пула процессов: файл уже сохранен на диск, соединение с БД свое у процесса.
+    Файл удаляется после загрузки
+    :param path: путь к сохраненному файлу
+    :param filename: исходное имя файла, из него берется версия
+    :param delta: применить к загруженной версии только изменения
+    :return: статистика загрузки
+    """
+    try:
+        with finans_db.connection() as connection:
+            create_tables(connection)
+            return load_version(connection, read_chunks(path), filename, delta)
+    finally:
+        os.remove(path)
+
+
+def export_file(name_file: str, fmt: str = "csv") -> dict:
+    """
+    Задача выгрузки свода по версии для пула процессов: свод считается в кэш выгрузок, а отдается по версии
+    и формату, путь к файлу в результат не попадает - он есть только на сервере, выполнившем задачу
+    :param name_file: имя загруженного файла
+    :param fmt: формат из EXPORT_FORMATS
+    :return:
+    """
+    version = file_version(name_file)
+    export_version(version, fmt)
+    return {"filename": name_file, "version": version, "format": fmt}
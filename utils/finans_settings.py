@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+# настройки utils.finans отдельно от него: роутер финансов использует их при импорте,
+# а сам utils.finans с pandas и numpy загружается при первом обращении
+
+# размер куска при потоковом разборе загружаемого файла, строк
+FINANS_CHUNK_ROWS = int(os.environ.get("FINANS_CHUNK_ROWS", 10000))
+# память под сортировки при сравнении файла с загруженной версией
+FINANS_DELTA_WORK_MEM = os.environ.get("FINANS_DELTA_WORK_MEM", "256MB")
+# каталог кэша выгрузок свода по версиям
+FINANS_EXPORT_DIR = os.environ.get("FINANS_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "finans_exports"))
+# форматы выгрузки свода и их тип содержимого
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+# размер страницы запроса данных по умолчанию и максимальный
+QUERY_PAGE_LIMIT = 100
+QUERY_PAGE_LIMIT_MAX = 1000
+# ограничение строк листа xlsx (с учетом заголовка)
+XLSX_MAX_ROWS = 1048575
@@ -0,0 +1,193 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from uuid import uuid4
+
+from fastapi import HTTPException, status
+from psycopg2.extras import Json
+
+from core import finans_db
+
+# число процессов для фоновых задач, каталог для файлов задач и время хранения завершенных задач в секундах
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", os.cpu_count() or 1))
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(tempfile.gettempdir(), "finans_jobs"))
+JOBS_TTL = float(os.environ.get("JOBS_TTL", 3600))
+
+
+# реестр задач в БД финансов, общий для всех процессов приложения
+CREATE_JOBS = '''CREATE TABLE IF NOT EXISTS jobs (
+                 id varchar(32) PRIMARY KEY,
+                 kind varchar(20),
+                 status varchar(10),
+                 created float8,
+                 finished float8,
+                 result jsonb,
+                 error TEXT
+                 );
+                 CREATE INDEX IF NOT EXISTS ix_jobs_finished ON jobs (finished); '''
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """ Фоновая задача из реестра: вид, состояние, время создания/завершения и результат """
+
+    def __init__(self, job_id: str, kind: str, status: str, created: float, finished: float = None, result=None,
+                 error: str = None):
+        self.id = job_id
+        self.kind = kind
+        self.status = status
+        self.created = created
+        self.finished = finished
+        self.result = result
+        self.error = error
+
+    def info(self) -> dict:
+        """ Состояние задачи для ответа API """
+        info = {"id": self.id, "kind": self.kind, "status": self.status, "created": self.created,
+                "finished": self.finished}
+        if self.status == "failed":
+            info["error"] = self.error
+        return info
+
+
+_executor = None
+_table_created = False
+
+
+def executor() -> ProcessPoolExecutor:
+    """
+    Пул процессов создается при первой задаче. Процессы запускаются через spawn,
+    чтобы не наследовать от приложения цикл событий и соединения с БД
+    :return:
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=JOBS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def job_path(suffix: str = "") -> str:
+    """
+    Новый путь для файла задачи в JOBS_DIR
+    :param suffix:
+    :return:
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    return os.path.join(JOBS_DIR, uuid4().hex + suffix)
+
+
+def submit(kind: str, func, *args) -> Job:
+    """
+    Постановка функции в пул процессов с записью в реестр задач. Функция и аргументы должны сериализоваться pickle
+    :param kind: вид задачи (upload, export)
+    :param func: функция уровня модуля
+    :param args:
+    :return:
+    """
+    job = Job(uuid4().hex, kind, "queued", time.time())
+    try:
+        with finans_db.connection() as connection:
+            with connection:
+                with connection.cursor() as cursor:
+                    _create_table(cursor)
+                    cursor.execute("DELETE FROM jobs WHERE finished < %s", (job.created - JOBS_TTL,))
+                    cursor.execute("INSERT INTO jobs (id, kind, status, created) VALUES (%s, %s, %s, %s)",
+                                   (job.id, job.kind, job.status, job.created))
+    except finans_db.UNAVAILABLE as error:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Finance database unavailable") from error
+    future = executor().submit(_run, job.id, func, *args)
+    future.add_done_callback(partial(_done, job.id))
+    return job
+
+
+def get_job(job_id: str):
+    """
+    Задача по id или None. Задачу можно запросить у любого процесса приложения, а не только у поставившего ее
+    :param job_id:
+    :return:
+    """
+    try:
+        with finans_db.connection() as connection:
+            with connection:
+                with connection.cursor() as cursor:
+                    _create_table(cursor)
+                    cursor.execute("SELECT id, kind, status, created, finished, result, error FROM jobs WHERE id = %s",
+                                   (job_id,))
+                    row = cursor.fetchone()
+    except finans_db.UNAVAILABLE as error:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Finance database unavailable") from error
+    return Job(*row) if row is not None else None
+
+
+def shutdown():
+    """
+    Остановка пула процессов, задачи в очереди отменяются
+    :return:
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _create_table(cursor):
+    global _table_created
+    if not _table_created:
+        cursor.execute(CREATE_JOBS)
+        _table_created = True
+
+
+def _finish(job_id: str, state: str, result=None, error: str = None, pending_only: bool = False):
+    """
+    Запись состояния задачи в реестр
+    :param job_id:
+    :param state: running, done, failed
+    :param result: результат задачи, сериализуемый в JSON
+    :param error:
+    :param pending_only: менять только задачу, которая еще не завершилась
+    :return:
+    """
+    finished = time.time() if state in ("done", "failed") else None
+    condition = " AND status IN ('queued', 'running')" if pending_only else ""
+    with finans_db.connection() as connection:
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f"UPDATE jobs SET status = %s, finished = %s, result = %s, error = %s "
+                               f"WHERE id = %s{condition}",
+                               (state, finished, Json(result) if result is not None else None, error, job_id))
+
+
+def _run(job_id: str, func, *args):
+    """
+    Выполнение задачи в процессе пула: состояние и результат пишутся в реестр самим процессом
+    :param job_id:
+    :param func:
+    :param args:
+    :return:
+    """
+    _finish(job_id, "running")
+    try:
+        result = func(*args)
+    except Exception as error:
+        _finish(job_id, "failed", error=repr(error))
+        raise
+    _finish(job_id, "done", result=result)
+    return result
+
+
+def _done(job_id: str, future):
+    # задача отменена при остановке или процесс пула упал - _run не успел записать итог
+    if not future.cancelled() and future.exception() is None:
+        return
+    error = "cancelled" if future.cancelled() else repr(future.exception())
+    try:
+        _finish(job_id, "failed", error=error, pending_only=True)
+    except Exception:
+        logger.exception("Не удалось записать состояние задачи %s", job_id)
@@ -0,0 +1,17 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Модуль, который импортируется при первом обращении к его атрибуту. Повторный импорт
+    берет модуль из sys.modules, одновременный первый импорт из разных потоков защищен блокировкой импорта
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
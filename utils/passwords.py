@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+
+# число потоков хеширования, сколько хеширований выполняется одновременно
+# и сколько запросов может ждать своей очереди (0 - без ограничения)
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", os.cpu_count() or 1))
+PASSWORD_CONCURRENCY = int(os.environ.get("PASSWORD_CONCURRENCY", PASSWORD_WORKERS))
+PASSWORD_QUEUE_MAX = int(os.environ.get("PASSWORD_QUEUE_MAX", 256))
+PASSWORD_ITERATIONS = 100_000
+
+
+def pbkdf2(password: str, salt: str) -> str:
+    """ PBKDF2-SHA256 пароля с солью в hex """
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), PASSWORD_ITERATIONS).hex()
+
+
+class PasswordHasher:
+    """
+    Хеширование паролей в отдельном пуле потоков, чтобы не блокировать цикл событий.
+    hashlib.pbkdf2_hmac отпускает GIL, поэтому потоки загружают все ядра.
+    Число одновременных хеширований ограничено семафором, длина очереди - PASSWORD_QUEUE_MAX
+    """
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, concurrency: int = PASSWORD_CONCURRENCY,
+                 queue_max: int = PASSWORD_QUEUE_MAX):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.running = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.seconds = 0.0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._executor = None
+
+    async def hash(self, password: str, salt: str) -> str:
+        """
+        Хеш пароля с солью, вычисляется в пуле потоков
+        :param password:
+        :param salt:
+        :return:
+        """
+        if self.queue_max and self.waiting >= self.queue_max:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many authentication requests, try later")
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            return await loop.run_in_executor(self._get_executor(), pbkdf2, password, salt)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.seconds += loop.time() - started
+            self._semaphore.release()
+
+    async def validate(self, password: str, hashed_password: str) -> bool:
+        """
+        Проверяет, что хеш пароля совпадает с хешем из БД вида salt$hash
+        :param password:
+        :param hashed_password:
+        :return:
+        """
+        salt, hashed = hashed_password.split("$")
+        return hmac.compare_digest(await self.hash(password, salt), hashed)
+
+    def stats(self) -> dict:
+        """ Очередь и счетчики хеширования """
+        return {"workers": self.workers, "running": self.running, "waiting": self.waiting,
+                "max_waiting": self.max_waiting, "completed": self.completed, "rejected": self.rejected,
+                "seconds": round(self.seconds, 3)}
+
+    def shutdown(self):
+        """ Остановка пула потоков """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        return self._executor
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,80 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# размер кэша токенов и время жизни записи в секундах
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", 60))
+
+
+class TokenCache:
+    """
+    LRU кэш токен -> пользователь с ограничением по времени жизни и сроку действия токена.
+    clock (монотонные часы для времени жизни) и now (время для срока действия) подменяются в тестах
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL, clock=time.monotonic,
+                 now=datetime.now):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.now = now
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._by_user = {}
+
+    def get(self, token: str):
+        """ Возвращает пользователя по токену или None, если записи нет или она устарела """
+        entry = self._data.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, deadline, expires = entry
+        if deadline < self.clock() or (expires is not None and expires <= self.now()):
+            self.invalidate(token)
+            self.misses += 1
+            return None
+        self._data.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def set(self, token: str, user, expires: datetime = None):
+        """ Сохраняет пользователя по токену, expires - срок действия токена из TokensTable """
+        self.invalidate(token)
+        self._data[token] = (user, self.clock() + self.ttl, expires)
+        self._by_user.setdefault(user.id, set()).add(token)
+        while len(self._data) > self.maxsize:
+            old_token, (old_user, _, _) = self._data.popitem(last=False)
+            self._forget(old_token, old_user.id)
+
+    def invalidate(self, token: str):
+        """ Удаляет токен из кэша (выход пользователя) """
+        entry = self._data.pop(token, None)
+        if entry is not None:
+            self._forget(token, entry[0].id)
+
+    def invalidate_user(self, user_id):
+        """ Удаляет все токены пользователя (изменение активности пользователя) """
+        for token in self._by_user.pop(user_id, set()):
+            self._data.pop(token, None)
+
+    def clear(self):
+        """ Полная очистка кэша """
+        self._data.clear()
+        self._by_user.clear()
+
+    def stats(self) -> dict:
+        """ Счетчики попаданий и промахов """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+    def _forget(self, token: str, user_id):
+        tokens = self._by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[user_id]
+
+
+token_cache = TokenCache()
@@ -1,12 +1,14 @@
-import hashlib
 import random
 import string
 from datetime import datetime, timedelta
 from fastapi import Response
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import uuid4
 from modeling.models import Users, TokensTable
 import shemas as user_schema
+from utils.token_cache import token_cache
+from utils.passwords import password_hasher
 
 
 def get_random_string(length=12):
@@ -14,85 +16,88 @@ def get_random_string(length=12):
     return "".join(random.choice(string.ascii_letters) for _ in range(length))
 
 
-def hash_password(password: str, salt: str = None):
-    """ Хеширует пароль с солью """
+async def hash_password_async(password: str, salt: str = None):
+    """ Хеширует пароль с солью в пуле потоков, не блокируя цикл событий """
     if salt is None:
         salt = get_random_string()
-    enc = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), 100_000)
-    return enc.hex()
+    return await password_hasher.hash(password, salt)
 
 
-def validate_password(password: str, hashed_password: str):
-    """ Проверяет, что хеш пароля совпадает с хешем из БД """
-    salt, hashed = hashed_password.split("$")
-    return hash_password(password, salt) == hashed
+async def validate_password_async(password: str, hashed_password: str):
+    """ Проверяет хеш пароля в пуле потоков, не блокируя цикл событий """
+    return await password_hasher.validate(password, hashed_password)
 
 
-async def get_user_by_email(email: str, db: Session):
+async def get_user_by_email(email: str, db: AsyncSession):
     """ Возвращает информацию о пользователе по email """
-    db_user = db.query(Users).filter(Users.email == email).first()
+    result = await db.execute(select(Users).filter(Users.email == email))
+    db_user = result.scalars().first()
     return db_user
 
 
-async def check_user_by_email(email: str, username: str, db: Session):
+async def check_user_by_email(email: str, username: str, db: AsyncSession):
     """ проверяет есть  ли такие email и username уже в БД """
-    db_email = db.query(Users).filter(Users.email == email).first()
-    db_username = db.query(Users).filter(Users.username == username).first()
-    if db_email or db_username:
+    result = await db.execute(select(Users.id).filter((Users.email == email) | (Users.username == username)))
+    if result.first():
         return True
     return False
 
 
-async def make_user_is_active(email: str, db: Session):
+async def make_user_is_active(email: str, db: AsyncSession):
     """ Устанавливает, что пользователь активный """
-    db_user = db.query(Users).filter(Users.email == email).first()
+    db_user = await get_user_by_email(email, db)
     db_user.is_active = True
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    token_cache.invalidate_user(db_user.id)
     return True
 
 
-async def get_user_by_token(token: str, db: Session):
+async def get_user_by_token(token: str, db: AsyncSession):
     """ Возвращает информацию о владельце указанного токена """
-    db_user = db.query(TokensTable, Users).with_entities(Users.username, Users.name, Users.email,
-                                                         Users.is_active).filter(
-        TokensTable.token == token, TokensTable.expires > datetime.now()).filter(TokensTable.user == Users.id).first()
+    db_user = await get_user_by_token_(token, db)
     return db_user
 
 
-async def get_user_by_token_(token: str, db: Session):
-    """ Возвращает информацию о владельце указанного токена другие поля """
-    db_user = db.query(Users, TokensTable).with_entities(Users.id, Users.username, Users.name, Users.email,
-                                                         Users.is_active).filter(
-                                                            TokensTable.token == token,
-                                                            TokensTable.expires > datetime.now()
-                                                            ).filter(
-        TokensTable.user == Users.id).first()
+async def get_user_by_token_(token: str, db: AsyncSession):
+    """ Возвращает информацию о владельце указанного токена другие поля, сначала ищет в кэше токенов """
+    db_user = token_cache.get(token)
+    if db_user is not None:
+        return db_user
+    result = await db.execute(select(Users.id, Users.username, Users.name, Users.email, Users.is_active,
+                                     TokensTable.expires).filter(
+        TokensTable.token == token,
+        TokensTable.expires > datetime.now()
+    ).filter(TokensTable.user == Users.id))
+    db_user = result.first()
+    if db_user:
+        token_cache.set(token, db_user, db_user.expires)
     return db_user
 
 
-async def create_user_token(user_id: str, db: Session):
+async def create_user_token(user_id: str, db: AsyncSession):
     """ Создает токен для пользователя с указанным user_id """
-    user_token = db.query(TokensTable).filter(TokensTable.user == user_id).first()
+    result = await db.execute(select(TokensTable).filter(TokensTable.user == user_id))
+    user_token = result.scalars().first()
     if user_token and user_token.expires > datetime.now():
         new_token = user_token
     else:
         new_token = TokensTable(expires=(datetime.now() + timedelta(weeks=2)), user=user_id, token=uuid4().hex)
         db.add(new_token)
-        db.commit()
-        db.refresh(new_token)
+        await db.commit()
+        await db.refresh(new_token)
     token_dict = {"token": str(new_token.token), "expires": new_token.expires}
     return token_dict
 
 
-async def create_user(user: user_schema.UserCreate, db: Session):
+async def create_user(user: user_schema.UserCreate, db: AsyncSession):
     """ Создает нового пользователя в БД """
     salt = get_random_string()
-    hashed_password = hash_password(user.password, salt)
+    hashed_password = await hash_password_async(user.password, salt)
     new_user = Users(email=user.email, name=user.name, password=f"{salt}${hashed_password}", username=user.username)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     user_id = new_user.id
     token = await create_user_token(user_id, db)
     token_dict = {"token": token['token'], "expires": token['expires']}
@@ -109,16 +114,18 @@ async def create_cookie(response: Response, token_user):
     return response
 
 
-async def set_user_is_active(email: str, db: Session):
+async def set_user_is_active(email: str, db: AsyncSession):
     """ При логине установка активация пользователя """
-    db_user = db.query(Users).filter(Users.email == email).first()
+    db_user = await get_user_by_email(email, db)
     db_user.is_active = True
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    token_cache.invalidate_user(db_user.id)
     return
 
 
-async def get_users(db: Session):
+async def get_users(db: AsyncSession):
     """ Получение информации о всех пользователях """
-    db_users = db.query(Users).with_entities(Users.username, Users.name, Users.email, Users.is_active).all()
+    result = await db.execute(select(Users.username, Users.name, Users.email, Users.is_active))
+    db_users = result.all()
     return db_users